@@ -16,16 +16,99 @@ if not os.path.exists(STATIC_FOLDER):
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# 各角色单次上传的大小上限（字节），超过时返回 413；MAX_CONTENT_LENGTH 是所有请求的上限
+app.config['UPLOAD_LIMITS'] = {
+    'student': 10 * 1024 * 1024,
+    'teacher': 20 * 1024 * 1024,
+    'admin': 20 * 1024 * 1024,
+}
+app.config['MAX_CONTENT_LENGTH'] = 21 * 1024 * 1024
+# 生成缩略图的进程数（0 表示不生成）和缩略图宽度；需要安装 Pillow
+app.config['THUMBNAIL_WORKERS'] = 2
+app.config['THUMBNAIL_WIDTHS'] = [320, 1024]
+# 上传文件的浏览器缓存时间（秒）；文件按内容命名，内容不会改变
+app.config['UPLOAD_CACHE_MAX_AGE'] = 365 * 24 * 60 * 60
+# 由前端代理发送上传文件：None（由 Flask 发送）、'x-sendfile'（Apache/lighttpd）
+# 或 'x-accel-redirect'（nginx，文件通过 UPLOAD_ACCEL_PREFIX 对应的 internal location 发送）
+app.config['UPLOAD_SENDFILE'] = None
+app.config['UPLOAD_ACCEL_PREFIX'] = '/protected-uploads/'
 print(f"UPLOAD_FOLDER配置为: {UPLOAD_FOLDER}")
+# 数据库连接池大小和获取连接的超时时间（秒）
+app.config['DATABASE'] = 'todo_school.db'
+app.config['DB_POOL_SIZE'] = 5
+app.config['DB_POOL_TIMEOUT'] = 30
+# 存储配置：'concurrent'（WAL，推荐）或 'default'（SQLite 默认的回滚日志），
+# DB_PRAGMAS 可以单独覆盖某个 PRAGMA，例如 {'cache_size': -64000}
+app.config['DB_PROFILE'] = 'concurrent'
+app.config['DB_PRAGMAS'] = {}
+# 自动清理未引用上传文件的间隔（秒），0 表示不自动清理；只清理超过宽限期（秒）的文件
+app.config['UPLOAD_GC_INTERVAL'] = 0
+app.config['UPLOAD_GC_GRACE'] = 24 * 60 * 60
+# 执行后台任务（导入学生、重置系统等）的线程数
+app.config['JOB_WORKERS'] = 1
+# 缓存后端：'memory'（进程内，单进程部署）、'sqlite'（同一台机器的多个工作进程共用 CACHE_SQLITE_PATH）
+# 或 'redis'（CACHE_REDIS_URL，多台机器共用）
+app.config['CACHE_BACKEND'] = 'memory'
+app.config['CACHE_MEMORY_SIZE'] = 4096
+app.config['CACHE_SQLITE_PATH'] = 'cache.db'
+app.config['CACHE_REDIS_URL'] = 'redis://localhost:6379/0'
+# 各缓存的过期时间（秒）：用户身份、班级作业列表（布置作业后立即失效）、后台首页和数据看板
+app.config['CACHE_TTLS'] = {
+    'identity': 300,
+    'assignments': 60,
+    'dashboard': 10,
+}
+# 报表查询（数据看板、作业分析）使用定期刷新的数据库快照，不与提交作业的写入争用主数据库；
+# 快照最多延迟 ANALYTICS_MAX_STALENESS 秒，ANALYTICS_SNAPSHOT_INTERVAL 为后台刷新的间隔（秒，0 表示只在查询时刷新）
+app.config['ANALYTICS_SNAPSHOT'] = False
+app.config['ANALYTICS_SNAPSHOT_PATH'] = 'todo_school.snapshot.db'
+app.config['ANALYTICS_MAX_STALENESS'] = 300
+app.config['ANALYTICS_SNAPSHOT_INTERVAL'] = 0
+
+# 请求性能统计：Server-Timing 响应头和 /admin/perf 页面；PERF_WINDOW 是每个路由保留的最近请求数，
+# PERF_PROFILE_RATE 是用 cProfile 分析的请求比例（0 表示不分析），耗时超过 PERF_SLOW_MS 毫秒的保存分析结果
+app.config['PERF_ENABLED'] = True
+app.config['PERF_SERVER_TIMING'] = True
+app.config['PERF_WINDOW'] = 500
+app.config['PERF_SLOW_MS'] = 500
+app.config['PERF_PROFILE_RATE'] = 0
+
+# 监控指标 /metrics：多个工作进程时各进程每 METRICS_FLUSH_INTERVAL 秒把数据写入 METRICS_PATH 汇总
+# （None 表示单进程，只输出本进程的数据）；设置 METRICS_TOKEN 后 /metrics 需要 Bearer 令牌，
+# 否则只允许 METRICS_ALLOW 中的地址直接访问（为空时拒绝所有请求，经过反向代理的请求需要令牌）
+app.config['METRICS_PATH'] = None
+app.config['METRICS_FLUSH_INTERVAL'] = 5
+app.config['METRICS_TOKEN'] = None
+app.config['METRICS_ALLOW'] = ['127.0.0.1', '::1']
+
+# 慢查询日志：执行加读取结果超过 SLOW_QUERY_MS 毫秒的 SQL 和查询计划写入 SLOW_QUERY_LOG（None 或 0 表示不记录），
+# 日志超过 SLOW_QUERY_LOG_BYTES 字节时轮转，保留 SLOW_QUERY_LOG_BACKUPS 个旧文件
+app.config['SLOW_QUERY_MS'] = 100
+app.config['SLOW_QUERY_LOG'] = 'slow_queries.log'
+app.config['SLOW_QUERY_LOG_BYTES'] = 1024 * 1024
+app.config['SLOW_QUERY_LOG_BACKUPS'] = 5
+
+from app.utils import db, cache, snapshot, profiling, metrics, slow_queries
+slow_queries.init_app(app)
+profiling.init_app(app)
+metrics.init_app(app)
+db.init_app(app)
+cache.init_app(app)
+snapshot.init_app(app)
 
 # 导入蓝图
 from app.admin import admin_bp
 from app.teacher import teacher_bp
 from app.student import student_bp
 from app.main import main_bp
+from app.api import api_bp
 
 # 注册蓝图
 app.register_blueprint(admin_bp, url_prefix='/admin')
 app.register_blueprint(teacher_bp, url_prefix='/teacher')
 app.register_blueprint(student_bp, url_prefix='/student')
 app.register_blueprint(main_bp, url_prefix='/')
+app.register_blueprint(api_bp, url_prefix='/api/v1')
+
+# 注册命令行工具
+from app import commands
@@ -1,53 +1,32 @@
-from flask import render_template, request, redirect, url_for, session, flash
-import csv
+from flask import render_template, request, redirect, url_for, session, flash, current_app, abort, jsonify
+import os
+import tempfile
 from app.admin import admin_bp
-from app.utils.db import DatabaseConnection
-from app.main.routes import login_required, hash_password
+from app.utils.db import DatabaseConnection, get_pool, reset_db
+from app.utils.importer import import_students as import_students_csv
+from app.utils.cache import cache_stats, clear_cache
+from app.utils.dashboard import get_admin_dashboard, get_overview_dashboard
+from app.utils.profiling import HISTOGRAM_BUCKETS, reset_stats, route_stats, slow_profiles
+from app.utils.slow_queries import read_log, slow_query_enabled, slow_query_report
+from app.utils.snapshot import remove_snapshot
+from app.utils.identity import invalidate_identity
+from app.utils.pagination import list_students, page_args
+from app.utils.jobs import job_handler, submit_job, get_job, list_jobs
+from app.utils.uploads import backfill_attachments
+from app.utils.cleanup import collect_garbage
+from app.utils.thumbnails import generate_missing_thumbnails
+from app.utils.stats import get_stat, rebuild_stats
+from app.main.routes import login_required, hash_password, upload_limit
 from datetime import datetime
 
 # 管理员后台
 @admin_bp.route('/dashboard')
 @login_required('admin')
 def dashboard():
-    with DatabaseConnection() as c:
-        # 获取总学生数
-        c.execute("SELECT COUNT(*) FROM users WHERE role = 'student'")
-        total_students = c.fetchone()[0]
-        
-        # 获取总作业数
-        c.execute("SELECT COUNT(*) FROM assignments")
-        total_assignments = c.fetchone()[0]
-        
-        # 获取总提交数
-        c.execute("SELECT COUNT(*) FROM submissions")
-        total_submissions = c.fetchone()[0]
-        
-        # 计算总提交率
-        total_completion_rate = (total_submissions / (total_students * total_assignments) * 100) if total_students * total_assignments > 0 else 0
-        
-        # 获取今日日期
-        today = datetime.now().strftime('%Y-%m-%d')
-        
-        # 获取今日提交数
-        c.execute("SELECT COUNT(*) FROM submissions WHERE DATE(submitted_at) = ?", (today,))
-        today_submissions = c.fetchone()[0]
-        
-        # 获取今日应提交作业数（今日截止的作业数 * 学生数）
-        c.execute("SELECT COUNT(*) FROM assignments WHERE deadline = ?", (today,))
-        today_assignments = c.fetchone()[0]
-        today_expected_submissions = today_assignments * total_students
-        
-        # 计算今日提交率
-        today_completion_rate = (today_submissions / today_expected_submissions * 100) if today_expected_submissions > 0 else 0
-    
-    return render_template('admin_dashboard.html', 
-                           total_students=total_students,
-                           total_assignments=total_assignments,
-                           total_submissions=total_submissions,
-                           total_completion_rate=total_completion_rate,
-                           today_submissions=today_submissions,
-                           today_expected_submissions=today_expected_submissions,
-                           today_completion_rate=today_completion_rate)
+    # 获取今日日期
+    today = datetime.now().strftime('%Y-%m-%d')
+    context = get_admin_dashboard(today)
+    return render_template('admin_dashboard.html', **context)
 
 # 添加教师
 @admin_bp.route('/add_teacher', methods=['GET', 'POST'])
@@ -85,6 +64,7 @@ def add_student():
 # 通过CSV添加学生
 @admin_bp.route('/import_students', methods=['GET', 'POST'])
 @login_required('admin')
+@upload_limit('admin')
 def import_students():
     if request.method == 'POST':
         if 'file' not in request.files:
@@ -97,21 +77,13 @@ def import_students():
             return redirect(request.url)
         
         if file:
-            # 读取CSV文件
-            csv_reader = csv.reader(file.stream.read().decode('utf-8').splitlines())
-            
-            with DatabaseConnection() as c:
-                for row in csv_reader:
-                    if len(row) >= 4:
-                        name = row[0].strip()
-                        class_id = row[1].strip()
-                        group_id = row[2].strip()
-                        id_card_last8 = row[3].strip()
-                        
-                        c.execute("INSERT INTO users (name, class_id, group_id, id_card_last8, role) VALUES (?, ?, ?, ?, 'student')", (name, class_id, group_id, id_card_last8))
-            
-            flash('学生导入成功')
-            return redirect(url_for('admin.dashboard'))
+            # 先保存到临时文件，在后台任务中逐块读取并批量导入
+            fd, path = tempfile.mkstemp(suffix='.csv')
+            os.close(fd)
+            file.save(path)
+            job_id = submit_job(current_app._get_current_object(), 'import_students', {'path': path}, created_by=session['user_id'])
+            flash('已开始导入学生')
+            return redirect(url_for('admin.job_status', job_id=job_id))
     return render_template('import_students.html')
 
 # 管理员查看所有学生
@@ -119,9 +91,14 @@ def import_students():
 @login_required('admin')
 def view_students():
     with DatabaseConnection() as c:
-        c.execute("SELECT * FROM users WHERE role = 'student' ORDER BY class_id, name, id_card_last8")
-        students = c.fetchall()
-    return render_template('admin_view_students.html', students=students)
+        listing = list_students(c,
+                                class_id=request.args.get('class_id', '').strip() or None,
+                                group_id=request.args.get('group_id', type=int),
+                                name_prefix=request.args.get('name', '').strip() or None,
+                                sort=request.args.get('sort', 'class'),
+                                descending=request.args.get('order') == 'desc',
+                                **page_args(request.args))
+    return render_template('admin_view_students.html', students=listing.items, listing=listing)
 
 # 管理员查看所有教师
 @admin_bp.route('/view_teachers')
@@ -136,95 +113,19 @@ def view_teachers():
 @admin_bp.route('/view_dashboard')
 @login_required('admin')
 def view_dashboard():
-    with DatabaseConnection() as c:
-        # 获取总学生数
-        c.execute("SELECT COUNT(*) FROM users WHERE role = 'student'")
-        total_students = c.fetchone()[0]
-        
-        # 获取总教师数
-        c.execute("SELECT COUNT(*) FROM users WHERE role = 'teacher'")
-        total_teachers = c.fetchone()[0]
-        
-        # 获取总作业数
-        c.execute("SELECT COUNT(*) FROM assignments")
-        total_assignments = c.fetchone()[0]
-        
-        # 获取总提交数
-        c.execute("SELECT COUNT(*) FROM submissions")
-        total_submissions = c.fetchone()[0]
-        
-        # 获取学生信息
-        c.execute("SELECT * FROM users WHERE role = 'student' ORDER BY class_id, name, id_card_last8")
-        students = c.fetchall()
-        
-        # 获取教师信息
-        c.execute("SELECT * FROM users WHERE role = 'teacher' ORDER BY class_id, name")
-        teachers = c.fetchall()
-        
-        # 获取作业信息
-        c.execute("SELECT * FROM assignments ORDER BY deadline DESC")
-        assignments = c.fetchall()
-        
-        # 计算每个作业的提交率
-        assignment_data = []
-        for assignment in assignments:
-            assignment_id = assignment[0]
-            c.execute("SELECT COUNT(*) FROM submissions WHERE assignment_id = ?", (assignment_id,))
-            submission_count = c.fetchone()[0]
-            completion_rate = (submission_count / total_students * 100) if total_students > 0 else 0
-            assignment_data.append({
-                'id': assignment_id,
-                'title': assignment[3],
-                'assigned_date': assignment[7],
-                'due_date': assignment[6],
-                'completion_rate': completion_rate
-            })
-        
-        # 获取提交时间数据
-        c.execute("SELECT DATE(submitted_at) as date, COUNT(*) as count FROM submissions GROUP BY DATE(submitted_at) ORDER BY date")
-        submission_stats = c.fetchall()
-        submission_dates = [stat[0] for stat in submission_stats]
-        submission_counts = [stat[1] for stat in submission_stats]
-        
-        # 获取班级提交数
-        c.execute("SELECT u.class_id, COUNT(*) as count FROM submissions s JOIN users u ON s.student_id = u.id GROUP BY u.class_id ORDER BY u.class_id")
-        class_stats = c.fetchall()
-        class_names = [stat[0] for stat in class_stats]
-        class_submission_counts = [stat[1] for stat in class_stats]
-    
-    return render_template('admin_view_dashboard.html', 
-                           total_students=total_students,
-                           total_teachers=total_teachers,
-                           total_assignments=total_assignments,
-                           total_submissions=total_submissions,
-                           students=students,
-                           teachers=teachers,
-                           assignments=assignment_data,
-                           submission_dates=submission_dates,
-                           submission_counts=submission_counts,
-                           class_names=class_names,
-                           class_submission_counts=class_submission_counts)
+    page = max(request.args.get('page', 1, type=int), 1)
+    context = get_overview_dashboard(page)
+    return render_template('admin_view_dashboard.html', **context)
 
 # 重置系统
 @admin_bp.route('/reset_system', methods=['GET', 'POST'])
 @login_required('admin')
 def reset_system():
     if request.method == 'POST':
-        # 重置数据库
-        from app.utils.db import reset_db
-        reset_db()
-        
-        # 清理上传文件
-        import os
-        upload_folder = 'uploads'
-        if os.path.exists(upload_folder):
-            for file in os.listdir(upload_folder):
-                file_path = os.path.join(upload_folder, file)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-        
-        flash('系统重置成功')
-        return redirect(url_for('admin.dashboard'))
+        # 重置数据库、清理上传文件在后台任务中执行
+        job_id = submit_job(current_app._get_current_object(), 'reset_system', created_by=session['user_id'])
+        flash('已开始重置系统')
+        return redirect(url_for('admin.job_status', job_id=job_id))
     return render_template('reset_system.html')
 
 # 查看作业详情
@@ -241,12 +142,10 @@ def assignment_detail(assignment_id):
             return redirect(url_for('admin.dashboard'))
         
         # 获取提交数
-        c.execute("SELECT COUNT(*) FROM submissions WHERE assignment_id = ?", (assignment_id,))
-        submission_count = c.fetchone()[0]
+        submission_count = get_stat(c, 'assignment', assignment_id, 'submissions')
         
         # 获取班级学生数
-        c.execute("SELECT COUNT(*) FROM users WHERE class_id = ? AND role = 'student'", (assignment[2],))
-        total_students = c.fetchone()[0]
+        total_students = get_stat(c, 'class', assignment[2], 'students')
         
         # 计算提交率
         completion_rate = (submission_count / total_students * 100) if total_students > 0 else 0
@@ -268,3 +167,140 @@ def assignment_detail(assignment_id):
                            submission_count=submission_count,
                            total_students=total_students,
                            completion_rate=completion_rate)
+
+# 后台任务
+JOB_NAMES = {
+    'import_students': '导入学生',
+    'reset_system': '重置系统',
+    'rebuild_stats': '重新计算统计表',
+    'backfill_attachments': '补充附件记录',
+    'generate_thumbnails': '生成缩略图',
+    'gc_uploads': '清理未引用的上传文件',
+}
+# 可以在任务页面直接执行的维护任务
+MAINTENANCE_JOBS = ['rebuild_stats', 'backfill_attachments', 'generate_thumbnails', 'gc_uploads']
+
+
+# 管理员和教师导入学生共用；教师导入时 class_id 为教师的班级
+@job_handler('import_students')
+def import_students_job(job, path, class_id=None):
+    try:
+        with open(path, 'rb') as f, DatabaseConnection() as c:
+            report = import_students_csv(c, f, class_id=class_id,
+                                         progress=lambda line: job.set_progress(line, message=f'已读取 {line} 行'))
+    finally:
+        os.remove(path)
+    # 更新了学生的小组
+    if report['updated']:
+        invalidate_identity()
+    return report
+
+
+@job_handler('reset_system')
+def reset_system_job(job):
+    # 重置数据库
+    job.set_progress(0, message='重置数据库')
+    reset_db()
+    clear_cache()
+    remove_snapshot()
+    
+    # 清理上传文件
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    removed = 0
+    if os.path.exists(upload_folder):
+        files = os.listdir(upload_folder)
+        for i, file in enumerate(files):
+            file_path = os.path.join(upload_folder, file)
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+                removed += 1
+            job.set_progress(i + 1, len(files), '清理上传文件')
+    return {'removed_files': removed}
+
+
+@job_handler('rebuild_stats')
+def rebuild_stats_job(job):
+    with DatabaseConnection() as c:
+        rebuild_stats(c)
+    return {}
+
+
+@job_handler('backfill_attachments')
+def backfill_attachments_job(job):
+    with DatabaseConnection() as c:
+        added, missing = backfill_attachments(c, current_app.config['UPLOAD_FOLDER'])
+    return {'added': added, 'missing': missing}
+
+
+@job_handler('generate_thumbnails')
+def generate_thumbnails_job(job):
+    with DatabaseConnection() as c:
+        return {'images': generate_missing_thumbnails(c, current_app.config['UPLOAD_FOLDER'], current_app.config['THUMBNAIL_WIDTHS'])}
+
+
+@job_handler('gc_uploads')
+def gc_uploads_job(job):
+    with DatabaseConnection() as c:
+        report = collect_garbage(c, current_app.config['UPLOAD_FOLDER'], current_app.config['UPLOAD_GC_GRACE'])
+    return {'deleted': report['deleted'], 'freed_bytes': report['freed_bytes'], 'errors': len(report['errors'])}
+
+
+# 任务列表，可以执行维护任务
+@admin_bp.route('/jobs', methods=['GET', 'POST'])
+@login_required('admin')
+def jobs():
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        if kind not in MAINTENANCE_JOBS:
+            flash('未知的任务')
+            return redirect(url_for('admin.jobs'))
+        job_id = submit_job(current_app._get_current_object(), kind, created_by=session['user_id'])
+        flash(f'已开始{JOB_NAMES[kind]}')
+        return redirect(url_for('admin.job_status', job_id=job_id))
+    
+    with DatabaseConnection() as c:
+        recent_jobs = list_jobs(c)
+    return render_template('admin_jobs.html', jobs=recent_jobs, job_names=JOB_NAMES, maintenance_jobs=MAINTENANCE_JOBS)
+
+# 任务状态，页面通过 Accept: application/json 轮询
+@admin_bp.route('/jobs/<job_id>')
+@login_required('admin')
+def job_status(job_id):
+    with DatabaseConnection() as c:
+        job = get_job(c, job_id)
+    if job is None:
+        abort(404)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job)
+    return render_template('admin_job.html', job=job, job_names=JOB_NAMES)
+
+# 性能统计：各路由最近请求的耗时分位数、SQL 次数、连接池和缓存命中率
+@admin_bp.route('/perf', methods=['GET', 'POST'])
+@login_required('admin')
+def perf():
+    if request.method == 'POST':
+        reset_stats()
+        flash('性能统计已清空')
+        return redirect(url_for('admin.perf'))
+    data = {
+        'routes': route_stats(),
+        'pool': get_pool().stats(),
+        'cache': cache_stats(),
+        'slow_profiles': slow_profiles(),
+    }
+    if request.accept_mimetypes.best == 'application/json':
+        data['routes'] = dict(data['routes'])
+        data['histogram_buckets'] = HISTOGRAM_BUCKETS
+        return jsonify(data)
+    return render_template('admin_perf.html', buckets=HISTOGRAM_BUCKETS, **data)
+
+# 慢查询报告：按规范化后的语句分组，显示次数、耗时、来自哪些路由和查询计划
+@admin_bp.route('/slow_queries')
+@login_required('admin')
+def slow_queries():
+    report = slow_query_report(read_log())
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'enabled': slow_query_enabled(), 'threshold_ms': current_app.config.get('SLOW_QUERY_MS'),
+                        'queries': report})
+    return render_template('admin_slow_queries.html', queries=report, enabled=slow_query_enabled(),
+                           threshold_ms=current_app.config.get('SLOW_QUERY_MS'))
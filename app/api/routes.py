@@ -0,0 +1,147 @@
+from flask import request, g, jsonify, current_app
+import hashlib
+import json
+from functools import wraps
+from app.api import api_bp
+from app.utils.db import DatabaseConnection
+from app.utils.assignment_cache import get_class_assignments
+from app.utils.pagination import list_assignments, list_submissions, page_args
+from app.utils.stats import get_stats
+from app.utils.dashboard import get_admin_dashboard, get_teacher_dashboard
+from app.main.routes import LoginError, check_login
+from datetime import datetime
+
+# JSON 接口 /api/v1
+# 供前端按需加载后台首页、作业列表、提交列表和统计数据，使用与页面相同的登录会话；
+# 所有接口支持 fields 参数只返回需要的字段（如 ?fields=id,title），
+# 响应带 ETag，浏览器用 If-None-Match 重新请求时，数据没有变化返回 304
+
+ASSIGNMENT_FIELDS = ['id', 'teacher_id', 'class_id', 'title', 'content', 'file_path', 'deadline', 'created_at']
+SUBMISSION_FIELDS = ['id', 'assignment_id', 'student_id', 'content', 'file_path', 'submitted_at', 'score', 'scorer_id',
+                     'student_name', 'attachment', 'thumbnail', 'thumbnail_webp']
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@api_bp.errorhandler(APIError)
+def handle_api_error(e):
+    return jsonify({'error': e.message}), e.status
+
+
+# 蓝图的 404 错误处理不处理不存在的地址，用一个兜底的路由返回 JSON
+@api_bp.route('/<path:path>')
+def not_found(path):
+    raise APIError(404, '接口不存在')
+
+
+# 登录检查，与页面的 login_required 相同，但返回 401/403 而不是跳转到登录页
+def api_login_required(*roles):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                check_login(roles)
+            except LoginError as e:
+                raise APIError(e.status, e.message or '未登录')
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# 按 fields 参数筛选字段；没有 fields 参数时返回全部字段
+def select_fields(item):
+    fields = request.args.get('fields')
+    if not fields:
+        return item
+    wanted = {field.strip() for field in fields.split(',') if field.strip()}
+    return {key: value for key, value in item.items() if key in wanted}
+
+
+# 返回 JSON，带 ETag 并处理条件请求；private, no-cache 表示浏览器可以缓存但每次都要验证
+def json_response(data):
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(hashlib.sha1(body.encode()).hexdigest())
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# 列表响应：{'items': [...], 'next': 游标, 'prev': 游标}
+def listing_response(listing, fields):
+    return json_response({
+        'items': [select_fields(dict(zip(fields, row))) for row in listing.items],
+        'next': listing.next_cursor,
+        'prev': listing.prev_cursor,
+    })
+
+
+# 后台首页数据：管理员为全校，教师为本班
+@api_bp.route('/dashboard')
+@api_login_required('admin', 'teacher')
+def dashboard():
+    today = datetime.now().strftime('%Y-%m-%d')
+    if g.role == 'admin':
+        context = get_admin_dashboard(today)
+    else:
+        context = get_teacher_dashboard(g.identity.class_id, today)
+    return json_response(select_fields(context))
+
+
+# 统计数据：管理员为全校总数、每日提交数和各班提交数，教师为本班
+@api_bp.route('/stats')
+@api_login_required('admin', 'teacher')
+def stats():
+    with DatabaseConnection() as c:
+        if g.role == 'admin':
+            data = {'totals': get_stats(c, 'total', '')}
+            c.execute("SELECT scope_key, value FROM stats WHERE scope = 'day' AND metric = 'submissions' AND value > 0 ORDER BY scope_key")
+            data['daily_submissions'] = dict(c.fetchall())
+            c.execute("SELECT scope_key, value FROM stats WHERE scope = 'class' AND metric = 'submissions' AND value > 0 ORDER BY scope_key")
+            data['class_submissions'] = dict(c.fetchall())
+        else:
+            class_id = g.identity.class_id
+            data = {'totals': get_stats(c, 'class', class_id)}
+            c.execute("SELECT metric, value FROM stats WHERE scope = 'class_day' AND scope_key = ? AND value > 0 ORDER BY metric", (class_id,))
+            data['daily_submissions'] = dict(c.fetchall())
+    return json_response(select_fields(data))
+
+
+# 作业列表：教师分页查询本班作业（参数同作业列表页面），学生返回本班全部作业
+@api_bp.route('/assignments')
+@api_login_required('teacher', 'student')
+def assignments():
+    class_id = g.identity.class_id
+    if g.role == 'student':
+        rows = get_class_assignments(class_id)
+        return json_response({'items': [select_fields(dict(zip(ASSIGNMENT_FIELDS, row))) for row in rows]})
+    with DatabaseConnection() as c:
+        listing = list_assignments(c, class_id,
+                                   title_prefix=request.args.get('title', '').strip() or None,
+                                   sort=request.args.get('sort', 'created'),
+                                   descending=request.args.get('order', 'desc') == 'desc',
+                                   **page_args(request.args))
+    return listing_response(listing, ASSIGNMENT_FIELDS)
+
+
+# 作业的提交列表（参数同提交列表页面），教师只能查看本班的作业
+@api_bp.route('/assignments/<int:assignment_id>/submissions')
+@api_login_required('admin', 'teacher')
+def submissions(assignment_id):
+    with DatabaseConnection() as c:
+        c.execute("SELECT class_id FROM assignments WHERE id = ?", (assignment_id,))
+        assignment = c.fetchone()
+        if assignment is None or (g.role == 'teacher' and assignment[0] != g.identity.class_id):
+            raise APIError(404, '作业不存在')
+        listing = list_submissions(c, assignment_id,
+                                   group_id=request.args.get('group_id', type=int),
+                                   name_prefix=request.args.get('name', '').strip() or None,
+                                   sort=request.args.get('sort', 'submitted'),
+                                   descending=request.args.get('order') == 'desc',
+                                   **page_args(request.args))
+    return listing_response(listing, SUBMISSION_FIELDS)
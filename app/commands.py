@@ -0,0 +1,82 @@
+import click
+from datetime import datetime
+from app import app
+from app.utils.db import DatabaseConnection, init_db
+from app.utils.stats import check_stats, rebuild_stats
+from app.utils.uploads import backfill_attachments
+from app.utils.migrations import inline_submission_text, remove_text_files
+from app.utils.cleanup import collect_garbage
+from app.utils.thumbnails import generate_missing_thumbnails
+from app.utils.snapshot import refresh_snapshot
+
+# 命令行工具，使用方式：flask --app app <命令>
+
+# 重新计算统计表
+@app.cli.command('rebuild-stats')
+@click.option('--check', is_flag=True, help='只检查统计表是否与原始数据一致，不修改')
+def rebuild_stats_command(check):
+    init_db()
+    with DatabaseConnection() as c:
+        if check:
+            differences = check_stats(c)
+            for (scope, scope_key, metric), actual, expected in differences:
+                click.echo(f"{scope}/{scope_key}/{metric}: 统计表 {actual}，实际 {expected}")
+            click.echo(f"共 {len(differences)} 处不一致")
+            if differences:
+                raise SystemExit(1)
+        else:
+            rebuild_stats(c)
+            click.echo('统计表已重新计算')
+
+# 扫描上传目录，为旧的上传文件补充附件记录
+@app.cli.command('backfill-attachments')
+def backfill_attachments_command():
+    init_db()
+    with DatabaseConnection() as c:
+        added, missing = backfill_attachments(c, app.config['UPLOAD_FOLDER'])
+    click.echo(f"补充附件记录 {added} 条，找不到文件 {missing} 个")
+
+# 把迁移时找不到文本文件、仍然保存 uuid 的提交文本写入数据库
+@app.cli.command('inline-submission-text')
+def inline_submission_text_command():
+    init_db()
+    with DatabaseConnection() as c:
+        inlined, missing, text_files = inline_submission_text(c, app.config['UPLOAD_FOLDER'])
+    remove_text_files(text_files)
+    click.echo(f"写入提交文本 {inlined} 条，找不到文本文件 {missing} 条")
+    if missing:
+        raise SystemExit(1)
+
+# 清理上传目录中未被引用的文件
+@app.cli.command('gc-uploads')
+@click.option('--dry-run', is_flag=True, help='只列出要删除的文件，不删除')
+@click.option('--grace', type=int, default=None, help='只清理修改时间早于多少秒之前的文件')
+@click.option('--limit', type=int, default=None, help='本次最多处理的文件数')
+def gc_uploads_command(dry_run, grace, limit):
+    init_db()
+    if grace is None:
+        grace = app.config['UPLOAD_GC_GRACE']
+    with DatabaseConnection() as c:
+        report = collect_garbage(c, app.config['UPLOAD_FOLDER'], grace, dry_run=dry_run, limit=limit)
+    for name, size in report['orphaned']:
+        click.echo(f"{'未引用' if dry_run else '已删除'} {name} ({size} 字节)")
+    for name, error in report['errors']:
+        click.echo(f"删除失败 {name}: {error}")
+    click.echo(f"扫描 {report['scanned']} 个文件，被引用 {report['referenced']} 个，"
+               f"宽限期内 {report['too_new']} 个，未引用 {len(report['orphaned'])} 个，"
+               f"删除 {report['deleted']} 个，释放 {report['freed_bytes']} 字节")
+
+# 为已有的图片生成缩略图
+@app.cli.command('generate-thumbnails')
+def generate_thumbnails_command():
+    init_db()
+    with DatabaseConnection() as c:
+        count = generate_missing_thumbnails(c, app.config['UPLOAD_FOLDER'], app.config['THUMBNAIL_WIDTHS'])
+    click.echo(f"生成缩略图 {count} 张图片")
+
+# 刷新报表使用的数据库快照，可以用 cron 定时执行
+@app.cli.command('refresh-snapshot')
+def refresh_snapshot_command():
+    init_db()
+    refreshed_at = refresh_snapshot(app.config['ANALYTICS_SNAPSHOT_PATH'])
+    click.echo(f"数据库快照已刷新：{datetime.fromtimestamp(refreshed_at):%Y-%m-%d %H:%M:%S}")
@@ -1,24 +1,75 @@
-from flask import render_template, request, redirect, url_for, session, flash, send_from_directory
+from flask import render_template, request, redirect, url_for, session, flash, abort, current_app, g, jsonify
 import hashlib
+import hmac
 import os
 from functools import wraps
+from urllib.parse import quote
+from werkzeug.utils import send_from_directory
 from app.main import main_bp
 from app.utils.db import DatabaseConnection
+from app.utils.grading import GradingError, apply_scores, scores_from_form, scores_from_json
+from app.utils.identity import Identity, get_identity, remember_identity
+from app.utils.profiling import record_io
+from app.utils import metrics
+from app.utils.uploads import get_file_sha256, get_submission_attachment
 
 # 配置
 ADMIN_USERNAME = 'admin'
 ADMIN_PASSWORD = 'admin123'
 
-# 登录装饰器
+# 身份检查不通过：status 为 401（未登录或用户不存在）或 403（权限不足）
+class LoginError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+# 检查当前会话的身份，通过时返回角色并放在 g.role；roles 为空时只要求已登录。
+# 管理员没有用户记录，只检查会话；教师和学生的身份从缓存读取，放在 g.identity
+def check_login(roles=()):
+    if 'user_id' not in session:
+        raise LoginError(401)
+    current_role = session.get('role')
+    if current_role != 'admin':
+        identity = get_identity(session['user_id'])
+        if identity is None:
+            session.clear()
+            raise LoginError(401, '用户不存在，请重新登录')
+        g.identity = identity
+        current_role = identity.role
+    if roles and current_role not in roles:
+        raise LoginError(403, '权限不足')
+    g.role = current_role
+    return current_role
+
+# 登录装饰器，未登录时跳转到登录页
 def login_required(role=None):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if 'user_id' not in session:
-                return redirect(url_for('main.login'))
-            if role and session.get('role') != role:
-                flash('权限不足')
-                return redirect(url_for('main.index'))
+            try:
+                check_login((role,) if role else ())
+            except LoginError as e:
+                if e.message:
+                    flash(e.message)
+                return redirect(url_for('main.login' if e.status == 401 else 'main.index'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+# 上传大小限制装饰器
+# 在读取表单之前把请求的大小上限设为该角色的限制：Content-Length 超过限制时直接返回 413，
+# 没有 Content-Length（分块传输）时 Werkzeug 在接收过程中超过限制就返回 413，不会接收完整个请求
+def upload_limit(role):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limit = current_app.config['UPLOAD_LIMITS'].get(role)
+            if request.method == 'POST':
+                if limit:
+                    request.max_content_length = limit
+                # 先接收完上传的内容，再在视图中打开数据库连接，慢速上传不会占用连接池中的连接
+                request.files
             return f(*args, **kwargs)
         return decorated_function
     return decorator
@@ -36,6 +87,7 @@ def login():
             session['user_id'] = 0
             session['name'] = name
             session['role'] = 'admin'
+            metrics.LOGIN_ATTEMPTS.inc(role='admin', result='success')
             return redirect(url_for('admin.dashboard'))
         
         # 教师和学生登录
@@ -48,6 +100,8 @@ def login():
                 session['name'] = teacher[1]
                 session['role'] = 'teacher'
                 session['class_id'] = teacher[2]
+                remember_identity(Identity(teacher[0], teacher[1], 'teacher', teacher[2], teacher[3], bool(teacher[7])))
+                metrics.LOGIN_ATTEMPTS.inc(role='teacher', result='success')
                 return redirect(url_for('teacher.dashboard'))
             
             # 学生登录
@@ -59,8 +113,11 @@ def login():
                 session['role'] = 'student'
                 session['class_id'] = student[2]
                 session['group_id'] = student[3]
+                remember_identity(Identity(student[0], student[1], 'student', student[2], student[3], bool(student[7])))
+                metrics.LOGIN_ATTEMPTS.inc(role='student', result='success')
                 return redirect(url_for('student.dashboard'))
         
+        metrics.LOGIN_ATTEMPTS.inc(role='unknown', result='failure')
         flash('登录失败，请检查输入信息')
     return render_template('login.html')
 
@@ -84,6 +141,11 @@ def index():
 
 from flask import current_app
 
+# 上传文件过大
+@main_bp.app_errorhandler(413)
+def request_entity_too_large(error):
+    return '上传的文件过大，请压缩后重新上传', 413
+
 # 查看提交详情
 @main_bp.route('/view_submission/<int:submission_id>')
 def view_submission(submission_id):
@@ -96,45 +158,101 @@ def view_submission(submission_id):
         c.execute("SELECT content FROM assignments WHERE id = ?", (assignment_id,))
         assignment = c.fetchone()
         assignment_content = assignment[0] if assignment else None
+        
+        # 从附件表获取图片文件名
+        image_file = get_submission_attachment(c, submission_id)
+        
+        # 图片的缩略图，页面显示缩小的图片，点击后打开原图
+        c.execute("SELECT v.variant, v.stored_name FROM attachments t JOIN image_variants v ON v.sha256 = t.sha256 WHERE t.submission_id = ?", (submission_id,))
+        image_variants = dict(c.fetchall())
     
-    # 读取文本文件内容
-    content = ''
-    if submission[4]:
-        # 使用current_app获取应用配置中的UPLOAD_FOLDER
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        text_file_path = os.path.join(upload_folder, f"{submission[4]}.txt")
-        try:
-            # 使用上下文管理器确保文件正确关闭
-            with open(text_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except Exception as e:
-            # 记录错误但不影响用户体验
-            print(f"读取文本文件错误: {e}")
-            pass
-    
-    # 查找对应的图片文件
-    image_file = None
-    if submission[5]:
-        # 使用current_app获取应用配置中的UPLOAD_FOLDER
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        # 查找所有可能的图片扩展名
-        image_extensions = ['jpg', 'jpeg', 'png', 'gif']
-        for ext in image_extensions:
-            image_path = os.path.join(upload_folder, f"{submission[5]}.{ext}")
-            if os.path.exists(image_path):
-                image_file = f"{submission[5]}.{ext}"
-                break
+    # 提交的文本内容保存在数据库中
+    content = submission[3] or ''
     
-    return render_template('view_submission_detail.html', submission=submission, content=content, image_file=image_file, assignment_content=assignment_content)
+    return render_template('view_submission_detail.html', submission=submission, content=content, image_file=image_file, image_variants=image_variants, assignment_content=assignment_content)
 
 # 静态文件服务
+# 上传文件按内容命名，同一个文件名的内容不会改变，浏览器可以长期缓存；
+# 仍然提供 ETag/Last-Modified（304）和 Range 请求，UPLOAD_SENDFILE 可以交给前端代理发送文件
 @main_bp.route('/uploads/<path:filename>')
 def download_file(filename):
     # 防止路径遍历攻击
     safe_filename = os.path.basename(filename)
+    # 文件内容不会改变，用内容的 sha256 作为强 ETag
+    with DatabaseConnection() as c:
+        sha256 = get_file_sha256(c, safe_filename)
+    
+    sendfile = current_app.config.get('UPLOAD_SENDFILE')
+    environ = request.environ
+    if sendfile:
+        # 由代理处理 Range 请求，这里只处理 304
+        environ = dict(environ)
+        environ.pop('HTTP_RANGE', None)
     # 使用current_app获取应用配置中的UPLOAD_FOLDER
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], safe_filename, as_attachment=False)
+    response = send_from_directory(current_app.config['UPLOAD_FOLDER'], safe_filename, environ,
+                                   use_x_sendfile=bool(sendfile), etag=sha256 or True,
+                                   max_age=current_app.config['UPLOAD_CACHE_MAX_AGE'],
+                                   response_class=current_app.response_class, conditional=True)
+    if response.cache_control.max_age:
+        response.cache_control.immutable = True
+    if not sendfile and response.status_code in (200, 206):
+        record_io(read=response.content_length or 0)
+    
+    # nginx 使用 X-Accel-Redirect，文件需要配置为 internal 的 location
+    if sendfile == 'x-accel-redirect' and 'X-Sendfile' in response.headers:
+        del response.headers['X-Sendfile']
+        prefix = current_app.config['UPLOAD_ACCEL_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(safe_filename)}"
+    return response
+
+# 监控指标（Prometheus 文本格式）
+# 设置了 METRICS_TOKEN 时需要 "Authorization: Bearer <token>"；否则只允许 METRICS_ALLOW 中的地址直接访问，
+# 经过反向代理的请求（带 X-Forwarded-For，且没有用 ProxyFix 还原客户端地址）的 remote_addr 是代理的地址，一律拒绝
+def metrics_allowed():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        scheme, _, credential = request.headers.get('Authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(credential.strip().encode(), token.encode())
+    if 'X-Forwarded-For' in request.headers and 'werkzeug.proxy_fix.orig' not in request.environ:
+        return False
+    return request.remote_addr in (current_app.config.get('METRICS_ALLOW', metrics.DEFAULT_ALLOW) or ())
+
+@main_bp.route('/metrics')
+def prometheus_metrics():
+    if not metrics_allowed():
+        abort(403)
+    body = metrics.render(metrics.aggregated_samples())
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 # 工具函数
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
+
+# 保存评分并返回结果，教师和组长的评分接口共用
+# JSON 请求返回评分有变化的提交，表单请求提示结果后返回原页面
+def save_scores(scores, class_id, group_id=None):
+    with DatabaseConnection() as c:
+        report = apply_scores(c, scores, session['user_id'], class_id, group_id)
+    if request.is_json:
+        return jsonify({
+            'updated': [{'id': submission_id, 'score': score} for submission_id, score in report['updated']],
+            'unchanged': report['unchanged'],
+            'rejected': [{'id': submission_id, 'reason': reason} for submission_id, reason in report['rejected']],
+        })
+    if report['rejected']:
+        flash(f"保存评分 {len(report['updated'])} 条，{len(report['rejected'])} 条未保存：{report['rejected'][0][1]}")
+    else:
+        flash('评分成功')
+    return redirect(request.referrer or url_for('main.index'))
+
+# 从批量评分请求（表单或 JSON）中读取评分，格式不正确时返回错误响应
+def read_scores():
+    try:
+        if request.is_json:
+            return scores_from_json(request.get_json(silent=True)), None
+        return scores_from_form(request.form), None
+    except GradingError as e:
+        if request.is_json:
+            return None, (jsonify({'error': str(e)}), 400)
+        flash(str(e))
+        return None, redirect(request.referrer or url_for('main.index'))
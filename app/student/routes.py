@@ -1,9 +1,11 @@
-from flask import render_template, request, redirect, url_for, session, flash, current_app
-import os
-import uuid
+from flask import render_template, request, redirect, url_for, session, flash, current_app, g, abort
 from app.student import student_bp
 from app.utils.db import DatabaseConnection
-from app.main.routes import login_required
+from app.utils.assignment_cache import get_class_assignments
+from app.utils.uploads import UploadError, UploadTooLarge, get_submission_attachment, record_attachment, store_upload
+from app.utils.thumbnails import enqueue_thumbnails, get_variants
+from app.utils.metrics import SUBMISSIONS, UPLOAD_BYTES, UPLOADS
+from app.main.routes import login_required, upload_limit, read_scores, save_scores
 from datetime import datetime
 
 # 允许的图片扩展名
@@ -16,14 +18,18 @@ def allowed_file(filename):
 @student_bp.route('/dashboard')
 @login_required('student')
 def dashboard():
+    # 班级的作业列表从缓存读取，本人的提交情况单独查询
+    assignments = get_class_assignments(session['class_id'])
     with DatabaseConnection() as c:
-        c.execute("SELECT * FROM assignments WHERE class_id = ? ORDER BY created_at DESC", (session['class_id'],))
-        assignments = c.fetchall()
-    return render_template('student_dashboard.html', assignments=assignments)
+        c.execute("SELECT assignment_id, score FROM submissions WHERE student_id = ?", (session['user_id'],))
+        submitted = dict(c.fetchall())
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return render_template('student_dashboard.html', assignments=assignments, submitted=submitted, now=now)
 
 # 提交作业
 @student_bp.route('/submit_assignment/<int:assignment_id>', methods=['GET', 'POST'])
 @login_required('student')
+@upload_limit('student')
 def submit_assignment(assignment_id):
     with DatabaseConnection() as c:
         # 获取作业信息
@@ -44,106 +50,108 @@ def submit_assignment(assignment_id):
         if request.method == 'POST':
             content = request.form['content']
             
-            # 生成唯一文件名，确保文件存储安全
-            base_filename = str(uuid.uuid4())
-            text_file_path = None
-            image_file_path = None
-            
             # 获取应用配置中的UPLOAD_FOLDER
             upload_folder = current_app.config['UPLOAD_FOLDER']
             
-            # 保存文本内容到文件
-            if content:
-                text_file_path = os.path.join(upload_folder, f"{base_filename}.txt")
-                with open(text_file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-            
-            # 保存图片文件
+            # 保存图片文件，文件名由内容的 sha256 生成，相同的图片只保存一份
+            image_name = None
+            image_info = None
             if 'file' in request.files and request.files['file'].filename != '':
                 file = request.files['file']
                 if allowed_file(file.filename):
-                    image_extension = file.filename.split('.')[-1].lower()
-                    image_file_path = os.path.join(upload_folder, f"{base_filename}.{image_extension}")
-                    # 规范化路径，防止路径遍历攻击
-                    image_file_path = os.path.normpath(image_file_path)
-                    # 确保文件保存在指定目录内
-                    if not os.path.abspath(image_file_path).startswith(os.path.abspath(upload_folder)):
-                        flash('文件上传路径错误')
-                        return redirect(url_for('student.dashboard'))
-                    file.save(image_file_path)
+                    try:
+                        image_name, image_info = store_upload(c, upload_folder, file, current_app.config['UPLOAD_LIMITS']['student'])
+                        UPLOADS.inc(role='student')
+                        UPLOAD_BYTES.inc(image_info['byte_size'], role='student')
+                    except UploadTooLarge:
+                        abort(413)
+                    except UploadError as e:
+                        flash(str(e))
+                        return redirect(url_for('student.submit_assignment', assignment_id=assignment_id))
             
-            # 保存文件名到数据库（只保存基础文件名，不包含路径和扩展名）
+            # 文本内容直接保存在数据库中，图片只保存基础文件名（不包含扩展名）
+            image_filename = image_name.split('.', 1)[0] if image_name else None
+            # 新提交和修改写成一条 upsert，同一学生并发提交时由唯一索引 (assignment_id, student_id) 合并
+            c.execute("""INSERT INTO submissions (assignment_id, student_id, content, file_path) VALUES (?, ?, ?, ?)
+                         ON CONFLICT (assignment_id, student_id) DO UPDATE SET content = excluded.content, file_path = excluded.file_path""",
+                      (assignment_id, session['user_id'], content or None, image_filename))
+            c.execute("SELECT id FROM submissions WHERE assignment_id = ? AND student_id = ?", (assignment_id, session['user_id']))
+            submission_id = c.fetchone()[0]
             if existing_submission:
-                # 更新现有提交
-                c.execute("UPDATE submissions SET content = ?, file_path = ? WHERE id = ?", (base_filename, base_filename, existing_submission[0]))
                 flash('作业修改成功')
+                SUBMISSIONS.inc(class_id=session['class_id'], kind='update')
             else:
-                # 创建新提交
-                c.execute("INSERT INTO submissions (assignment_id, student_id, content, file_path) VALUES (?, ?, ?, ?)", 
-                          (assignment_id, session['user_id'], base_filename, base_filename))
                 flash('作业提交成功')
+                SUBMISSIONS.inc(class_id=session['class_id'], kind='new')
+            
+            # 记录图片的类型、大小和尺寸；没有上传图片时清除旧的附件记录
+            if image_name:
+                record_attachment(c, upload_folder, image_name, submission_id=submission_id, info=image_info)
+                # 后台生成缩略图，相同的图片只生成一次
+                if not get_variants(c, image_info['sha256']):
+                    enqueue_thumbnails(current_app._get_current_object(), image_name, image_info['sha256'])
+            else:
+                c.execute("DELETE FROM attachments WHERE submission_id = ?", (submission_id,))
             
             return redirect(url_for('student.dashboard'))
         
-        # 如果已有提交，预填充表单
-        if existing_submission:
-            # 读取文本文件内容
-            if existing_submission[4]:
-                # 获取应用配置中的UPLOAD_FOLDER
-                upload_folder = current_app.config['UPLOAD_FOLDER']
-                text_file_path = os.path.join(upload_folder, f"{existing_submission[4]}.txt")
-                try:
-                    with open(text_file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    # 更新existing_submission元组，将文本内容替换为文件内容
-                    existing_submission = (existing_submission[0], existing_submission[1], existing_submission[2], existing_submission[3], content, existing_submission[5], existing_submission[6], existing_submission[7], existing_submission[8], existing_submission[9])
-                except Exception as e:
-                    print(f"读取提交文件错误: {e}")
-                    pass
+        existing_image = get_submission_attachment(c, existing_submission[0]) if existing_submission else None
     
-    return render_template('submit_assignment.html', assignment=assignment, existing_submission=existing_submission)
+    return render_template('submit_assignment.html', assignment=assignment, existing_submission=existing_submission, existing_image=existing_image)
 
 # 组长查看同组作业
 @student_bp.route('/view_group_submissions/<int:assignment_id>')
 @login_required('student')
 def view_group_submissions(assignment_id):
+    # 检查是否是组长（身份缓存由 login_required 读取）
+    if not g.identity.is_group_leader:
+        flash('只有组长可以查看同组作业')
+        return redirect(url_for('student.dashboard'))
+    
     with DatabaseConnection() as c:
-        # 检查是否是组长
-        c.execute("SELECT is_group_leader FROM users WHERE id = ?", (session['user_id'],))
-        is_leader = c.fetchone()[0]
-        
-        if not is_leader:
-            flash('只有组长可以查看同组作业')
-            return redirect(url_for('student.dashboard'))
-        
         # 获取作业信息
         c.execute("SELECT * FROM assignments WHERE id = ?", (assignment_id,))
         assignment = c.fetchone()
         
         # 获取同组同学的提交
-        c.execute("SELECT s.*, u.name FROM submissions s JOIN users u ON s.student_id = u.id WHERE s.assignment_id = ? AND u.group_id = ?", 
-                  (assignment_id, session['group_id']))
+        c.execute("SELECT s.*, u.name, t.stored_name, vj.stored_name, vw.stored_name FROM submissions s JOIN users u ON s.student_id = u.id LEFT JOIN attachments t ON t.submission_id = s.id LEFT JOIN image_variants vj ON vj.sha256 = t.sha256 AND vj.variant = 'w320.jpg' LEFT JOIN image_variants vw ON vw.sha256 = t.sha256 AND vw.variant = 'w320.webp' WHERE s.assignment_id = ? AND u.group_id = ?", 
+                  (assignment_id, g.identity.group_id))
         submissions = c.fetchall()
     return render_template('view_group_submissions.html', assignment=assignment, submissions=submissions)
 
+# 检查是否是组长（身份缓存由 login_required 读取）；没有分配小组的组长不能评分，
+# 否则评分范围会变成整个班级。不能评分时返回错误响应
+def check_group_leader():
+    if not g.identity.is_group_leader:
+        flash('只有组长可以评分')
+        return redirect(url_for('student.dashboard'))
+    if g.identity.group_id is None:
+        flash('还没有分配小组，不能评分')
+        return redirect(url_for('student.dashboard'))
+    return None
+
 # 组长评分
 @student_bp.route('/score_group_submission/<int:submission_id>', methods=['POST'])
 @login_required('student')
 def score_group_submission(submission_id):
-    with DatabaseConnection() as c:
-        # 检查是否是组长
-        c.execute("SELECT is_group_leader FROM users WHERE id = ?", (session['user_id'],))
-        is_leader = c.fetchone()[0]
-        
-        if not is_leader:
-            flash('只有组长可以评分')
-            return redirect(url_for('student.dashboard'))
-        
-        score = request.form['score']
-        c.execute("UPDATE submissions SET score = ?, scorer_id = ? WHERE id = ?", (score, session['user_id'], submission_id))
+    error = check_group_leader()
+    if error:
+        return error
+    
+    return save_scores([(submission_id, request.form['score'])], g.identity.class_id, g.identity.group_id)
+
+# 组长批量评分，格式同教师的批量评分
+@student_bp.route('/score_group_submissions', methods=['POST'])
+@login_required('student')
+def score_group_submissions():
+    error = check_group_leader()
+    if error:
+        return error
     
-    flash('评分成功')
-    return redirect(request.referrer)
+    scores, error = read_scores()
+    if error:
+        return error
+    return save_scores(scores, g.identity.class_id, g.identity.group_id)
 
 # 学生查看个人提交历史
 @student_bp.route('/view_my_submissions')
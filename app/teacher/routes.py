@@ -1,10 +1,17 @@
-from flask import render_template, request, redirect, url_for, session, flash, current_app
-import csv
+from flask import render_template, request, redirect, url_for, session, flash, current_app, abort, jsonify
 import os
-import uuid
+import tempfile
 from app.teacher import teacher_bp
 from app.utils.db import DatabaseConnection
-from app.main.routes import login_required
+from app.utils.dashboard import get_teacher_dashboard
+from app.utils.snapshot import AnalyticsConnection
+from app.utils.assignment_cache import invalidate_class_assignments
+from app.utils.pagination import list_assignments, list_students, list_submissions, page_args
+from app.utils.jobs import get_job, submit_job
+from app.utils.stats import get_stat
+from app.utils.uploads import UploadError, UploadTooLarge, record_attachment, store_upload
+from app.utils.metrics import ASSIGNMENTS, UPLOAD_BYTES, UPLOADS
+from app.main.routes import login_required, upload_limit, read_scores, save_scores
 from datetime import datetime
 
 # 允许的图片扩展名
@@ -17,45 +24,11 @@ def allowed_file(filename):
 @teacher_bp.route('/dashboard')
 @login_required('teacher')
 def dashboard():
-    with DatabaseConnection() as c:
-        # 获取本班学生数
-        c.execute("SELECT COUNT(*) FROM users WHERE role = 'student' AND class_id = ?", (session['class_id'],))
-        class_students = c.fetchone()[0]
-        
-        # 获取本班作业数
-        c.execute("SELECT COUNT(*) FROM assignments WHERE class_id = ?", (session['class_id'],))
-        class_assignments = c.fetchone()[0]
-        
-        # 获取本班提交数
-        c.execute("SELECT COUNT(*) FROM submissions s JOIN assignments a ON s.assignment_id = a.id WHERE a.class_id = ?", (session['class_id'],))
-        class_submissions = c.fetchone()[0]
-        
-        # 计算本班总提交率
-        class_completion_rate = (class_submissions / (class_students * class_assignments) * 100) if class_students * class_assignments > 0 else 0
-        
-        # 获取今日日期
-        today = datetime.now().strftime('%Y-%m-%d')
-        
-        # 获取今日本班提交数
-        c.execute("SELECT COUNT(*) FROM submissions s JOIN assignments a ON s.assignment_id = a.id WHERE a.class_id = ? AND DATE(s.submitted_at) = ?", (session['class_id'], today))
-        today_class_submissions = c.fetchone()[0]
-        
-        # 获取今日本班应提交作业数（今日截止的作业数 * 本班学生数）
-        c.execute("SELECT COUNT(*) FROM assignments WHERE class_id = ? AND deadline = ?", (session['class_id'], today))
-        today_class_assignments = c.fetchone()[0]
-        today_class_expected_submissions = today_class_assignments * class_students
-        
-        # 计算今日本班提交率
-        today_class_completion_rate = (today_class_submissions / today_class_expected_submissions * 100) if today_class_expected_submissions > 0 else 0
-    
-    return render_template('teacher_dashboard.html', 
-                           class_students=class_students,
-                           class_assignments=class_assignments,
-                           class_submissions=class_submissions,
-                           class_completion_rate=class_completion_rate,
-                           today_class_submissions=today_class_submissions,
-                           today_class_expected_submissions=today_class_expected_submissions,
-                           today_class_completion_rate=today_class_completion_rate)
+    # 获取今日日期
+    today = datetime.now().strftime('%Y-%m-%d')
+    class_id = session['class_id']
+    context = get_teacher_dashboard(class_id, today)
+    return render_template('teacher_dashboard.html', **context)
 
 # 教师添加学生
 @teacher_bp.route('/add_student', methods=['GET', 'POST'])
@@ -77,6 +50,7 @@ def add_student():
 # 教师通过CSV添加学生
 @teacher_bp.route('/import_students', methods=['GET', 'POST'])
 @login_required('teacher')
+@upload_limit('teacher')
 def import_students():
     if request.method == 'POST':
         if 'file' not in request.files:
@@ -89,68 +63,85 @@ def import_students():
             return redirect(request.url)
         
         if file:
-            # 读取CSV文件
-            csv_reader = csv.reader(file.stream.read().decode('utf-8').splitlines())
-            
-            with DatabaseConnection() as c:
-                for row in csv_reader:
-                    if len(row) >= 4:
-                        name = row[0].strip()
-                        class_id = session['class_id']  # 使用教师自己的班级
-                        group_id = row[2].strip()
-                        id_card_last8 = row[3].strip()
-                        
-                        c.execute("INSERT INTO users (name, class_id, group_id, id_card_last8, role) VALUES (?, ?, ?, ?, 'student')", (name, class_id, group_id, id_card_last8))
-            
-            flash('学生导入成功')
-            return redirect(url_for('teacher.dashboard'))
+            # 与管理员导入相同，先保存到临时文件，在后台任务中导入到教师自己的班级
+            fd, path = tempfile.mkstemp(suffix='.csv')
+            os.close(fd)
+            file.save(path)
+            job_id = submit_job(current_app._get_current_object(), 'import_students',
+                                {'path': path, 'class_id': session['class_id']}, created_by=session['user_id'])
+            flash('已开始导入学生')
+            return redirect(url_for('teacher.import_status', job_id=job_id))
     return render_template('teacher_import_students.html')
 
+# 导入学生的进度和结果，只能查看自己提交的导入任务；页面通过 Accept: application/json 轮询
+@teacher_bp.route('/import_students/<job_id>')
+@login_required('teacher')
+def import_status(job_id):
+    with DatabaseConnection() as c:
+        job = get_job(c, job_id)
+    if job is None or job['kind'] != 'import_students' or job['created_by'] != session['user_id']:
+        abort(404)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job)
+    return render_template('teacher_import_students.html', job=job, report=job['result'])
+
 # 教师查看本班学生
 @teacher_bp.route('/view_students')
 @login_required('teacher')
 def view_students():
     with DatabaseConnection() as c:
-        c.execute("SELECT * FROM users WHERE role = 'student' AND class_id = ? ORDER BY class_id, name, id_card_last8", (session['class_id'],))
-        students = c.fetchall()
-    return render_template('teacher_view_students.html', students=students)
+        listing = list_students(c,
+                                class_id=session['class_id'],
+                                group_id=request.args.get('group_id', type=int),
+                                name_prefix=request.args.get('name', '').strip() or None,
+                                sort=request.args.get('sort', 'class'),
+                                descending=request.args.get('order') == 'desc',
+                                **page_args(request.args))
+    return render_template('teacher_view_students.html', students=listing.items, listing=listing)
 
 # 布置作业
 @teacher_bp.route('/assign_assignment', methods=['GET', 'POST'])
 @login_required('teacher')
+@upload_limit('teacher')
 def assign_assignment():
     if request.method == 'POST':
         title = request.form['title']
         content = request.form['content']
         deadline = request.form['deadline']
         
-        # 文件上传
-        file_path = None
-        if 'file' in request.files and request.files['file'].filename != '':
-            file = request.files['file']
-            if allowed_file(file.filename):
-                # 生成随机文件名，避免路径遍历攻击
-                filename = str(uuid.uuid4()) + '.' + file.filename.split('.')[-1]
-                # 获取应用配置中的UPLOAD_FOLDER
-                upload_folder = current_app.config['UPLOAD_FOLDER']
-                # 确保路径安全
-                file_path = os.path.join(upload_folder, filename)
-                # 规范化路径，防止路径遍历
-                file_path = os.path.normpath(file_path)
-                # 确保文件保存在指定目录内
-                if not os.path.abspath(file_path).startswith(os.path.abspath(upload_folder)):
-                    flash('文件上传路径错误')
-                    return redirect(url_for('teacher.dashboard'))
-                file.save(file_path)
-        
         # 转换datetime-local格式为数据库DATETIME格式
         if deadline:
             deadline = deadline.replace('T', ' ')
             deadline += ':00'
 
         with DatabaseConnection() as c:
+            # 文件上传，文件名由内容的 sha256 生成，同一张图片布置给多个班级时只保存一份
+            file_path = None
+            filename = None
+            file_info = None
+            upload_folder = current_app.config['UPLOAD_FOLDER']
+            if 'file' in request.files and request.files['file'].filename != '':
+                file = request.files['file']
+                if allowed_file(file.filename):
+                    try:
+                        filename, file_info = store_upload(c, upload_folder, file, current_app.config['UPLOAD_LIMITS']['teacher'])
+                    except UploadTooLarge:
+                        abort(413)
+                    except UploadError as e:
+                        flash(str(e))
+                        return redirect(url_for('teacher.assign_assignment'))
+                    file_path = os.path.join(upload_folder, filename)
+                    UPLOADS.inc(role='teacher')
+                    UPLOAD_BYTES.inc(file_info['byte_size'], role='teacher')
+            
             c.execute("INSERT INTO assignments (teacher_id, class_id, title, content, file_path, deadline) VALUES (?, ?, ?, ?, ?, ?)", 
                       (session['user_id'], session['class_id'], title, content, file_path, deadline))
+            # 记录附件的类型、大小和尺寸
+            if filename:
+                record_attachment(c, upload_folder, filename, assignment_id=c.lastrowid, info=file_info)
+        # 作业已经提交到数据库，班级的作业列表缓存失效
+        invalidate_class_assignments(session['class_id'])
+        ASSIGNMENTS.inc(class_id=session['class_id'])
         
         flash('作业布置成功')
         return redirect(url_for('teacher.dashboard'))
@@ -161,9 +152,12 @@ def assign_assignment():
 @login_required('teacher')
 def view_assignments():
     with DatabaseConnection() as c:
-        c.execute("SELECT * FROM assignments WHERE class_id = ? ORDER BY created_at DESC", (session['class_id'],))
-        assignments = c.fetchall()
-    return render_template('view_assignments.html', assignments=assignments)
+        listing = list_assignments(c, session['class_id'],
+                                   title_prefix=request.args.get('title', '').strip() or None,
+                                   sort=request.args.get('sort', 'created'),
+                                   descending=request.args.get('order', 'desc') == 'desc',
+                                   **page_args(request.args))
+    return render_template('view_assignments.html', assignments=listing.items, listing=listing)
 
 # 作业统计分析
 @teacher_bp.route('/analyze_assignment/<int:assignment_id>')
@@ -173,20 +167,21 @@ def analyze_assignment(assignment_id):
         # 获取作业信息
         c.execute("SELECT * FROM assignments WHERE id = ?", (assignment_id,))
         assignment = c.fetchone()
-        
+    
+    # 统计查询在开启快照时读取快照
+    analytics = AnalyticsConnection()
+    with analytics as c:
         # 获取班级总学生数
-        c.execute("SELECT COUNT(*) FROM users WHERE class_id = ? AND role = 'student'", (session['class_id'],))
-        total_students = c.fetchone()[0]
+        total_students = get_stat(c, 'class', session['class_id'], 'students')
         
         # 获取提交人数
-        c.execute("SELECT COUNT(*) FROM submissions WHERE assignment_id = ?", (assignment_id,))
-        submitted_count = c.fetchone()[0]
+        submitted_count = get_stat(c, 'assignment', assignment_id, 'submissions')
         
         # 计算完成率
         completion_rate = (submitted_count / total_students * 100) if total_students > 0 else 0
         
         # 获取评分分布
-        c.execute("SELECT score, COUNT(*) FROM submissions WHERE assignment_id = ? AND score IS NOT NULL GROUP BY score", (assignment_id,))
+        c.execute("SELECT metric, value FROM stats WHERE scope = 'assignment_score' AND scope_key = ? AND value > 0 ORDER BY metric", (str(assignment_id),))
         score_distribution = c.fetchall()
         
         # 获取未完成学生名单
@@ -204,7 +199,8 @@ def analyze_assignment(assignment_id):
                            completion_rate=completion_rate,
                            score_distribution=score_distribution,
                            uncompleted_students=uncompleted_students,
-                           completed_students=completed_students)
+                           completed_students=completed_students,
+                           as_of=analytics.as_of)
 
 # 查看作业提交情况
 @teacher_bp.route('/view_submissions/<int:assignment_id>')
@@ -215,22 +211,29 @@ def view_submissions(assignment_id):
         c.execute("SELECT * FROM assignments WHERE id = ?", (assignment_id,))
         assignment = c.fetchone()
         
-        # 获取所有提交
-        c.execute("SELECT s.*, u.name FROM submissions s JOIN users u ON s.student_id = u.id WHERE s.assignment_id = ?", (assignment_id,))
-        submissions = c.fetchall()
-    return render_template('view_submissions.html', assignment=assignment, submissions=submissions)
+        # 分页获取提交
+        listing = list_submissions(c, assignment_id,
+                                   group_id=request.args.get('group_id', type=int),
+                                   name_prefix=request.args.get('name', '').strip() or None,
+                                   sort=request.args.get('sort', 'submitted'),
+                                   descending=request.args.get('order') == 'desc',
+                                   **page_args(request.args))
+    return render_template('view_submissions.html', assignment=assignment, submissions=listing.items, listing=listing)
 
 # 评分
 @teacher_bp.route('/score_submission/<int:submission_id>', methods=['POST'])
 @login_required('teacher')
 def score_submission(submission_id):
-    score = request.form['score']
-    
-    with DatabaseConnection() as c:
-        c.execute("UPDATE submissions SET score = ?, scorer_id = ? WHERE id = ?", (score, session['user_id'], submission_id))
-    
-    flash('评分成功')
-    return redirect(request.referrer)
+    return save_scores([(submission_id, request.form['score'])], session['class_id'])
+
+# 批量评分：表单字段 score-<提交id>，或 JSON {"scores": [{"id": 提交id, "score": 评分}]}
+@teacher_bp.route('/score_submissions', methods=['POST'])
+@login_required('teacher')
+def score_submissions():
+    scores, error = read_scores()
+    if error:
+        return error
+    return save_scores(scores, session['class_id'])
 
 # 查看作业详情
 @teacher_bp.route('/assignment_detail/<int:assignment_id>')
@@ -251,12 +254,10 @@ def assignment_detail(assignment_id):
             return redirect(url_for('teacher.dashboard'))
         
         # 获取提交数
-        c.execute("SELECT COUNT(*) FROM submissions WHERE assignment_id = ?", (assignment_id,))
-        submission_count = c.fetchone()[0]
+        submission_count = get_stat(c, 'assignment', assignment_id, 'submissions')
         
         # 获取班级学生数
-        c.execute("SELECT COUNT(*) FROM users WHERE class_id = ? AND role = 'student'", (session['class_id'],))
-        total_students = c.fetchone()[0]
+        total_students = get_stat(c, 'class', session['class_id'], 'students')
         
         # 计算提交率
         completion_rate = (submission_count / total_students * 100) if total_students > 0 else 0
@@ -0,0 +1,42 @@
+import uuid
+from app.utils.cache import get_cache
+from app.utils.db import DatabaseConnection
+
+# 班级作业列表缓存
+# 上课开始时全班学生几乎同时打开首页，读取的是同一个班级的作业列表，
+# 这里按班级缓存作业列表。每个班级有一个版本号（也保存在缓存中，多个进程共用），
+# 布置作业后换一个新的版本号；缓存键包含版本号，版本号更换之前开始的查询即使晚写入缓存，
+# 也不会被之后的请求读到
+
+DEFAULT_CACHE_TTL = 60
+
+_cache = get_cache('assignments', DEFAULT_CACHE_TTL)
+
+
+def _class_version(class_id):
+    version = _cache.get(f"version:{class_id}")
+    if version is None:
+        version = uuid.uuid4().hex
+        # 版本号不过期
+        _cache.set(f"version:{class_id}", version, ttl=0)
+    return version
+
+
+# 获取班级的作业列表（按布置时间倒序），与 SELECT * FROM assignments 的行相同
+def get_class_assignments(class_id):
+    key = f"list:{class_id}:{_class_version(class_id)}"
+    assignments = _cache.get(key)
+    if assignments is None:
+        with DatabaseConnection() as c:
+            c.execute("SELECT * FROM assignments WHERE class_id = ? ORDER BY created_at DESC", (class_id,))
+            assignments = c.fetchall()
+        _cache.set(key, assignments)
+    return assignments
+
+
+# 班级的作业修改并提交后调用，class_id 为空时所有班级失效（如重置系统）
+def invalidate_class_assignments(class_id=None):
+    if class_id is None:
+        _cache.clear()
+    else:
+        _cache.set(f"version:{class_id}", uuid.uuid4().hex, ttl=0)
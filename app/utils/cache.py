@@ -0,0 +1,341 @@
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from app.utils.db import connect
+
+# 缓存
+# 各模块通过 get_cache(名称) 获取一个命名空间，命名空间共用同一个后端：
+#   memory  进程内的 LRU，只适合单进程部署
+#   sqlite  同一台机器上多个工作进程共用的 SQLite 文件
+#   redis   Redis 协议的服务（Redis、KeyDB 等），多台机器共用
+# 每个命名空间分别统计命中、未命中次数；后端出错时按未命中处理，请求直接查询数据库
+
+DEFAULT_BACKEND = 'memory'
+DEFAULT_MEMORY_SIZE = 4096
+DEFAULT_SQLITE_PATH = 'cache.db'
+DEFAULT_REDIS_URL = 'redis://localhost:6379/0'
+
+_MISSING = object()
+
+
+# 进程内缓存
+# 最近最少使用（LRU）淘汰，超过 maxsize 时删除最久未访问的项；多线程共用，所有操作都加锁
+class LRUCache:
+    def __init__(self, maxsize=DEFAULT_MEMORY_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires is not None and expires <= time.monotonic():
+                del self._items[key]
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    # 删除以 prefix 开头的键，prefix 为空时删除所有
+    def clear(self, prefix=''):
+        with self._lock:
+            if not prefix:
+                self._items.clear()
+                return
+            for key in [key for key in self._items if key.startswith(prefix)]:
+                del self._items[key]
+
+    def __len__(self):
+        return len(self._items)
+
+
+# 多个工作进程共用的 SQLite 缓存文件，每个线程使用自己的连接
+class SQLiteCache:
+    # 每写入这么多次清理一次过期的项
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.path, 'concurrent', self.timeout)
+            conn.isolation_level = None
+            conn.execute('''CREATE TABLE IF NOT EXISTS cache (
+                         key TEXT PRIMARY KEY,
+                         value BLOB NOT NULL,
+                         expires_at REAL
+                     ) WITHOUT ROWID''')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn().execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                     (key, pickle.dumps(value), expires_at))
+        self._writes += 1
+        if self._writes % self.PURGE_INTERVAL == 0:
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self, prefix=''):
+        if not prefix:
+            self._conn().execute("DELETE FROM cache")
+        else:
+            self._conn().execute("DELETE FROM cache WHERE key >= ? AND key < ?", (prefix, prefix + '\uffff'))
+
+
+class RedisError(Exception):
+    pass
+
+
+# 后端的这些错误按未命中处理
+CACHE_ERRORS = (OSError, ConnectionError, sqlite3.Error, RedisError)
+
+
+# Redis 协议（RESP）的简单客户端，只用到 GET/SET/DEL/SCAN，不依赖 redis 包
+# url 格式：redis://[:密码@]主机[:端口][/数据库编号]
+class RedisCache:
+    def __init__(self, url=DEFAULT_REDIS_URL, timeout=1.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        if self.password:
+            self._execute('AUTH', self.password)
+        if self.db:
+            self._execute('SELECT', self.db)
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Redis 连接已断开')
+        kind, data = line[:1], line[1:-2]
+        if kind == b'+':
+            return data.decode()
+        if kind == b'-':
+            raise RedisError(data.decode())
+        if kind == b':':
+            return int(data)
+        if kind == b'$':
+            length = int(data)
+            if length < 0:
+                return None
+            return self._local.reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(data)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f'无法解析的回复: {line!r}')
+
+    def _execute(self, *args):
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(f'${len(arg)}\r\n'.encode() + arg + b'\r\n')
+        self._local.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    # 执行命令，连接断开时重新连接一次
+    def command(self, *args):
+        if getattr(self._local, 'sock', None) is None:
+            self._connect()
+        try:
+            return self._execute(*args)
+        except (OSError, ConnectionError):
+            self.close()
+            self._connect()
+            return self._execute(*args)
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            self._local.reader.close()
+            sock.close()
+        self._local.sock = None
+
+    def get(self, key, default=None):
+        value = self.command('GET', key)
+        return default if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.command('SET', key, pickle.dumps(value), 'PX', int(ttl * 1000))
+        else:
+            self.command('SET', key, pickle.dumps(value))
+
+    def delete(self, key):
+        self.command('DEL', key)
+
+    def clear(self, prefix=''):
+        cursor = b'0'
+        while True:
+            cursor, keys = self.command('SCAN', cursor, 'MATCH', f'{prefix}*', 'COUNT', 1000)
+            if keys:
+                self.command('DEL', *keys)
+            if cursor == b'0':
+                break
+
+
+# 根据配置创建缓存后端
+def create_backend(config):
+    backend = config.get('CACHE_BACKEND', DEFAULT_BACKEND)
+    if backend == 'memory':
+        return LRUCache(config.get('CACHE_MEMORY_SIZE', DEFAULT_MEMORY_SIZE))
+    if backend == 'sqlite':
+        return SQLiteCache(config.get('CACHE_SQLITE_PATH', DEFAULT_SQLITE_PATH))
+    if backend == 'redis':
+        return RedisCache(config.get('CACHE_REDIS_URL', DEFAULT_REDIS_URL))
+    raise ValueError(f'未知的缓存后端: {backend}')
+
+
+_backend = LRUCache()
+_namespaces = {}
+_ttls = {}
+_lock = threading.Lock()
+
+
+def init_app(app):
+    global _backend
+    _backend = create_backend(app.config)
+    # 各命名空间的默认过期时间
+    with _lock:
+        _ttls.update(app.config.get('CACHE_TTLS', {}))
+        for name, namespace in _namespaces.items():
+            namespace.ttl = _ttls.get(name, namespace.ttl)
+
+
+# 缓存命名空间，键自动加上 "名称:" 前缀，ttl 是写入时默认的过期时间（秒）
+class CacheNamespace:
+    def __init__(self, name, ttl=None):
+        self.name = name
+        self.ttl = ttl
+        # 多个线程同时读取缓存，计数器在锁内更新
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key):
+        return f"{self.name}:{key}"
+
+    def get(self, key, default=None):
+        try:
+            value = _backend.get(self._key(key), _MISSING)
+        except CACHE_ERRORS as e:
+            self._error('读取', e)
+            value = _MISSING
+        if value is _MISSING:
+            with self._lock:
+                self.misses += 1
+            return default
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        try:
+            _backend.set(self._key(key), value, ttl if ttl is not None else self.ttl)
+        except CACHE_ERRORS as e:
+            self._error('写入', e)
+
+    def delete(self, key):
+        try:
+            _backend.delete(self._key(key))
+        except CACHE_ERRORS as e:
+            self._error('删除', e)
+
+    def clear(self):
+        try:
+            _backend.clear(f"{self.name}:")
+        except CACHE_ERRORS as e:
+            self._error('清空', e)
+
+    # 读取缓存，没有时调用 compute 计算并写入
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def _error(self, action, e):
+        with self._lock:
+            self.errors += 1
+        print(f"缓存{action}错误 ({self.name}): {e}")
+
+    def stats(self):
+        with self._lock:
+            hits, misses, errors = self.hits, self.misses, self.errors
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'errors': errors,
+            'hit_rate': hits / total if total else 0,
+        }
+
+
+# 获取缓存命名空间，同一名称返回同一个对象；配置 CACHE_TTLS 中的过期时间优先
+def get_cache(name, ttl=None):
+    with _lock:
+        namespace = _namespaces.get(name)
+        if namespace is None:
+            namespace = _namespaces[name] = CacheNamespace(name, _ttls.get(name, ttl))
+    return namespace
+
+
+# 清空所有缓存（如重置系统后）
+def clear_cache():
+    try:
+        _backend.clear()
+    except CACHE_ERRORS as e:
+        print(f"缓存清空错误: {e}")
+
+
+# 各命名空间的命中统计
+def cache_stats():
+    with _lock:
+        namespaces = list(_namespaces.values())
+    return {namespace.name: namespace.stats() for namespace in namespaces}
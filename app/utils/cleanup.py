@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from app.utils.db import DatabaseConnection
+
+# 清理上传目录中不再被引用的文件
+# 重新提交作业时会生成新的文件名，旧的图片不会再被任何记录引用，
+# 这里根据 submissions、assignments、attachments 中的记录找出这些文件并删除；
+# 缩略图只在原图仍被引用（blobs 中有记录）时保留
+
+DEFAULT_GRACE_SECONDS = 24 * 60 * 60
+
+
+# 收集所有被引用的文件名，返回 (完整文件名集合, 基础文件名集合)
+# submissions.file_path 只保存不含扩展名的基础文件名
+def referenced_files(c):
+    names = set()
+    bases = set()
+    c.execute("SELECT stored_name FROM attachments")
+    for (stored_name,) in c:
+        names.add(stored_name)
+    c.execute("SELECT v.stored_name FROM image_variants v JOIN blobs b ON b.sha256 = v.sha256")
+    for (stored_name,) in c:
+        names.add(stored_name)
+    c.execute("SELECT file_path FROM submissions WHERE file_path IS NOT NULL")
+    for (file_path,) in c:
+        bases.add(file_path)
+    c.execute("SELECT file_path FROM assignments WHERE file_path IS NOT NULL")
+    for (file_path,) in c:
+        # 作业可能保存了完整路径（包括 Windows 路径）
+        names.add(file_path.replace('\\', '/').split('/')[-1])
+    return names, bases
+
+
+def _is_referenced(name, names, bases):
+    return name in names or name.split('.', 1)[0] in bases
+
+
+# 扫描上传目录，删除（或在 dry_run 时只报告）未被引用且超过宽限期的文件
+def collect_garbage(c, upload_folder, grace_seconds=DEFAULT_GRACE_SECONDS, dry_run=False, limit=None):
+    names, bases = referenced_files(c)
+    cutoff = time.time() - grace_seconds
+    report = {
+        'scanned': 0,
+        'referenced': 0,
+        'too_new': 0,
+        'orphaned': [],
+        'deleted': 0,
+        'freed_bytes': 0,
+        'errors': [],
+    }
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            report['scanned'] += 1
+            if _is_referenced(entry.name, names, bases):
+                report['referenced'] += 1
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            # 刚上传、数据库还没提交的文件不能删除
+            if stat.st_mtime > cutoff:
+                report['too_new'] += 1
+                continue
+            report['orphaned'].append((entry.name, stat.st_size))
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    report['errors'].append((entry.name, str(e)))
+                    continue
+                report['deleted'] += 1
+                report['freed_bytes'] += stat.st_size
+            if limit is not None and len(report['orphaned']) >= limit:
+                break
+    return report
+
+
+# 定时清理：每隔 interval 秒在后台线程中执行一次
+def start_scheduler(app, interval, grace_seconds=DEFAULT_GRACE_SECONDS):
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    with DatabaseConnection() as c:
+                        report = collect_garbage(c, app.config['UPLOAD_FOLDER'], grace_seconds)
+                if report['deleted']:
+                    print(f"清理上传文件 {report['deleted']} 个，释放 {report['freed_bytes']} 字节")
+            except Exception as e:
+                print(f"清理上传文件错误: {e}")
+
+    thread = threading.Thread(target=run, name='upload-gc', daemon=True)
+    thread.start()
+    return thread
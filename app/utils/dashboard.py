@@ -0,0 +1,159 @@
+from app.utils.cache import get_cache
+from app.utils.db import DatabaseConnection
+from app.utils.snapshot import AnalyticsConnection
+from app.utils.stats import get_stat, get_stats
+
+# 后台首页和数据看板
+# 管理员、教师的页面和 /api/v1/dashboard 共用这里的查询和缓存，统计数据允许有几秒的延迟
+
+_cache = get_cache('dashboard', 10)
+
+# 综合查看页面每页显示的作业数，以及学生、教师概览显示的人数
+DASHBOARD_ASSIGNMENTS_PER_PAGE = 6
+DASHBOARD_PREVIEW_SIZE = 6
+
+
+# 管理员后台首页
+def get_admin_dashboard(today):
+    return _cache.get_or_set(f"admin:{today}", lambda: _load_admin_dashboard(today))
+
+
+# 教师后台首页，只统计本班
+def get_teacher_dashboard(class_id, today):
+    return _cache.get_or_set(f"teacher:{class_id}:{today}", lambda: _load_teacher_dashboard(class_id, today))
+
+
+# 管理员的综合查看页面
+def get_overview_dashboard(page):
+    return _cache.get_or_set(f"view:{page}", lambda: _load_overview_dashboard(page))
+
+
+def _load_admin_dashboard(today):
+    with DatabaseConnection() as c:
+        # 总学生数、作业数、提交数从统计表读取
+        totals = get_stats(c, 'total', '')
+        total_students = totals.get('students', 0)
+        total_assignments = totals.get('assignments', 0)
+        total_submissions = totals.get('submissions', 0)
+        
+        # 计算总提交率
+        total_completion_rate = (total_submissions / (total_students * total_assignments) * 100) if total_students * total_assignments > 0 else 0
+        
+        # 获取今日提交数
+        today_submissions = get_stat(c, 'day', today, 'submissions')
+        
+        # 获取今日应提交作业数（今日截止的作业数 * 学生数）
+        c.execute("SELECT COUNT(*) FROM assignments WHERE deadline = ?", (today,))
+        today_assignments = c.fetchone()[0]
+        today_expected_submissions = today_assignments * total_students
+        
+        # 计算今日提交率
+        today_completion_rate = (today_submissions / today_expected_submissions * 100) if today_expected_submissions > 0 else 0
+    
+    return dict(total_students=total_students,
+                total_assignments=total_assignments,
+                total_submissions=total_submissions,
+                total_completion_rate=total_completion_rate,
+                today_submissions=today_submissions,
+                today_expected_submissions=today_expected_submissions,
+                today_completion_rate=today_completion_rate)
+
+
+def _load_teacher_dashboard(class_id, today):
+    with DatabaseConnection() as c:
+        # 本班学生数、作业数、提交数从统计表读取
+        class_stats = get_stats(c, 'class', class_id)
+        class_students = class_stats.get('students', 0)
+        class_assignments = class_stats.get('assignments', 0)
+        class_submissions = class_stats.get('submissions', 0)
+        
+        # 计算本班总提交率
+        class_completion_rate = (class_submissions / (class_students * class_assignments) * 100) if class_students * class_assignments > 0 else 0
+        
+        # 获取今日本班提交数
+        today_class_submissions = get_stat(c, 'class_day', class_id, today)
+        
+        # 获取今日本班应提交作业数（今日截止的作业数 * 本班学生数）
+        c.execute("SELECT COUNT(*) FROM assignments WHERE class_id = ? AND deadline = ?", (class_id, today))
+        today_class_assignments = c.fetchone()[0]
+        today_class_expected_submissions = today_class_assignments * class_students
+        
+        # 计算今日本班提交率
+        today_class_completion_rate = (today_class_submissions / today_class_expected_submissions * 100) if today_class_expected_submissions > 0 else 0
+    
+    return dict(class_students=class_students,
+                class_assignments=class_assignments,
+                class_submissions=class_submissions,
+                class_completion_rate=class_completion_rate,
+                today_class_submissions=today_class_submissions,
+                today_class_expected_submissions=today_class_expected_submissions,
+                today_class_completion_rate=today_class_completion_rate)
+
+
+def _load_overview_dashboard(page):
+    # 统计查询在开启快照时读取快照
+    analytics = AnalyticsConnection()
+    with analytics as c:
+        # 学生、教师、作业、提交总数从统计表读取
+        totals = get_stats(c, 'total', '')
+        total_students = totals.get('students', 0)
+        total_teachers = totals.get('teachers', 0)
+        total_assignments = totals.get('assignments', 0)
+        total_submissions = totals.get('submissions', 0)
+        
+        # 学生、教师概览只取前几条
+        c.execute("SELECT * FROM users WHERE role = 'student' ORDER BY class_id, name, id_card_last8 LIMIT ?", (DASHBOARD_PREVIEW_SIZE,))
+        students = c.fetchall()
+        
+        c.execute("SELECT * FROM users WHERE role = 'teacher' ORDER BY class_id, name LIMIT ?", (DASHBOARD_PREVIEW_SIZE,))
+        teachers = c.fetchall()
+        
+        # 分页获取作业，提交数和作业所属班级的学生数从统计表关联读取
+        c.execute("""SELECT a.id, a.title, a.created_at, a.deadline,
+                            COALESCE(sc.value, 0), COALESCE(cc.value, 0)
+                     FROM (SELECT * FROM assignments ORDER BY deadline DESC, id DESC LIMIT ? OFFSET ?) a
+                     LEFT JOIN stats sc ON sc.scope = 'assignment' AND sc.scope_key = CAST(a.id AS TEXT) AND sc.metric = 'submissions'
+                     LEFT JOIN stats cc ON cc.scope = 'class' AND cc.scope_key = a.class_id AND cc.metric = 'students'
+                     ORDER BY a.deadline DESC, a.id DESC""",
+                  (DASHBOARD_ASSIGNMENTS_PER_PAGE, (page - 1) * DASHBOARD_ASSIGNMENTS_PER_PAGE))
+        assignment_data = []
+        for assignment_id, title, created_at, deadline, submission_count, student_count in c.fetchall():
+            # 提交率的分母是作业所属班级的学生数
+            completion_rate = (submission_count / student_count * 100) if student_count > 0 else 0
+            assignment_data.append({
+                'id': assignment_id,
+                'title': title,
+                'assigned_date': created_at,
+                'due_date': deadline,
+                'completion_rate': completion_rate
+            })
+        
+        # 获取提交时间数据
+        c.execute("SELECT scope_key, value FROM stats WHERE scope = 'day' AND metric = 'submissions' AND value > 0 ORDER BY scope_key")
+        submission_stats = c.fetchall()
+        submission_dates = [stat[0] for stat in submission_stats]
+        submission_counts = [stat[1] for stat in submission_stats]
+        
+        # 获取班级提交数
+        c.execute("SELECT scope_key, value FROM stats WHERE scope = 'class' AND metric = 'submissions' AND value > 0 ORDER BY scope_key")
+        class_stats = c.fetchall()
+        class_names = [stat[0] for stat in class_stats]
+        class_submission_counts = [stat[1] for stat in class_stats]
+    
+    total_pages = max((total_assignments + DASHBOARD_ASSIGNMENTS_PER_PAGE - 1) // DASHBOARD_ASSIGNMENTS_PER_PAGE, 1)
+    
+    return dict(total_students=total_students,
+                total_teachers=total_teachers,
+                total_assignments=total_assignments,
+                total_submissions=total_submissions,
+                students=students,
+                teachers=teachers,
+                assignments=assignment_data,
+                page=page,
+                total_pages=total_pages,
+                preview_size=DASHBOARD_PREVIEW_SIZE,
+                submission_dates=submission_dates,
+                submission_counts=submission_counts,
+                class_names=class_names,
+                class_submission_counts=class_submission_counts,
+                as_of=analytics.as_of)
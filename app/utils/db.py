@@ -1,21 +1,239 @@
 import sqlite3
-import os
+import threading
+import time
+from flask import g, has_app_context
+from app.utils.migrations import run_migrations
+from app.utils.profiling import wrap_cursor
+from app.utils.metrics import DB_POOL_TIMEOUTS, DB_POOL_WAIT
+
+# 默认数据库文件和连接池配置，可通过 app.config 覆盖
+DEFAULT_DATABASE = 'todo_school.db'
+DEFAULT_POOL_SIZE = 5
+DEFAULT_POOL_TIMEOUT = 30
+DEFAULT_PROFILE = 'concurrent'
+
+# 存储配置：创建连接时执行的 PRAGMA，通过 app.config['DB_PROFILE'] 选择
+# default    保持 SQLite 默认设置（回滚日志）
+# concurrent WAL 日志，读写互不阻塞，适合截止时间前的集中提交
+STORAGE_PROFILES = {
+    'default': {},
+    'concurrent': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'mmap_size': 134217728,
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+# 创建数据库连接并应用存储配置
+def connect(database, profile=DEFAULT_PROFILE, timeout=DEFAULT_POOL_TIMEOUT, pragmas=None):
+    conn = sqlite3.connect(database, timeout=timeout, check_same_thread=False)
+    settings = dict(STORAGE_PROFILES[profile])
+    settings.update(pragmas or {})
+    for name, value in settings.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+# 数据库连接池
+# 连接创建后可重复使用，避免每个 with 块都重新打开数据库文件、解析表结构
+class ConnectionPool:
+    def __init__(self, database=DEFAULT_DATABASE, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT,
+                 profile=DEFAULT_PROFILE, pragmas=None):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.profile = profile
+        self.pragmas = pragmas or {}
+        # 空闲连接（后进先出）；归还或关闭连接时通过 _available 唤醒等待的线程
+        self._idle = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        # 每次 close_all 后递增，归还的旧连接直接关闭
+        self._generation = 0
+        # 统计信息
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _connect(self):
+        return connect(self.database, self.profile, self.timeout, self.pragmas)
+
+    def acquire(self):
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        conn = None
+        with self._available:
+            # 连接已用完时等待其他请求归还或关闭连接，每次被唤醒后重新检查
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    DB_POOL_TIMEOUTS.inc()
+                    raise sqlite3.OperationalError('数据库连接池已满，等待超时')
+                self._available.wait(remaining)
+            if self._idle:
+                conn, generation = self._idle.pop()
+            else:
+                self._created += 1
+                generation = self._generation
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._discard(None)
+                raise
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        DB_POOL_WAIT.observe(waited)
+        return _PooledConnection(conn, generation)
+
+    def release(self, pooled):
+        conn = pooled.conn
+        # 未提交的事务一律回滚，保证下次取出时是干净的连接
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._available:
+            if pooled.generation == self._generation:
+                self._idle.append((conn, pooled.generation))
+                self._available.notify()
+                return
+        self._discard(conn)
+
+    # 关闭连接并空出一个位置，唤醒一个等待的线程创建新连接
+    def _discard(self, conn):
+        try:
+            if conn is not None:
+                conn.close()
+        finally:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+
+    def close_all(self):
+        with self._available:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'total_wait': self.total_wait,
+                'max_wait': self.max_wait,
+                'avg_wait': self.total_wait / self.checkouts if self.checkouts else 0.0,
+            }
+
+
+class _PooledConnection:
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+
+
+_pool = ConnectionPool()
+# 上传文件目录，数据库迁移时需要（例如把旧的文本文件移入数据库）
+_upload_folder = None
+
+
+def get_pool():
+    return _pool
+
+
+# 根据应用配置初始化连接池，并在请求结束时归还连接
+def init_app(app):
+    global _pool, _upload_folder
+    _upload_folder = app.config.get('UPLOAD_FOLDER')
+    _pool.close_all()
+    _pool = ConnectionPool(
+        database=app.config.get('DATABASE', DEFAULT_DATABASE),
+        size=app.config.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+        timeout=app.config.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT),
+        profile=app.config.get('DB_PROFILE', DEFAULT_PROFILE),
+        pragmas=app.config.get('DB_PRAGMAS'),
+    )
+    app.teardown_appcontext(release_connection)
+
+
+# 获取当前请求使用的连接；同一请求内嵌套的 with 块共用一个连接。
+# 最外层的 DatabaseConnection 退出时就归还连接，请求在接收上传文件、渲染模板时不占用连接；
+# 直接调用 get_connection 取得的连接在请求结束时归还
+def get_connection():
+    if not has_app_context():
+        return None
+    if 'db_conn' not in g:
+        g.db_conn = _pool.acquire()
+        g.db_depth = 0
+    return g.db_conn.conn
+
+
+def release_connection(exception=None):
+    if not has_app_context():
+        return
+    g.pop('db_depth', None)
+    pooled = g.pop('db_conn', None)
+    if pooled is not None:
+        _pool.release(pooled)
+
 
 # 数据库连接上下文管理器
 class DatabaseConnection:
     def __enter__(self):
-        self.conn = sqlite3.connect('todo_school.db')
-        self.c = self.conn.cursor()
+        conn = get_connection()
+        # 不在请求内（如命令行脚本）时单独从连接池取连接，退出时归还
+        self.pooled = None
+        if conn is None:
+            self.pooled = _pool.acquire()
+            conn = self.pooled.conn
+        else:
+            g.db_depth += 1
+        self.conn = conn
+        # 开启性能统计或慢查询日志时记录每条 SQL 的耗时和读取的行数
+        self.c = wrap_cursor(self.conn.cursor())
         return self.c
-    
+
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type is None:
-            self.conn.commit()
-        self.conn.close()
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.c.close()
+            if self.pooled is not None:
+                _pool.release(self.pooled)
+            else:
+                self._leave()
+
+    # 最外层的 with 块退出时归还请求的连接
+    def _leave(self):
+        depth = g.get('db_depth', 1) - 1
+        if depth <= 0:
+            release_connection()
+        else:
+            g.db_depth = depth
 
 # 初始化数据库
-def init_db():
-    conn = sqlite3.connect('todo_school.db')
+def init_db(database=None, profile=None, upload_folder=None):
+    conn = connect(database or _pool.database, profile or _pool.profile, _pool.timeout, _pool.pragmas)
     c = conn.cursor()
     
     # 用户表
@@ -59,12 +277,35 @@ def init_db():
              )''')
     
     conn.commit()
+    
+    # 执行数据库迁移（索引等）
+    run_migrations(conn, upload_folder or _upload_folder)
     conn.close()
 
 # 重置数据库
+# 在原数据库文件中删除所有表后重新建表：其他工作进程连接池中的连接仍指向这个文件，
+# 删除文件会让它们继续读写已删除的旧文件
 def reset_db():
-    # 删除数据库文件
-    if os.path.exists('todo_school.db'):
-        os.remove('todo_school.db')
+    # 当前请求的连接可能还有未提交的事务，先归还，避免下面的写事务等待它
+    release_connection()
+    conn = connect(_pool.database, _pool.profile, _pool.timeout, _pool.pragmas)
+    try:
+        # 外键检查不能在事务中修改；删除表时不检查引用关系
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 删除表时同时删除其索引和触发器
+            objects = conn.execute("SELECT type, name FROM sqlite_master WHERE type IN ('view', 'table') "
+                                   "AND name NOT LIKE 'sqlite_%' ORDER BY type = 'table'").fetchall()
+            for kind, name in objects:
+                conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+            # 迁移从头执行
+            conn.execute("PRAGMA user_version = 0")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
     # 重新初始化数据库
     init_db()
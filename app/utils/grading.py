@@ -0,0 +1,90 @@
+# 批量评分
+# 教师或组长在提交列表页面一次保存整页的评分：一条查询检查所有提交的评分权限，
+# 只更新评分有变化的提交，用 executemany 在同一个事务中写入
+
+SCORES = ('优秀', '良好', '合格', '不合格')
+
+# 每条权限查询最多包含的提交 id 数（SQLite 的参数个数有上限）
+QUERY_CHUNK_SIZE = 500
+
+
+class GradingError(Exception):
+    pass
+
+
+# 从表单中读取评分：字段名为 score-<提交 id>，值为空表示不评分
+def scores_from_form(form):
+    scores = []
+    for key, value in form.items():
+        if key.startswith('score-') and value:
+            try:
+                scores.append((int(key[len('score-'):]), value))
+            except ValueError:
+                raise GradingError(f'无法识别的字段: {key}')
+    return scores
+
+
+# 从 JSON 中读取评分：{"scores": [{"id": 提交 id, "score": 评分}, ...]}
+def scores_from_json(data):
+    if not isinstance(data, dict) or not isinstance(data.get('scores'), list):
+        raise GradingError('请求格式应为 {"scores": [{"id": 提交id, "score": 评分}]}')
+    scores = []
+    for item in data['scores']:
+        # bool 是 int 的子类，true/false 不能当作提交 id
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int) or isinstance(item['id'], bool):
+            raise GradingError(f'评分项格式不正确: {item}')
+        scores.append((item['id'], item.get('score')))
+    return scores
+
+
+# 查询提交所属的班级、小组和当前评分：{提交 id: (班级, 小组, 评分)}
+def _load_submissions(c, submission_ids):
+    found = {}
+    for start in range(0, len(submission_ids), QUERY_CHUNK_SIZE):
+        chunk = submission_ids[start:start + QUERY_CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        c.execute(f'''SELECT s.id, a.class_id, u.class_id, u.group_id, s.score
+                      FROM submissions s
+                      JOIN assignments a ON s.assignment_id = a.id
+                      JOIN users u ON s.student_id = u.id
+                      WHERE s.id IN ({placeholders})''', chunk)
+        for submission_id, assignment_class_id, student_class_id, group_id, score in c.fetchall():
+            found[submission_id] = (assignment_class_id, student_class_id, group_id, score)
+    return found
+
+
+# 保存评分
+# scores: [(提交 id, 评分)]，同一提交出现多次时以最后一次为准；
+# class_id: 评分人只能评本班作业的提交；group_id 不为空时（组长）还只能评同组同学的提交，
+# 组长没有小组时由调用者拒绝，不能传入 None（None 表示教师）
+# 返回 {'updated': [(提交 id, 评分)], 'unchanged': 数量, 'rejected': [(提交 id, 原因)]}
+def apply_scores(c, scores, scorer_id, class_id, group_id=None):
+    report = {'updated': [], 'unchanged': 0, 'rejected': []}
+    wanted = {}
+    for submission_id, score in scores:
+        if score not in SCORES:
+            report['rejected'].append((submission_id, f'评分不正确: {score}'))
+            wanted.pop(submission_id, None)
+            continue
+        wanted[submission_id] = score
+
+    found = _load_submissions(c, list(wanted))
+    updates = []
+    for submission_id, score in wanted.items():
+        if submission_id not in found:
+            report['rejected'].append((submission_id, '提交不存在'))
+            continue
+        assignment_class_id, student_class_id, student_group_id, current = found[submission_id]
+        if assignment_class_id != class_id or (
+                group_id is not None and (student_class_id != class_id or student_group_id != group_id)):
+            report['rejected'].append((submission_id, '没有评分权限'))
+            continue
+        if current == score:
+            report['unchanged'] += 1
+            continue
+        updates.append((score, scorer_id, submission_id))
+        report['updated'].append((submission_id, score))
+
+    if updates:
+        c.executemany("UPDATE submissions SET score = ?, scorer_id = ? WHERE id = ?", updates)
+    return report
@@ -0,0 +1,48 @@
+from collections import namedtuple
+from app.utils.cache import get_cache
+from app.utils.db import DatabaseConnection
+
+# 用户身份缓存
+# 登录后每个请求都要确认用户的角色、班级、小组和是否是组长，这些信息很少变化，
+# 缓存在 identity 命名空间中（带过期时间），权限检查通常不需要查询数据库；
+# 修改用户信息（导入学生更新小组、重置系统等）后需要调用 invalidate_identity
+
+DEFAULT_CACHE_TTL = 300
+
+Identity = namedtuple('Identity', ['user_id', 'name', 'role', 'class_id', 'group_id', 'is_group_leader'])
+
+_cache = get_cache('identity', DEFAULT_CACHE_TTL)
+
+
+# 从数据库读取用户身份，用户不存在时返回 None
+def load_identity(c, user_id):
+    c.execute("SELECT id, name, role, class_id, group_id, is_group_leader FROM users WHERE id = ?", (user_id,))
+    row = c.fetchone()
+    if row is None:
+        return None
+    user_id, name, role, class_id, group_id, is_group_leader = row
+    return Identity(user_id, name, role, class_id, group_id, bool(is_group_leader))
+
+
+# 登录时写入缓存
+def remember_identity(identity):
+    _cache.set(identity.user_id, identity)
+
+
+# 获取用户身份，先查缓存，没有时查询数据库
+def get_identity(user_id):
+    identity = _cache.get(user_id)
+    if identity is None:
+        with DatabaseConnection() as c:
+            identity = load_identity(c, user_id)
+        if identity is not None:
+            _cache.set(user_id, identity)
+    return identity
+
+
+# 用户信息修改后清除缓存，user_id 为空时清除所有用户
+def invalidate_identity(user_id=None):
+    if user_id is None:
+        _cache.clear()
+    else:
+        _cache.delete(user_id)
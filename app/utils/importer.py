@@ -0,0 +1,135 @@
+import codecs
+import csv
+
+# 通过 CSV 批量导入学生
+# 按块读取上传的文件并增量解码，不把整个文件读入内存；
+# 同一班级中姓名和身份证后8位相同的学生视为同一人，重复导入时更新小组而不是新建，
+# 新增和更新分批用 executemany 执行，整个导入在同一个事务中
+# 是否已存在由导入开始时读取的班级名单判断，数据库中没有对应的唯一约束：
+# JOB_WORKERS 大于 1 时，同时执行的两个导入任务可能重复新增同一个学生
+
+READ_CHUNK_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 500
+
+# CSV 的表头行（第一列），导入时跳过
+HEADER_NAMES = ('姓名', 'name')
+
+
+class CSVImportError(Exception):
+    pass
+
+
+# 根据文件开头判断编码：有 BOM 时按 BOM，能按 UTF-8 解码时为 UTF-8，否则按 GB18030（兼容 GBK）
+def detect_encoding(head):
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # 块的末尾可能截断了一个多字节字符
+        if e.reason != 'unexpected end of data':
+            return 'gb18030'
+    return 'utf-8'
+
+
+# 逐行读取文件，每行保留换行符，供 csv.reader 处理引号中的换行
+def iter_text_lines(stream, chunk_size=READ_CHUNK_SIZE):
+    chunk = stream.read(chunk_size)
+    encoding = detect_encoding(chunk)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    try:
+        while chunk:
+            lines = (pending + decoder.decode(chunk)).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+            chunk = stream.read(chunk_size)
+        pending += decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise CSVImportError(f'文件编码无法识别（按 {encoding} 解码失败），请保存为 UTF-8 或 GBK 编码')
+    if pending:
+        yield pending
+
+
+# 检查一行数据，返回 (姓名, 班级, 小组, 身份证后8位)，数据不正确时抛出 ValueError
+def parse_row(row, class_id=None):
+    if len(row) < 4:
+        raise ValueError('列数不足，应为：姓名,班级,小组,身份证后8位')
+    name = row[0].strip()
+    class_id = class_id or row[1].strip()
+    group_id = row[2].strip()
+    id_card_last8 = row[3].strip()
+    if not name:
+        raise ValueError('姓名为空')
+    if not class_id:
+        raise ValueError('班级为空')
+    if group_id and not group_id.isdigit():
+        raise ValueError(f'小组必须是数字：{group_id}')
+    if len(id_card_last8) != 8:
+        raise ValueError(f'身份证后8位长度不正确：{id_card_last8}')
+    return name, class_id, int(group_id) if group_id else None, id_card_last8
+
+
+def _load_class_students(c, class_id):
+    c.execute("SELECT name, id_card_last8, group_id FROM users WHERE role = 'student' AND class_id = ?", (class_id,))
+    return {(name, id_card_last8): group_id for name, id_card_last8, group_id in c.fetchall()}
+
+
+# 导入学生，class_id 不为空时所有学生都导入到这个班级（教师导入本班学生）
+# progress 不为空时，每批写入后以已读取的行数调用
+# 返回 {'inserted': 新增数, 'updated': 更新数, 'unchanged': 未变化数, 'rejected': [(行号, 原因)]}
+def import_students(c, stream, class_id=None, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    report = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': []}
+    # 每个班级已有的学生：{班级: {(姓名, 身份证后8位): 小组}}
+    existing = {}
+    inserts = []
+    updates = []
+
+    def flush():
+        # 先新增再更新，文件中后出现的同一学生会更新前面新增的记录
+        if inserts:
+            c.executemany("INSERT INTO users (name, class_id, group_id, id_card_last8, role) VALUES (?, ?, ?, ?, 'student')", inserts)
+            inserts.clear()
+        if updates:
+            c.executemany("UPDATE users SET group_id = ? WHERE role = 'student' AND class_id = ? AND name = ? AND id_card_last8 = ?", updates)
+            updates.clear()
+
+    reader = csv.reader(iter_text_lines(stream))
+    for row in reader:
+        line = reader.line_num
+        if not any(field.strip() for field in row):
+            continue
+        if line == 1 and row[0].strip().lower() in HEADER_NAMES:
+            continue
+        try:
+            name, row_class_id, group_id, id_card_last8 = parse_row(row, class_id)
+        except ValueError as e:
+            report['rejected'].append((line, str(e)))
+            continue
+
+        if row_class_id not in existing:
+            existing[row_class_id] = _load_class_students(c, row_class_id)
+        students = existing[row_class_id]
+        key = (name, id_card_last8)
+        if key not in students:
+            inserts.append((name, row_class_id, group_id, id_card_last8))
+            report['inserted'] += 1
+        elif str(students[key]) == str(group_id):
+            report['unchanged'] += 1
+            continue
+        else:
+            updates.append((group_id, row_class_id, name, id_card_last8))
+            report['updated'] += 1
+        students[key] = group_id
+
+        if len(inserts) + len(updates) >= batch_size:
+            flush()
+            if progress:
+                progress(reader.line_num)
+    flush()
+    if progress:
+        progress(reader.line_num)
+    return report
@@ -0,0 +1,155 @@
+import json
+import sqlite3
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.db import DatabaseConnection
+
+# 后台任务队列
+# 导入学生、重置系统、补充数据等耗时操作放入进程内的线程池执行，请求立即返回任务 id，
+# 页面轮询 /admin/jobs/<id> 查看进度；任务的状态和结果保存在 jobs 表中，
+# 运行中的进度只保存在内存中（进度写入数据库会与任务本身的写事务争用锁）
+#
+# status: queued（排队）、running（执行中）、succeeded（完成）、failed（失败）
+
+# 任务类型 -> 执行函数，执行函数的参数是 Job 和提交任务时的 params，返回值作为任务结果
+JOB_HANDLERS = {}
+
+_executor = None
+_running = {}
+_lock = threading.Lock()
+
+
+# 注册任务类型
+def job_handler(kind):
+    def decorator(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return decorator
+
+
+class Job:
+    def __init__(self, job_id, kind, params):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.done = 0
+        self.total = None
+        self.message = ''
+
+    # 更新进度，供任务执行函数调用
+    def set_progress(self, done, total=None, message=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+
+    def progress(self):
+        return {'done': self.done, 'total': self.total, 'message': self.message}
+
+
+def _get_executor(workers):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+    return _executor
+
+
+def _finish(job, status, result=None, error=None):
+    with DatabaseConnection() as c:
+        values = (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error)
+        c.execute('''UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+                     WHERE id = ?''', values + (job.id,))
+        # 重置系统会删除数据库，任务记录需要重新写入
+        if c.rowcount == 0:
+            c.execute('''INSERT INTO jobs (status, result, error, id, kind, params, started_at, finished_at)
+                         VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)''',
+                      values + (job.id, job.kind, json.dumps(job.params, ensure_ascii=False)))
+
+
+def _run(app, job):
+    with app.app_context():
+        try:
+            with DatabaseConnection() as c:
+                c.execute("UPDATE jobs SET status = 'running', started_at = CURRENT_TIMESTAMP WHERE id = ?", (job.id,))
+            result = JOB_HANDLERS[job.kind](job, **job.params)
+            _finish(job, 'succeeded', result=result)
+        except Exception as e:
+            traceback.print_exc()
+            _finish(job, 'failed', error=str(e))
+        finally:
+            with _lock:
+                _running.pop(job.id, None)
+
+
+# 提交任务，返回任务 id
+def submit_job(app, kind, params=None, created_by=None):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'未知的任务类型: {kind}')
+    params = params or {}
+    job = Job(uuid.uuid4().hex, kind, params)
+    with DatabaseConnection() as c:
+        c.execute("INSERT INTO jobs (id, kind, params, created_by) VALUES (?, ?, ?, ?)",
+                  (job.id, kind, json.dumps(params, ensure_ascii=False), created_by))
+    with _lock:
+        _running[job.id] = job
+    _get_executor(app.config.get('JOB_WORKERS', 1)).submit(_run, app, job)
+    return job.id
+
+
+def _job_dict(row):
+    job_id, kind, status, params, result, error, created_by, created_at, started_at, finished_at = row
+    job = {
+        'id': job_id,
+        'kind': kind,
+        'status': status,
+        'params': json.loads(params) if params else {},
+        'result': json.loads(result) if result else None,
+        'error': error,
+        'created_by': created_by,
+        'created_at': created_at,
+        'started_at': started_at,
+        'finished_at': finished_at,
+        'progress': None,
+    }
+    with _lock:
+        running = _running.get(job_id)
+    if running is not None:
+        job['progress'] = running.progress()
+    return job
+
+
+JOB_COLUMNS = 'id, kind, status, params, result, error, created_by, created_at, started_at, finished_at'
+
+
+# 获取任务状态，不存在时返回 None
+def get_job(c, job_id):
+    try:
+        c.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        row = c.fetchone()
+    except sqlite3.OperationalError:
+        # 重置系统时数据库文件被删除、还没有重新创建表
+        row = None
+    if row:
+        return _job_dict(row)
+    # 重置系统执行期间数据库中暂时没有任务记录
+    with _lock:
+        running = _running.get(job_id)
+    if running is None:
+        return None
+    return _job_dict((running.id, running.kind, 'running', json.dumps(running.params), None, None, None, None, None, None))
+
+
+# 最近的任务
+def list_jobs(c, limit=50):
+    c.execute(f"SELECT {JOB_COLUMNS} FROM jobs ORDER BY created_at DESC, rowid DESC LIMIT ?", (limit,))
+    return [_job_dict(row) for row in c.fetchall()]
+
+
+# 服务重启后，上次未完成的任务不会再执行，标记为失败
+def fail_interrupted_jobs(c):
+    c.execute('''UPDATE jobs SET status = 'failed', error = '服务重启，任务中断', finished_at = CURRENT_TIMESTAMP
+                 WHERE status IN ('queued', 'running')''')
+    return c.rowcount
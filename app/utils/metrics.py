@@ -0,0 +1,313 @@
+import json
+import os
+import threading
+import time
+import uuid
+from flask import g, request
+
+# Prometheus 格式的监控指标
+# 各处代码调用计数器、直方图记录数据，/metrics 按 Prometheus 文本格式输出，用于截止时间前后的容量规划。
+# gunicorn 等多个工作进程时，每个进程的数据只在自己的内存中：
+#   进程定期（METRICS_FLUSH_INTERVAL 秒）把自己的累计值写入同一台机器共用的 SQLite 文件 METRICS_PATH，
+#   每个进程一行（以 "<pid>-<随机 id>" 区分，fork 出的子进程重新生成），/metrics 输出所有进程的合计。
+#   已经退出的进程的累计值定期合并到 retired 一行，合计值不会因为工作进程重启而变小，文件也不会一直增大
+# METRICS_PATH 为 None 时只输出当前进程的数据
+
+DEFAULT_FLUSH_INTERVAL = 5
+# 合并已退出进程的数据的间隔（秒）
+PRUNE_INTERVAL = 60
+RETIRED_PROCESS = 'retired'
+DEFAULT_ALLOW = ('127.0.0.1', '::1')
+
+# 默认的直方图区间（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _new_process_id():
+    return f'{os.getpid()}-{uuid.uuid4().hex}'
+
+
+# 当前进程的 id；gunicorn --preload 等在导入后 fork 的子进程在 _after_fork 中重新生成
+PROCESS_ID = _new_process_id()
+
+# 当前进程的累计值：{(样本名, 标签): 值}，标签是排好序的 ((名称, 值), ...)
+_samples = {}
+_lock = threading.Lock()
+# 指标名称 -> 指标对象，按注册顺序输出
+_families = {}
+# 输出前调用的函数，返回当前进程的 [(样本名, 标签字典, 值)]，用于读取其他模块已有的统计
+_collectors = []
+
+
+def _labels(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _add(name, labels, amount):
+    with _lock:
+        _samples[(name, labels)] = _samples.get((name, labels), 0) + amount
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        _families[name] = self
+
+    def sample_names(self):
+        return (self.name,)
+
+    def inc(self, amount=1, **labels):
+        _add(self.name, _labels(labels), amount)
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        _families[name] = self
+
+    def sample_names(self):
+        return (f'{self.name}_bucket', f'{self.name}_sum', f'{self.name}_count')
+
+    def observe(self, value, **labels):
+        labels = _labels(labels)
+        # 区间是累计的：每个不小于 value 的上限都加 1
+        for bound in self.buckets:
+            if value <= bound:
+                _add(f'{self.name}_bucket', labels + (('le', _format_value(bound)),), 1)
+        _add(f'{self.name}_bucket', labels + (('le', '+Inf'),), 1)
+        _add(f'{self.name}_sum', labels, value)
+        _add(f'{self.name}_count', labels, 1)
+
+
+# 由收集函数提供数据的指标，只声明名称和类型
+class Collected:
+    def __init__(self, name, help, type='counter'):
+        self.name = name
+        self.help = help
+        self.type = type
+        _families[name] = self
+
+    def sample_names(self):
+        return (self.name,)
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+    return collector
+
+
+# 应用的指标
+SUBMISSIONS = Counter('homework_submissions_total', '学生提交、修改作业的次数')
+ASSIGNMENTS = Counter('homework_assignments_created_total', '教师布置作业的次数')
+UPLOAD_BYTES = Counter('homework_upload_bytes_total', '上传文件的字节数')
+UPLOADS = Counter('homework_uploads_total', '上传文件的个数')
+LOGIN_ATTEMPTS = Counter('homework_login_attempts_total', '登录次数')
+DB_POOL_WAIT = Histogram('homework_db_pool_wait_seconds', '从连接池获取数据库连接的等待时间',
+                         buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+DB_POOL_TIMEOUTS = Counter('homework_db_pool_timeouts_total', '等待数据库连接超时的次数')
+REQUEST_DURATION = Histogram('homework_http_request_duration_seconds', '请求的处理时间')
+CACHE_REQUESTS = Collected('homework_cache_requests_total', '缓存读取次数，result 为 hit、miss 或 error')
+
+
+@register_collector
+def _cache_samples():
+    from app.utils.cache import cache_stats
+    samples = []
+    for namespace, stats in cache_stats().items():
+        for result, key in (('hit', 'hits'), ('miss', 'misses'), ('error', 'errors')):
+            samples.append(('homework_cache_requests_total', {'namespace': namespace, 'result': result}, stats[key]))
+    return samples
+
+
+# 当前进程的全部样本（包括收集函数的数据）
+def local_samples():
+    with _lock:
+        samples = dict(_samples)
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector():
+                samples[(name, _labels(labels))] = value
+        except Exception as e:
+            print(f"收集监控指标错误: {e}")
+    return samples
+
+
+_config = {'path': None, 'flush_interval': DEFAULT_FLUSH_INTERVAL}
+_local = threading.local()
+_last_flush = 0.0
+_last_prune = 0.0
+
+
+# fork 出的子进程使用新的 id，不继承父进程的累计值（父进程的值在它自己的行中）和数据库连接
+def _after_fork():
+    global PROCESS_ID, _lock, _local, _last_flush, _last_prune
+    PROCESS_ID = _new_process_id()
+    # fork 时其他线程可能正持有锁
+    _lock = threading.Lock()
+    _samples.clear()
+    _local = threading.local()
+    _last_flush = _last_prune = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _process_alive(process):
+    # Windows 上 os.kill 会结束进程，不检查
+    if os.name == 'nt':
+        return True
+    pid, _, _ = process.partition('-')
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        # 没有权限发送信号，说明进程存在
+        pass
+    return True
+
+
+# 把已经退出的进程的累计值合并到 retired 一行并删除这些进程的行
+def prune(conn):
+    processes = [process for (process,) in conn.execute("SELECT DISTINCT process FROM metrics WHERE process NOT IN (?, ?)",
+                                                        (PROCESS_ID, RETIRED_PROCESS))]
+    dead = [process for process in processes if not _process_alive(process)]
+    if not dead:
+        return 0
+    placeholders = ', '.join('?' * len(dead))
+    conn.execute('BEGIN')
+    try:
+        conn.execute(f'''INSERT INTO metrics (process, name, labels, value, updated_at)
+                         SELECT ?, name, labels, SUM(value), MAX(updated_at) FROM metrics
+                         WHERE process IN ({placeholders}) GROUP BY name, labels
+                         ON CONFLICT (process, name, labels) DO UPDATE SET value = value + excluded.value,
+                                                                           updated_at = excluded.updated_at''',
+                     [RETIRED_PROCESS] + dead)
+        conn.execute(f"DELETE FROM metrics WHERE process IN ({placeholders})", dead)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return len(dead)
+
+
+def _conn():
+    from app.utils.db import connect
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = connect(_config['path'], 'concurrent', 5)
+        conn.isolation_level = None
+        conn.execute('''CREATE TABLE IF NOT EXISTS metrics (
+                     process TEXT NOT NULL,
+                     name TEXT NOT NULL,
+                     labels TEXT NOT NULL,
+                     value REAL NOT NULL,
+                     updated_at REAL NOT NULL,
+                     PRIMARY KEY (process, name, labels)
+                 ) WITHOUT ROWID''')
+        _local.conn = conn
+    return conn
+
+
+# 把当前进程的累计值写入共用的文件
+def flush():
+    global _last_flush, _last_prune
+    if not _config['path']:
+        return
+    _last_flush = time.monotonic()
+    now = time.time()
+    rows = [(PROCESS_ID, name, json.dumps(labels), value, now) for (name, labels), value in local_samples().items()]
+    conn = _conn()
+    conn.execute('BEGIN')
+    try:
+        conn.executemany('''INSERT OR REPLACE INTO metrics (process, name, labels, value, updated_at)
+                            VALUES (?, ?, ?, ?, ?)''', rows)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if _last_flush - _last_prune >= PRUNE_INTERVAL:
+        _last_prune = _last_flush
+        prune(conn)
+
+
+# 所有进程的合计值
+def aggregated_samples():
+    if not _config['path']:
+        return local_samples()
+    flush()
+    totals = {}
+    for name, labels, value in _conn().execute("SELECT name, labels, SUM(value) FROM metrics GROUP BY name, labels"):
+        totals[(name, tuple(tuple(pair) for pair in json.loads(labels)))] = value
+    return totals
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{key}="{_escape(val)}"' for key, val in labels) + '}'
+    return f'{name} {_format_value(value)}'
+
+
+def _bucket_order(item):
+    (_, labels), _ = item
+    le = dict(labels).get('le')
+    return (tuple(pair for pair in labels if pair[0] != 'le'), float('inf') if le == '+Inf' else float(le or 0))
+
+
+# 输出 Prometheus 文本格式
+def render(samples):
+    lines = []
+    for family in _families.values():
+        family_lines = []
+        for sample_name in family.sample_names():
+            items = [item for item in samples.items() if item[0][0] == sample_name]
+            items.sort(key=_bucket_order if sample_name.endswith('_bucket') else (lambda item: item[0][1]))
+            family_lines += [_format_sample(name, labels, value) for (name, labels), value in items]
+        if family_lines:
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.type}')
+            lines += family_lines
+    return '\n'.join(lines) + '\n'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unknown')
+    if _config['path'] and time.monotonic() - _last_flush >= _config['flush_interval']:
+        try:
+            flush()
+        except Exception as e:
+            print(f"写入监控指标错误: {e}")
+    return response
+
+
+def init_app(app):
+    _config.update(
+        path=app.config.get('METRICS_PATH'),
+        flush_interval=app.config.get('METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+    )
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,216 @@
+import os
+import re
+import sqlite3
+from app.utils.stats import create_stats_schema, rebuild_stats
+from app.utils.uploads import (ATTACHMENTS_TABLE, BLOBS_TABLE, BLOBS_TRIGGERS, IMAGE_VARIANTS_TABLE,
+                               IMAGE_VARIANTS_TRIGGER, backfill_attachments)
+
+# 数据库迁移
+# 每个迁移是 (版本号, 说明, 函数)，按版本号顺序执行；
+# 已执行到的版本记录在 PRAGMA user_version 中，重复启动不会重复执行
+# 迁移函数的参数是游标和 context（包含 upload_folder；需要在提交后执行的清理
+# 工作放入 context['after_commit']，迁移失败回滚时不会执行）
+
+# 同一学生对同一作业的多条提交只保留一条（优先保留已评分的，其次是最新的），为唯一索引做准备；
+# 其余的移到 submissions_archive 表中，不直接删除。返回移走的数量
+def _archive_duplicate_submissions(c):
+    c.execute('''SELECT id FROM (
+                     SELECT id, ROW_NUMBER() OVER (
+                         PARTITION BY assignment_id, student_id ORDER BY score IS NULL, id DESC
+                     ) AS position
+                     FROM submissions
+                 ) WHERE position > 1''')
+    duplicates = [(submission_id,) for (submission_id,) in c.fetchall()]
+    if not duplicates:
+        return 0
+    c.execute("CREATE TABLE IF NOT EXISTS submissions_archive AS SELECT * FROM submissions WHERE 0")
+    c.executemany("INSERT INTO submissions_archive SELECT * FROM submissions WHERE id = ?", duplicates)
+    c.executemany("DELETE FROM submissions WHERE id = ?", duplicates)
+    return len(duplicates)
+
+
+def _add_hot_query_indexes(c, context):
+    archived = _archive_duplicate_submissions(c)
+    if archived:
+        print(f"同一学生对同一作业有多条提交，已将其中 {archived} 条移到 submissions_archive 表")
+
+    # 登录：users WHERE name = ? AND class_id = ? AND role = ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_login ON users (name, class_id, role)")
+    # 按角色/班级统计和列出学生、教师（覆盖 ORDER BY class_id, name, id_card_last8）
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_role_class ON users (role, class_id, name, id_card_last8)")
+    # 同组查询：users.group_id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_class_group ON users (class_id, group_id)")
+
+    # 班级作业列表：assignments WHERE class_id = ? ORDER BY created_at DESC
+    c.execute("CREATE INDEX IF NOT EXISTS idx_assignments_class_created ON assignments (class_id, created_at)")
+    # 今日截止作业：assignments WHERE class_id = ? AND deadline = ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_assignments_class_deadline ON assignments (class_id, deadline)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_assignments_deadline ON assignments (deadline)")
+
+    # 每个学生对每个作业只有一条提交，同时覆盖 assignment_id 上的计数和 NOT IN 子查询
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_assignment_student ON submissions (assignment_id, student_id)")
+    # 评分分布：submissions WHERE assignment_id = ? GROUP BY score
+    c.execute("CREATE INDEX IF NOT EXISTS idx_submissions_assignment_score ON submissions (assignment_id, score)")
+    # 个人提交历史：submissions WHERE student_id = ? ORDER BY submitted_at
+    c.execute("CREATE INDEX IF NOT EXISTS idx_submissions_student_submitted ON submissions (student_id, submitted_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_submissions_submitted ON submissions (submitted_at)")
+
+
+def _add_stats_table(c, context):
+    # 统计表由触发器维护，创建后先用现有数据计算一次
+    create_stats_schema(c)
+    rebuild_stats(c)
+
+
+# 旧版本把提交的文本保存在 uploads/<uuid>.txt，submissions.content 中只保存 uuid
+LEGACY_CONTENT_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+# 把 uuid 对应的文本文件内容写入 submissions.content，返回 (写入的数量, 找不到文件的数量, 已写入的文本文件)
+# 找不到文件的提交保留 uuid，配置好 UPLOAD_FOLDER 后可以用 flask inline-submission-text 再次执行
+def inline_submission_text(c, upload_folder):
+    c.execute("SELECT id, content FROM submissions WHERE content IS NOT NULL")
+    legacy = [(submission_id, content) for submission_id, content in c.fetchall()
+              if LEGACY_CONTENT_PATTERN.match(content)]
+    if legacy and not upload_folder:
+        raise sqlite3.OperationalError('迁移提交文本需要配置 UPLOAD_FOLDER')
+
+    text_files = []
+    missing = 0
+    for submission_id, base_filename in legacy:
+        text_file_path = os.path.join(upload_folder, f"{base_filename}.txt")
+        if not os.path.exists(text_file_path):
+            missing += 1
+            continue
+        with open(text_file_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        text_files.append(text_file_path)
+        c.execute("UPDATE submissions SET content = ? WHERE id = ?", (text, submission_id))
+    return len(text_files), missing, text_files
+
+
+# 数据库提交成功后再删除文本文件
+def remove_text_files(text_files):
+    for text_file_path in text_files:
+        try:
+            os.remove(text_file_path)
+        except OSError as e:
+            print(f"删除文本文件错误: {e}")
+
+
+def _inline_submission_text(c, context):
+    upload_folder = context.get('upload_folder')
+    inlined, missing, text_files = inline_submission_text(c, upload_folder)
+    if missing:
+        print(f"有 {missing} 条提交在 {upload_folder} 中找不到文本文件，保留原来的 uuid；"
+              f"确认 UPLOAD_FOLDER 后执行 flask inline-submission-text")
+    context.setdefault('after_commit', []).append(lambda: remove_text_files(text_files))
+
+
+def _add_attachments_table(c, context):
+    c.execute(ATTACHMENTS_TABLE)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attachments_submission ON attachments (submission_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attachments_assignment ON attachments (assignment_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments (sha256)")
+    # 为已有的上传文件补充记录
+    upload_folder = context.get('upload_folder')
+    if upload_folder and os.path.isdir(upload_folder):
+        backfill_attachments(c, upload_folder)
+
+
+def _add_blobs_table(c, context):
+    c.execute(BLOBS_TABLE)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attachments_stored_name ON attachments (stored_name)")
+    for trigger in BLOBS_TRIGGERS:
+        c.execute(trigger)
+    # 根据已有的附件计算引用数
+    c.execute('''INSERT INTO blobs (sha256, stored_name, mime_type, byte_size, ref_count)
+                 SELECT sha256, MIN(stored_name), MIN(mime_type), MIN(byte_size), COUNT(*)
+                 FROM attachments WHERE sha256 IS NOT NULL GROUP BY sha256''')
+
+
+def _add_image_variants_table(c, context):
+    c.execute(IMAGE_VARIANTS_TABLE)
+
+
+def _add_jobs_table(c, context):
+    # 后台任务的状态和结果，见 app/utils/jobs.py
+    c.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                 id TEXT PRIMARY KEY,
+                 kind TEXT NOT NULL,
+                 status TEXT NOT NULL DEFAULT 'queued',
+                 params TEXT,
+                 result TEXT,
+                 error TEXT,
+                 created_by INTEGER,
+                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                 started_at DATETIME,
+                 finished_at DATETIME
+             )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)")
+
+
+def _add_listing_indexes(c, context):
+    # 键集分页的排序列，索引隐含 rowid（id）作为最后一列
+    # 学生列表：WHERE role = ? ORDER BY class_id, name, id 或 ORDER BY name, id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_role_class_name ON users (role, class_id, name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_role_name ON users (role, name)")
+    # 提交列表：WHERE assignment_id = ? ORDER BY submitted_at, id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_submissions_assignment_submitted ON submissions (assignment_id, submitted_at)")
+
+
+def _drop_orphaned_variants(c, context):
+    c.execute(IMAGE_VARIANTS_TRIGGER)
+    # 删除已经不被引用的图片的缩略图记录
+    c.execute("DELETE FROM image_variants WHERE sha256 NOT IN (SELECT sha256 FROM blobs)")
+
+
+def _restore_user_class_index(c, context):
+    # idx_users_role_class 在 name 之后是 id_card_last8，不能按 class_id, name, id 的顺序读出；
+    # 早先的迁移 10 删除了 idx_users_role_class_name，这里重新创建
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_role_class_name ON users (role, class_id, name)")
+
+
+MIGRATIONS = [
+    (1, '为登录、班级列表、提交查询添加索引，提交表 (assignment_id, student_id) 唯一', _add_hot_query_indexes),
+    (2, '添加由触发器维护的统计表 stats', _add_stats_table),
+    (3, '提交的文本从 uploads/<uuid>.txt 移入 submissions.content', _inline_submission_text),
+    (4, '添加附件表 attachments，记录上传文件的类型、大小、尺寸和 sha256', _add_attachments_table),
+    (5, '按内容寻址保存上传文件，添加引用计数表 blobs', _add_blobs_table),
+    (6, '添加图片缩略图表 image_variants', _add_image_variants_table),
+    (7, '添加后台任务表 jobs', _add_jobs_table),
+    (8, '为学生、提交列表的分页排序添加索引', _add_listing_indexes),
+    (9, '图片不再被引用时删除缩略图记录', _drop_orphaned_variants),
+    (10, '恢复学生列表按班级排序的索引 idx_users_role_class_name', _restore_user_class_index),
+]
+
+# 获取当前数据库版本
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# 执行所有未执行的迁移，返回执行后的版本号
+def run_migrations(conn, upload_folder=None):
+    current_version = get_schema_version(conn)
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+        # 每个迁移在单独的事务中执行，失败时回滚，版本号不变
+        isolation_level = conn.isolation_level
+        conn.isolation_level = None
+        context = {'upload_folder': upload_folder}
+        try:
+            conn.execute("BEGIN")
+            migrate(conn.cursor(), context)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.execute("COMMIT")
+        except Exception:
+            # 包括迁移中读取文件的错误（OSError、UnicodeDecodeError 等），不能留下未结束的事务
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.isolation_level = isolation_level
+        for callback in context.get('after_commit', []):
+            callback()
+        print(f"数据库迁移到版本 {version}: {description}")
+        current_version = version
+    return current_version
@@ -0,0 +1,167 @@
+import base64
+import json
+import math
+from collections import namedtuple
+
+# 列表分页
+# 使用键集分页（keyset / seek）：按排序列的值定位下一页，例如
+#   WHERE (class_id, name, id) > (?, ?, ?) ORDER BY class_id, name, id LIMIT ?
+# 可以直接在索引上定位，翻到第几页都不需要像 OFFSET 那样跳过前面所有的行。
+# 排序列最后一列必须唯一（通常是 id），且各列都不能为 NULL
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# items: 本页的行；next_cursor/prev_cursor: 下一页/上一页的游标，没有时为 None
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor', 'per_page'])
+
+
+def encode_cursor(values):
+    data = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    values = json.loads(data)
+    # 游标由 encode_cursor 生成，只包含排序列的值（字符串或数字）；被改过的游标按第一页处理
+    if not isinstance(values, list) or not all(_valid_cursor_value(value) for value in values):
+        raise ValueError('游标格式不正确')
+    return values
+
+
+# SQLite 能绑定的值：字符串、64 位整数和有限的浮点数
+def _valid_cursor_value(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return -2 ** 63 <= value < 2 ** 63
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return isinstance(value, str)
+
+
+# 以 prefix 开头的条件，写成范围查询以便使用索引
+def prefix_condition(column, prefix):
+    return f"{column} >= ? AND {column} < ?", [prefix, prefix + '\uffff']
+
+
+# 分页查询
+# select: 不含 WHERE 的查询；conditions/params: 过滤条件和参数；
+# order: [(排序列, 该列在结果行中的位置)]；after/before: 从哪一行之后/之前开始
+def paginate(c, select, conditions, params, order, after=None, before=None,
+             per_page=DEFAULT_PAGE_SIZE, descending=False):
+    conditions = list(conditions)
+    params = list(params)
+    cursor = before or after
+    values = None
+    if cursor:
+        try:
+            values = decode_cursor(cursor)
+        except ValueError:
+            values = None
+        if values is not None and len(values) != len(order):
+            values = None
+    # 向前翻页时按相反的顺序查询，再把结果倒过来
+    backwards = values is not None and bool(before)
+    reverse = descending != backwards
+
+    columns = ', '.join(column for column, _ in order)
+    if values is not None:
+        placeholders = ', '.join('?' * len(order))
+        conditions.append(f"({columns}) {'<' if reverse else '>'} ({placeholders})")
+        params.extend(values)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    order_by = ', '.join(f"{column} DESC" if reverse else column for column, _ in order)
+    c.execute(f"{select}{where} ORDER BY {order_by} LIMIT ?", params + [per_page + 1])
+    rows = c.fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def key(row):
+        return encode_cursor([row[index] for _, index in order])
+
+    if not rows:
+        return Page(rows, None, None, per_page)
+    if backwards:
+        return Page(rows, key(rows[-1]), key(rows[0]) if has_more else None, per_page)
+    return Page(rows, key(rows[-1]) if has_more else None, key(rows[0]) if values is not None else None, per_page)
+
+
+# 从请求参数中读取分页参数：after、before、per_page（不超过 MAX_PAGE_SIZE）
+def page_args(args):
+    per_page = args.get('per_page', DEFAULT_PAGE_SIZE, type=int)
+    return {
+        'after': args.get('after') or None,
+        'before': args.get('before') or None,
+        'per_page': min(max(per_page, 1), MAX_PAGE_SIZE),
+    }
+
+
+# 各列表的排序方式：名称 -> [(排序列, 在 SELECT * 结果行中的位置)]
+STUDENT_SORTS = {
+    'class': [('class_id', 2), ('name', 1), ('id', 0)],
+    'name': [('name', 1), ('id', 0)],
+}
+
+ASSIGNMENT_SORTS = {
+    'created': [('created_at', 7), ('id', 0)],
+    'deadline': [('deadline', 6), ('id', 0)],
+}
+
+SUBMISSION_SORTS = {
+    'submitted': [('s.submitted_at', 5), ('s.id', 0)],
+    'student': [('s.student_id', 2), ('s.id', 0)],
+}
+
+
+# 学生列表，可按班级、小组、姓名开头过滤
+def list_students(c, class_id=None, group_id=None, name_prefix=None, sort='class', descending=False, **page):
+    conditions = ["role = 'student'"]
+    params = []
+    if class_id:
+        conditions.append("class_id = ?")
+        params.append(class_id)
+    if group_id is not None:
+        conditions.append("group_id = ?")
+        params.append(group_id)
+    if name_prefix:
+        condition, values = prefix_condition('name', name_prefix)
+        conditions.append(condition)
+        params.extend(values)
+    return paginate(c, "SELECT * FROM users", conditions, params,
+                    STUDENT_SORTS.get(sort, STUDENT_SORTS['class']), descending=descending, **page)
+
+
+# 班级的作业列表，默认按布置时间倒序
+def list_assignments(c, class_id, title_prefix=None, sort='created', descending=True, **page):
+    conditions = ["class_id = ?"]
+    params = [class_id]
+    if title_prefix:
+        condition, values = prefix_condition('title', title_prefix)
+        conditions.append(condition)
+        params.extend(values)
+    return paginate(c, "SELECT * FROM assignments", conditions, params,
+                    ASSIGNMENT_SORTS.get(sort, ASSIGNMENT_SORTS['created']), descending=descending, **page)
+
+
+# 作业的提交列表，每行是 s.* 加上学生姓名、附件文件名和缩略图文件名
+def list_submissions(c, assignment_id, group_id=None, name_prefix=None, sort='submitted', descending=False, **page):
+    conditions = ["s.assignment_id = ?"]
+    params = [assignment_id]
+    if group_id is not None:
+        conditions.append("u.group_id = ?")
+        params.append(group_id)
+    if name_prefix:
+        condition, values = prefix_condition('u.name', name_prefix)
+        conditions.append(condition)
+        params.extend(values)
+    select = """SELECT s.*, u.name, t.stored_name, vj.stored_name, vw.stored_name FROM submissions s
+                JOIN users u ON s.student_id = u.id
+                LEFT JOIN attachments t ON t.submission_id = s.id
+                LEFT JOIN image_variants vj ON vj.sha256 = t.sha256 AND vj.variant = 'w320.jpg'
+                LEFT JOIN image_variants vw ON vw.sha256 = t.sha256 AND vw.variant = 'w320.webp'"""
+    return paginate(c, select, conditions, params,
+                    SUBMISSION_SORTS.get(sort, SUBMISSION_SORTS['submitted']), descending=descending, **page)
@@ -0,0 +1,272 @@
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import g, has_app_context, request
+from app.utils.slow_queries import check_slow_query, slow_query_enabled
+
+# 请求性能统计
+# 每个请求记录总耗时、SQL 语句数、SQL 耗时、读取的行数和上传目录的读写字节数：
+#   SQL 由 DatabaseConnection 返回的 ProfiledCursor 记录，上传文件的读写由保存、下载文件的代码调用 record_io 记录
+# 结果通过 Server-Timing 响应头返回（浏览器开发者工具的 Timing 中可以看到），
+# 并按路由保存最近 PERF_WINDOW 个请求，在 /admin/perf 页面查看分位数。
+# PERF_PROFILE_RATE 大于 0 时按比例用 cProfile 分析请求，耗时超过 PERF_SLOW_MS 的保存分析结果
+
+DEFAULT_WINDOW = 500
+DEFAULT_SLOW_MS = 500
+# 保存的慢请求分析结果数和每个结果显示的函数数
+SLOW_PROFILES = 20
+PROFILE_LINES = 30
+
+# 直方图的区间上限（毫秒）
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.wall = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.io_read = 0
+        self.io_written = 0
+        self.profiler = None
+
+
+# 当前请求的统计；不在请求中（命令行、后台任务）时返回 None
+def current_profile():
+    if not has_app_context():
+        return None
+    return g.get('request_profile')
+
+
+# 记录上传目录的读写字节数
+def record_io(read=0, written=0):
+    profile = current_profile()
+    if profile is not None:
+        profile.io_read += read
+        profile.io_written += written
+
+
+# 记录 SQL 耗时和行数的游标，其他属性（lastrowid、rowcount 等）直接使用原游标的
+# 一条语句的耗时包括执行和读取结果，执行下一条语句或关闭游标时检查是否是慢查询
+class ProfiledCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement = None
+        self._statement_time = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, method, *args, count=False):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._statement_time += elapsed
+            profile = current_profile()
+            if profile is not None:
+                profile.sql_time += elapsed
+                if count:
+                    profile.sql_count += 1
+
+    def _begin(self, sql, params, many):
+        self._finish()
+        self._statement = (sql, params, many)
+        self._statement_time = 0.0
+
+    def _finish(self):
+        if self._statement is not None:
+            sql, params, many = self._statement
+            self._statement = None
+            check_slow_query(self._cursor.connection, sql, params, many, self._statement_time)
+
+    def execute(self, sql, params=()):
+        self._begin(sql, params, False)
+        self._timed(self._cursor.execute, sql, params, count=True)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._begin(sql, seq_of_params, True)
+        self._timed(self._cursor.executemany, sql, seq_of_params, count=True)
+        return self
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def _count_rows(self, rows):
+        profile = current_profile()
+        if profile is not None:
+            profile.rows += rows
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        self._count_rows(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self._cursor.fetchmany, *(() if size is None else (size,)))
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._count_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self._timed(self._cursor.fetchone)
+            if row is None:
+                return
+            self._count_rows(1)
+            yield row
+
+
+# 每个路由最近的请求
+class RouteStats:
+    def __init__(self, window):
+        self.count = 0
+        self.samples = deque(maxlen=window)
+
+    def add(self, profile):
+        self.count += 1
+        self.samples.append((profile.wall, profile.sql_count, profile.sql_time, profile.rows,
+                             profile.io_read + profile.io_written))
+
+    def summary(self):
+        samples = list(self.samples)
+        n = len(samples)
+        walls = sorted(sample[0] * 1000 for sample in samples)
+        histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for wall in walls:
+            index = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS) if wall <= bound), len(HISTOGRAM_BUCKETS))
+            histogram[index] += 1
+        return {
+            'count': self.count,
+            'window': n,
+            'p50_ms': _percentile(walls, 50),
+            'p95_ms': _percentile(walls, 95),
+            'p99_ms': _percentile(walls, 99),
+            'max_ms': walls[-1] if walls else 0,
+            'avg_sql_count': sum(sample[1] for sample in samples) / n if n else 0,
+            'avg_sql_ms': sum(sample[2] for sample in samples) * 1000 / n if n else 0,
+            'avg_rows': sum(sample[3] for sample in samples) / n if n else 0,
+            'avg_io_bytes': sum(sample[4] for sample in samples) / n if n else 0,
+            'histogram': histogram,
+        }
+
+
+def _percentile(values, p):
+    if not values:
+        return 0
+    return values[min(int(p / 100 * len(values)), len(values) - 1)]
+
+
+_config = {'enabled': False, 'server_timing': True, 'window': DEFAULT_WINDOW,
+           'slow_ms': DEFAULT_SLOW_MS, 'rate': 0}
+_routes = {}
+_slow_profiles = deque(maxlen=SLOW_PROFILES)
+_lock = threading.Lock()
+
+
+def _before_request():
+    profile = g.request_profile = RequestProfile()
+    rate = _config['rate']
+    if rate and random.random() < rate:
+        profile.profiler = cProfile.Profile()
+        try:
+            profile.profiler.enable()
+        except ValueError:
+            # 同一线程中已经有其他分析器在运行
+            profile.profiler = None
+
+
+def _after_request(response):
+    profile = g.pop('request_profile', None)
+    if profile is None:
+        return response
+    profile.wall = time.perf_counter() - profile.start
+    if profile.profiler is not None:
+        profile.profiler.disable()
+        if profile.wall * 1000 >= _config['slow_ms']:
+            _save_slow_profile(profile)
+
+    route = request.endpoint or 'unknown'
+    with _lock:
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = RouteStats(_config['window'])
+        stats.add(profile)
+
+    if _config['server_timing']:
+        response.headers.add('Server-Timing', ', '.join([
+            f'app;dur={profile.wall * 1000:.1f}',
+            f'sql;dur={profile.sql_time * 1000:.1f};desc="{profile.sql_count} queries, {profile.rows} rows"',
+            f'io;desc="{profile.io_read + profile.io_written} bytes"',
+        ]))
+    return response
+
+
+def _save_slow_profile(profile):
+    output = io.StringIO()
+    pstats.Stats(profile.profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    with _lock:
+        _slow_profiles.appendleft({
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'wall_ms': profile.wall * 1000,
+            'sql_count': profile.sql_count,
+            'stats': output.getvalue(),
+        })
+
+
+def init_app(app):
+    _config.update(
+        enabled=app.config.get('PERF_ENABLED', True),
+        server_timing=app.config.get('PERF_SERVER_TIMING', True),
+        window=app.config.get('PERF_WINDOW', DEFAULT_WINDOW),
+        slow_ms=app.config.get('PERF_SLOW_MS', DEFAULT_SLOW_MS),
+        rate=app.config.get('PERF_PROFILE_RATE', 0),
+    )
+    if _config['enabled']:
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+
+
+def profiling_enabled():
+    return _config['enabled']
+
+
+# 开启性能统计或慢查询日志时返回记录耗时的游标，否则返回原游标
+def wrap_cursor(cursor):
+    if _config['enabled'] or slow_query_enabled():
+        return ProfiledCursor(cursor)
+    return cursor
+
+
+# 各路由的统计，按 p95 从高到低排列
+def route_stats():
+    with _lock:
+        routes = [(route, stats.summary()) for route, stats in _routes.items()]
+    return sorted(routes, key=lambda item: item[1]['p95_ms'], reverse=True)
+
+
+def slow_profiles():
+    with _lock:
+        return list(_slow_profiles)
+
+
+def reset_stats():
+    with _lock:
+        _routes.clear()
+        _slow_profiles.clear()
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+from collections import Counter
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import has_request_context, request
+
+# 慢查询日志
+# 一条 SQL（执行加上读取结果）的耗时超过 SLOW_QUERY_MS 毫秒时，把语句、参数的类型、耗时、所在的路由
+# 和 EXPLAIN QUERY PLAN 的结果写入 SLOW_QUERY_LOG（按大小轮转，每行一条 JSON）。
+# 管理员后台的慢查询报告读取日志，按规范化后的语句（去掉常量）分组，
+# 可以看出哪个路由的哪条语句在扫描整张表（查询计划中的 SCAN）
+
+DEFAULT_LOG = 'slow_queries.log'
+DEFAULT_LOG_BYTES = 1024 * 1024
+DEFAULT_LOG_BACKUPS = 5
+
+# 只分析这些语句的查询计划
+EXPLAIN_PREFIXES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+_config = {'threshold': None, 'path': DEFAULT_LOG, 'backups': DEFAULT_LOG_BACKUPS}
+_logger = logging.getLogger('app.slow_queries')
+_logger.propagate = False
+
+
+def init_app(app):
+    threshold = app.config.get('SLOW_QUERY_MS')
+    _config['threshold'] = threshold / 1000 if threshold else None
+    _config['path'] = app.config.get('SLOW_QUERY_LOG', DEFAULT_LOG)
+    _config['backups'] = app.config.get('SLOW_QUERY_LOG_BACKUPS', DEFAULT_LOG_BACKUPS)
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+        handler.close()
+    if _config['threshold']:
+        handler = RotatingFileHandler(_config['path'], encoding='utf-8', delay=True,
+                                      maxBytes=app.config.get('SLOW_QUERY_LOG_BYTES', DEFAULT_LOG_BYTES),
+                                      backupCount=_config['backups'])
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+
+
+def slow_query_enabled():
+    return _config['threshold'] is not None
+
+
+_STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_PATTERN = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_PATTERN = re.compile(r'IN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+# 规范化语句：常量替换为 ?，IN (?, ?, ...) 合并为 IN (...)，合并空白，用于分组
+def normalize_sql(sql):
+    sql = _STRING_PATTERN.sub('?', sql)
+    sql = _NUMBER_PATTERN.sub('?', sql)
+    sql = _IN_LIST_PATTERN.sub('IN (...)', sql)
+    return _SPACE_PATTERN.sub(' ', sql).strip()
+
+
+# 参数的类型，不记录参数的值，例如 "(int, str)"；executemany 为 "500 × (str, int)"
+def params_shape(params, many=False):
+    if many:
+        if not isinstance(params, (list, tuple)):
+            return 'many × ?'
+        return f"{len(params)} × {params_shape(params[0]) if params else '()'}"
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+
+# 查询计划，每行一个步骤，子步骤缩进
+def explain(conn, sql, params):
+    if not sql.lstrip().upper().startswith(EXPLAIN_PREFIXES):
+        return []
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as e:
+        return [f'无法分析: {e}']
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+
+# 由游标在语句结束时调用；seconds 是执行加读取结果的耗时
+def check_slow_query(conn, sql, params, many, seconds):
+    threshold = _config['threshold']
+    if threshold is None or seconds < threshold:
+        return
+    explain_params = params
+    if many:
+        explain_params = params[0] if isinstance(params, (list, tuple)) and params else None
+    plan = explain(conn, sql, explain_params) if explain_params is not None else []
+    entry = {
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'route': (request.endpoint or 'unknown') if has_request_context() else '-',
+        'duration_ms': round(seconds * 1000, 2),
+        'sql': normalize_sql(sql),
+        'params': params_shape(params, many),
+        'plan': plan,
+    }
+    try:
+        _logger.info(json.dumps(entry, ensure_ascii=False))
+    except Exception as e:
+        print(f"写入慢查询日志错误: {e}")
+
+
+# 读取日志（包括轮转的旧文件）
+def read_log(path=None):
+    path = path or _config['path']
+    paths = [f'{path}.{i}' for i in range(_config['backups'], 0, -1)] + [path]
+    entries = []
+    for log_path in paths:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    return entries
+
+
+# 按规范化后的语句分组，按总耗时从高到低排列
+def slow_query_report(entries):
+    groups = {}
+    for entry in entries:
+        group = groups.get(entry['sql'])
+        if group is None:
+            group = groups[entry['sql']] = {
+                'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'routes': Counter(), 'params': entry['params'], 'plan': entry['plan'], 'last_seen': entry['time'],
+            }
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        group['routes'][entry['route']] += 1
+        # 保留最近一次的查询计划
+        group['plan'] = entry['plan']
+        group['last_seen'] = entry['time']
+    report = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+    for group in report:
+        group['avg_ms'] = group['total_ms'] / group['count']
+        group['routes'] = group['routes'].most_common()
+        # 查询计划中整表扫描的表（有索引的是 SEARCH）
+        group['scans'] = sorted(filter(None, (_scanned_table(line) for line in group['plan'])))
+    return report
+
+
+# "SCAN users" 或旧版本 SQLite 的 "SCAN TABLE users" 中的表名
+def _scanned_table(line):
+    words = line.split()
+    if words[:1] != ['SCAN']:
+        return None
+    if words[1:2] == ['TABLE']:
+        words = words[1:]
+    # SCAN CONSTANT ROW、SCAN SUBQUERY 1 等不是表
+    if len(words) < 2 or words[1] in ('CONSTANT', 'SUBQUERY'):
+        return None
+    return words[1]
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from app.utils.db import DatabaseConnection, connect, get_pool
+from app.utils.profiling import wrap_cursor
+
+# 统计分析使用的数据库快照
+# 数据看板、作业分析等报表查询要扫描大量的行，开启 ANALYTICS_SNAPSHOT 后改为查询一个定期刷新的
+# 数据库副本（SQLite 在线备份），报表查询不再与提交作业的写入争用同一个数据库文件。
+# 先备份到临时文件，再原子替换快照文件，正在读取旧快照的查询不受影响；
+# 快照超过 ANALYTICS_MAX_STALENESS 秒时，下一次报表查询会先刷新快照，页面显示数据的时间
+
+DEFAULT_SNAPSHOT_PATH = 'todo_school.snapshot.db'
+DEFAULT_MAX_STALENESS = 300
+
+_enabled = False
+_path = DEFAULT_SNAPSHOT_PATH
+_max_staleness = DEFAULT_MAX_STALENESS
+_lock = threading.Lock()
+
+
+def init_app(app):
+    global _enabled, _path, _max_staleness
+    _enabled = app.config.get('ANALYTICS_SNAPSHOT', False)
+    _path = app.config.get('ANALYTICS_SNAPSHOT_PATH', DEFAULT_SNAPSHOT_PATH)
+    _max_staleness = app.config.get('ANALYTICS_MAX_STALENESS', DEFAULT_MAX_STALENESS)
+
+
+# 快照的生成时间（时间戳），没有快照时返回 None；多个工作进程共用快照文件，以文件修改时间为准
+def snapshot_time(path=None):
+    try:
+        return os.path.getmtime(path or _path)
+    except OSError:
+        return None
+
+
+# 刷新快照，返回快照的生成时间
+def refresh_snapshot(path=None):
+    path = path or _path
+    # 临时文件名包含进程和线程，多个进程同时刷新时互不影响，最后替换的生效
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    # 备份使用单独的连接：调用者通常在请求中，已经占用了连接池的一个连接，
+    # 再从连接池取连接时，多个报表请求会互相等待直到超时
+    pool = get_pool()
+    source = connect(pool.database, pool.profile, pool.timeout, pool.pragmas)
+    target = sqlite3.connect(temp_path)
+    try:
+        # 一次复制全部页面；WAL 模式下备份只占用一个读事务，不阻塞写入
+        source.backup(target)
+        # 快照只读，使用回滚日志，替换文件时不需要处理 -wal 文件
+        target.execute("PRAGMA journal_mode = DELETE")
+        target.close()
+        os.replace(temp_path, path)
+    except Exception:
+        target.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        source.close()
+    return snapshot_time(path)
+
+
+# 快照不存在或超过 max_staleness 秒时刷新，返回快照的生成时间
+def ensure_fresh(max_staleness=None):
+    if max_staleness is None:
+        max_staleness = _max_staleness
+    refreshed_at = snapshot_time()
+    if refreshed_at is None or time.time() - refreshed_at > max_staleness:
+        with _lock:
+            # 等待锁期间其他线程可能已经刷新
+            refreshed_at = snapshot_time()
+            if refreshed_at is None or time.time() - refreshed_at > max_staleness:
+                refreshed_at = refresh_snapshot()
+    return refreshed_at
+
+
+# 删除快照（如重置系统后），下一次报表查询时重新生成
+def remove_snapshot():
+    if os.path.exists(_path):
+        os.remove(_path)
+
+
+# 报表查询的连接上下文管理器，用法与 DatabaseConnection 相同，只能读取；
+# 未开启快照时直接使用主数据库。as_of 是数据的时间（datetime），页面用于显示数据的新旧
+class AnalyticsConnection:
+    def __enter__(self):
+        self.as_of = None
+        if not _enabled:
+            self._db = DatabaseConnection()
+            return self._db.__enter__()
+        self._db = None
+        self.as_of = datetime.fromtimestamp(ensure_fresh())
+        self.conn = sqlite3.connect(f"file:{_path}?mode=ro", uri=True, check_same_thread=False)
+        self.c = wrap_cursor(self.conn.cursor())
+        return self.c
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._db is not None:
+            return self._db.__exit__(exc_type, exc_val, exc_tb)
+        self.c.close()
+        self.conn.close()
+
+
+# 后台定时刷新快照，报表查询时就不需要等待刷新
+def start_scheduler(app, interval):
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    refresh_snapshot()
+            except Exception as e:
+                print(f"刷新数据库快照错误: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='analytics-snapshot', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,152 @@
+# 统计数据表
+# stats 表保存各种计数，由触发器在 users、assignments、submissions 写入时增量维护，
+# 页面只需按主键读取，不必每次对提交表做 COUNT(*)
+#
+# scope             scope_key       metric            含义
+# total             ''              students/teachers/assignments/submissions   全校总数
+# class             班级            students/teachers/assignments/submissions   班级计数
+# class_day         班级            日期 YYYY-MM-DD    班级当天的提交数
+# day               日期            submissions        全校当天的提交数
+# assignment        作业 id         submissions/scored 作业的提交数、已评分数
+# assignment_score  作业 id         评分               作业每个评分的人数
+
+STATS_TABLE = '''CREATE TABLE IF NOT EXISTS stats (
+                 scope TEXT NOT NULL,
+                 scope_key TEXT NOT NULL,
+                 metric TEXT NOT NULL,
+                 value INTEGER NOT NULL DEFAULT 0,
+                 PRIMARY KEY (scope, scope_key, metric)
+             ) WITHOUT ROWID'''
+
+# 重新计算统计数据的查询，每条返回 (scope, scope_key, metric, value)
+STATS_QUERIES = [
+    "SELECT 'total', '', role || 's', COUNT(*) FROM users GROUP BY role",
+    "SELECT 'class', class_id, role || 's', COUNT(*) FROM users GROUP BY class_id, role",
+    "SELECT 'total', '', 'assignments', COUNT(*) FROM assignments",
+    "SELECT 'class', class_id, 'assignments', COUNT(*) FROM assignments GROUP BY class_id",
+    "SELECT 'total', '', 'submissions', COUNT(*) FROM submissions",
+    """SELECT 'class', COALESCE(a.class_id, ''), 'submissions', COUNT(*)
+       FROM submissions s LEFT JOIN assignments a ON s.assignment_id = a.id
+       GROUP BY COALESCE(a.class_id, '')""",
+    """SELECT 'class_day', COALESCE(a.class_id, ''), COALESCE(DATE(s.submitted_at), ''), COUNT(*)
+       FROM submissions s LEFT JOIN assignments a ON s.assignment_id = a.id
+       GROUP BY COALESCE(a.class_id, ''), COALESCE(DATE(s.submitted_at), '')""",
+    "SELECT 'day', COALESCE(DATE(submitted_at), ''), 'submissions', COUNT(*) FROM submissions GROUP BY COALESCE(DATE(submitted_at), '')",
+    "SELECT 'assignment', assignment_id, 'submissions', COUNT(*) FROM submissions GROUP BY assignment_id",
+    "SELECT 'assignment', assignment_id, 'scored', COUNT(*) FROM submissions WHERE score IS NOT NULL GROUP BY assignment_id",
+    "SELECT 'assignment_score', assignment_id, score, COUNT(*) FROM submissions WHERE score IS NOT NULL GROUP BY assignment_id, score",
+]
+
+
+def _bump(scope, scope_key, metric, delta):
+    return f'''INSERT INTO stats (scope, scope_key, metric, value) VALUES ('{scope}', {scope_key}, {metric}, {delta})
+                   ON CONFLICT (scope, scope_key, metric) DO UPDATE SET value = value + excluded.value;'''
+
+
+def _submission_changes(row, delta):
+    class_id = f"COALESCE((SELECT class_id FROM assignments WHERE id = {row}.assignment_id), '')"
+    day = f"COALESCE(DATE({row}.submitted_at), '')"
+    return [
+        _bump('total', "''", "'submissions'", delta),
+        _bump('class', class_id, "'submissions'", delta),
+        _bump('class_day', class_id, day, delta),
+        _bump('day', day, "'submissions'", delta),
+        _bump('assignment', f'{row}.assignment_id', "'submissions'", delta),
+    ]
+
+
+def _score_changes(row, delta):
+    return [
+        _bump('assignment', f'{row}.assignment_id', "'scored'", delta),
+        _bump('assignment_score', f'{row}.assignment_id', f'{row}.score', delta),
+    ]
+
+
+def _user_changes(row, delta):
+    return [
+        _bump('total', "''", f"{row}.role || 's'", delta),
+        _bump('class', f'{row}.class_id', f"{row}.role || 's'", delta),
+    ]
+
+
+def _assignment_changes(row, delta):
+    return [
+        _bump('total', "''", "'assignments'", delta),
+        _bump('class', f'{row}.class_id', "'assignments'", delta),
+    ]
+
+
+# 触发器：(名称, 触发时机, 执行的语句)
+STATS_TRIGGERS = [
+    ('stats_users_insert', 'AFTER INSERT ON users', _user_changes('NEW', 1)),
+    ('stats_users_delete', 'AFTER DELETE ON users', _user_changes('OLD', -1)),
+    ('stats_users_update', 'AFTER UPDATE OF class_id, role ON users',
+     _user_changes('OLD', -1) + _user_changes('NEW', 1)),
+    ('stats_assignments_insert', 'AFTER INSERT ON assignments', _assignment_changes('NEW', 1)),
+    ('stats_assignments_delete', 'AFTER DELETE ON assignments', _assignment_changes('OLD', -1) + [
+        "DELETE FROM stats WHERE scope IN ('assignment', 'assignment_score') AND scope_key = OLD.id;"]),
+    ('stats_submissions_insert', 'AFTER INSERT ON submissions', _submission_changes('NEW', 1)),
+    ('stats_submissions_insert_score', 'AFTER INSERT ON submissions WHEN NEW.score IS NOT NULL', _score_changes('NEW', 1)),
+    ('stats_submissions_delete', 'AFTER DELETE ON submissions', _submission_changes('OLD', -1)),
+    ('stats_submissions_delete_score', 'AFTER DELETE ON submissions WHEN OLD.score IS NOT NULL', _score_changes('OLD', -1)),
+    ('stats_submissions_update', 'AFTER UPDATE OF assignment_id, submitted_at ON submissions',
+     _submission_changes('OLD', -1) + _submission_changes('NEW', 1)),
+    ('stats_submissions_update_old_score', 'AFTER UPDATE OF assignment_id, score ON submissions WHEN OLD.score IS NOT NULL',
+     _score_changes('OLD', -1)),
+    ('stats_submissions_update_new_score', 'AFTER UPDATE OF assignment_id, score ON submissions WHEN NEW.score IS NOT NULL',
+     _score_changes('NEW', 1)),
+]
+
+
+# 创建统计表和触发器
+def create_stats_schema(c):
+    c.execute(STATS_TABLE)
+    for name, timing, statements in STATS_TRIGGERS:
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+        body = '\n                '.join(statements)
+        c.execute(f'''CREATE TRIGGER {name} {timing}
+             BEGIN
+                {body}
+             END''')
+
+
+# 从原始数据计算统计值，返回 {(scope, scope_key, metric): value}
+def compute_stats(c):
+    expected = {}
+    for query in STATS_QUERIES:
+        c.execute(query)
+        for scope, scope_key, metric, value in c.fetchall():
+            expected[(scope, str(scope_key), str(metric))] = value
+    return expected
+
+
+# 清空并重新计算统计表
+def rebuild_stats(c):
+    c.execute("DELETE FROM stats")
+    for query in STATS_QUERIES:
+        c.execute(f"INSERT INTO stats (scope, scope_key, metric, value) {query}")
+
+
+# 比较统计表与重新计算的结果，返回不一致的 [(键, 统计表中的值, 实际值)]
+def check_stats(c):
+    expected = compute_stats(c)
+    c.execute("SELECT scope, scope_key, metric, value FROM stats WHERE value != 0")
+    actual = {(scope, scope_key, metric): value for scope, scope_key, metric, value in c.fetchall()}
+    differences = []
+    for key in sorted(set(expected) | set(actual)):
+        if expected.get(key, 0) != actual.get(key, 0):
+            differences.append((key, actual.get(key, 0), expected.get(key, 0)))
+    return differences
+
+
+# 读取一个统计值，不存在时为 0
+def get_stat(c, scope, scope_key, metric):
+    c.execute("SELECT value FROM stats WHERE scope = ? AND scope_key = ? AND metric = ?", (scope, str(scope_key), metric))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+
+# 读取某个范围的所有统计值，返回 {metric: value}
+def get_stats(c, scope, scope_key):
+    c.execute("SELECT metric, value FROM stats WHERE scope = ? AND scope_key = ?", (scope, str(scope_key)))
+    return dict(c.fetchall())
@@ -0,0 +1,133 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from app.utils.db import DatabaseConnection
+
+# 图片缩略图
+# 学生提交图片后，在进程池中把原图缩小成几种宽度（JPEG 和 WebP 各一份），
+# 批改页面显示缩略图，点击后再打开原图
+# 依赖 Pillow；没有安装时不生成缩略图，页面直接显示原图
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_WIDTHS = (320, 1024)
+VARIANT_FORMATS = (('jpg', 'JPEG'), ('webp', 'WEBP'))
+# 表示图片已经处理过的记录，stored_name 是原图
+ORIGINAL_VARIANT = 'original'
+
+_executor = None
+
+
+# 生成缩略图文件（在子进程中执行），返回每个缩略图的信息
+# 第一项总是指向原图的 'original'，比所有目标宽度都窄的图片也有记录，不会在每次提交、
+# 每次执行 generate-thumbnails 时重复处理
+def make_variants(upload_folder, stored_name, sha256, widths):
+    original_path = os.path.join(upload_folder, stored_name)
+    with Image.open(original_path) as image:
+        image.load()
+        variants = [{
+            'variant': ORIGINAL_VARIANT,
+            'stored_name': stored_name,
+            'width': image.width,
+            'height': image.height,
+            'byte_size': os.path.getsize(original_path),
+        }]
+        # 透明背景转为白色，JPEG 不支持透明
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        for width in widths:
+            # 原图不比目标宽度大时不生成，直接使用原图
+            if image.width <= width:
+                continue
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.LANCZOS)
+            for extension, image_format in VARIANT_FORMATS:
+                variant_name = f"{sha256}_w{width}.{extension}"
+                variant_path = os.path.join(upload_folder, variant_name)
+                temp_path = variant_path + '.tmp'
+                resized.save(temp_path, image_format, quality=80)
+                os.replace(temp_path, variant_path)
+                variants.append({
+                    'variant': f"w{width}.{extension}",
+                    'stored_name': variant_name,
+                    'width': width,
+                    'height': height,
+                    'byte_size': os.path.getsize(variant_path),
+                })
+    return variants
+
+
+# 记录缩略图；图片在生成缩略图期间已被删除（重新提交、清理）时不记录，
+# 留下的缩略图文件没有引用，由清理任务删除
+def record_variants(c, sha256, variants):
+    c.executemany('''INSERT OR REPLACE INTO image_variants (sha256, variant, stored_name, width, height, byte_size)
+                     SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM blobs WHERE sha256 = ?)''',
+                  [(sha256, v['variant'], v['stored_name'], v['width'], v['height'], v['byte_size'], sha256) for v in variants])
+
+
+def _get_executor(workers):
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+# 等待已提交的缩略图任务完成并关闭进程池；在多进程的子进程中退出前需要调用，否则子进程等待进程池退出
+def shutdown_thumbnails(wait=True):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+# 把生成缩略图的任务放入进程池，生成完成后写入 image_variants
+def enqueue_thumbnails(app, stored_name, sha256):
+    if Image is None or not app.config.get('THUMBNAIL_WORKERS'):
+        return None
+    widths = tuple(app.config.get('THUMBNAIL_WIDTHS', DEFAULT_WIDTHS))
+    future = _get_executor(app.config['THUMBNAIL_WORKERS']).submit(
+        make_variants, app.config['UPLOAD_FOLDER'], stored_name, sha256, widths)
+
+    def on_done(done):
+        try:
+            variants = done.result()
+            with DatabaseConnection() as c:
+                record_variants(c, sha256, variants)
+        except Exception as e:
+            print(f"生成缩略图错误: {e}")
+
+    future.add_done_callback(on_done)
+    return future
+
+
+# 获取图片的缩略图，返回 {variant: 文件名}，例如 {'original': ..., 'w320.jpg': ..., 'w320.webp': ...}；
+# 还没有处理过的图片返回空字典
+def get_variants(c, sha256):
+    c.execute("SELECT variant, stored_name FROM image_variants WHERE sha256 = ?", (sha256,))
+    return dict(c.fetchall())
+
+
+# 为还没有缩略图的图片生成缩略图（在当前进程中执行），返回处理的图片数
+def generate_missing_thumbnails(c, upload_folder, widths=DEFAULT_WIDTHS):
+    if Image is None:
+        raise RuntimeError('生成缩略图需要安装 Pillow')
+    c.execute('''SELECT b.sha256, b.stored_name FROM blobs b
+                 WHERE b.mime_type LIKE 'image/%'
+                 AND NOT EXISTS (SELECT 1 FROM image_variants v WHERE v.sha256 = b.sha256)''')
+    count = 0
+    for sha256, stored_name in c.fetchall():
+        try:
+            variants = make_variants(upload_folder, stored_name, sha256, widths)
+        except OSError as e:
+            print(f"生成缩略图错误 {stored_name}: {e}")
+            continue
+        record_variants(c, sha256, variants)
+        count += 1
+    return count
@@ -0,0 +1,319 @@
+import hashlib
+import os
+import re
+import struct
+import uuid
+from app.utils.profiling import record_io
+
+# 上传文件的元数据
+# 上传时记录文件名、类型、大小、图片尺寸和 sha256，页面直接查询 attachments 表，
+# 不再逐个扩展名调用 os.path.exists 查找文件
+
+ATTACHMENTS_TABLE = '''CREATE TABLE IF NOT EXISTS attachments (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 submission_id INTEGER,
+                 assignment_id INTEGER,
+                 stored_name TEXT NOT NULL,
+                 mime_type TEXT,
+                 byte_size INTEGER,
+                 width INTEGER,
+                 height INTEGER,
+                 sha256 TEXT,
+                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                 FOREIGN KEY (submission_id) REFERENCES submissions (id),
+                 FOREIGN KEY (assignment_id) REFERENCES assignments (id)
+             )'''
+
+# 按内容寻址的文件：文件名为 <sha256>.<扩展名>，相同内容只保存一份，
+# blobs.ref_count 记录引用该内容的附件数，由 attachments 上的触发器维护
+BLOBS_TABLE = '''CREATE TABLE IF NOT EXISTS blobs (
+                 sha256 TEXT PRIMARY KEY,
+                 stored_name TEXT NOT NULL,
+                 mime_type TEXT,
+                 byte_size INTEGER,
+                 ref_count INTEGER NOT NULL DEFAULT 0
+             )'''
+
+BLOBS_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS blobs_attachments_insert AFTER INSERT ON attachments WHEN NEW.sha256 IS NOT NULL
+             BEGIN
+                INSERT INTO blobs (sha256, stored_name, mime_type, byte_size, ref_count)
+                VALUES (NEW.sha256, NEW.stored_name, NEW.mime_type, NEW.byte_size, 1)
+                ON CONFLICT (sha256) DO UPDATE SET ref_count = ref_count + 1;
+             END''',
+    '''CREATE TRIGGER IF NOT EXISTS blobs_attachments_delete AFTER DELETE ON attachments WHEN OLD.sha256 IS NOT NULL
+             BEGIN
+                UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.sha256;
+                DELETE FROM blobs WHERE sha256 = OLD.sha256 AND ref_count <= 0;
+             END''',
+]
+
+# 图片缩略图，由 app.utils.thumbnails 生成；variant 例如 'w320.jpg'、'w320.webp'，
+# 'original' 指向原图，表示图片已经处理过（比所有缩略图宽度都窄的图片只有这一条）
+IMAGE_VARIANTS_TABLE = '''CREATE TABLE IF NOT EXISTS image_variants (
+                 sha256 TEXT NOT NULL,
+                 variant TEXT NOT NULL,
+                 stored_name TEXT NOT NULL,
+                 width INTEGER,
+                 height INTEGER,
+                 byte_size INTEGER,
+                 PRIMARY KEY (sha256, variant)
+             )'''
+
+# 文件不再被引用（blobs 中的记录删除）时同时删除缩略图记录，缩略图文件由清理任务删除
+IMAGE_VARIANTS_TRIGGER = '''CREATE TRIGGER IF NOT EXISTS image_variants_blobs_delete AFTER DELETE ON blobs
+             BEGIN
+                DELETE FROM image_variants WHERE sha256 = OLD.sha256;
+             END'''
+
+SHA256_NAME_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# 文件头与类型的对应关系
+MAGIC_NUMBERS = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+EXTENSION_MIME_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'txt': 'text/plain',
+}
+
+# 允许上传的图片类型及保存时使用的扩展名
+IMAGE_EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/gif': 'gif',
+}
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+# 上传的文件不符合要求
+class UploadError(Exception):
+    pass
+
+
+# 上传的文件超过大小限制
+class UploadTooLarge(UploadError):
+    pass
+
+
+# 根据文件头判断类型，无法识别时返回 None
+def sniff_mime_type(header):
+    for magic, mime_type in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return mime_type
+    return None
+
+
+def _jpeg_size(f):
+    # 跳过 SOI，依次读取各段直到 SOF 段
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:
+            marker = marker[1:] + f.read(1)
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+# 读取图片尺寸，返回 (宽, 高)，无法识别时返回 (None, None)
+def image_size(path, mime_type):
+    try:
+        with open(path, 'rb') as f:
+            if mime_type == 'image/png':
+                header = f.read(24)
+                if len(header) >= 24 and header[12:16] == b'IHDR':
+                    return struct.unpack('>II', header[16:24])
+            elif mime_type == 'image/gif':
+                header = f.read(10)
+                if len(header) >= 10:
+                    return struct.unpack('<HH', header[6:10])
+            elif mime_type == 'image/jpeg':
+                size = _jpeg_size(f)
+                if size:
+                    return size
+    except (OSError, struct.error):
+        pass
+    return None, None
+
+
+# 计算文件的 sha256
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# 读取文件的元数据：类型、大小、尺寸、sha256
+def describe_file(path):
+    with open(path, 'rb') as f:
+        header = f.read(16)
+    mime_type = sniff_mime_type(header)
+    if mime_type is None:
+        extension = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+        mime_type = EXTENSION_MIME_TYPES.get(extension, 'application/octet-stream')
+    width, height = image_size(path, mime_type)
+    return {
+        'mime_type': mime_type,
+        'byte_size': os.path.getsize(path),
+        'width': width,
+        'height': height,
+        'sha256': file_sha256(path),
+    }
+
+
+# 分块读取上传的文件写入临时文件，同时计算 sha256、检查文件头和大小
+# 返回文件元数据；超过 max_bytes 时抛出 UploadTooLarge，不是图片时抛出 UploadError
+def _stream_to_temp(stream, temp_path, max_bytes=None):
+    digest = hashlib.sha256()
+    byte_size = 0
+    header = b''
+    with open(temp_path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            byte_size += len(chunk)
+            if max_bytes is not None and byte_size > max_bytes:
+                raise UploadTooLarge(f'文件超过 {max_bytes} 字节')
+            if len(header) < 16:
+                header += chunk[:16 - len(header)]
+                # 第一块数据就检查文件头，不是图片时不再继续读取
+                if len(header) >= 16 and sniff_mime_type(header) not in IMAGE_EXTENSIONS:
+                    raise UploadError('只能上传图片文件')
+            digest.update(chunk)
+            f.write(chunk)
+    mime_type = sniff_mime_type(header)
+    if mime_type not in IMAGE_EXTENSIONS:
+        raise UploadError('只能上传图片文件')
+    width, height = image_size(temp_path, mime_type)
+    return {
+        'mime_type': mime_type,
+        'byte_size': byte_size,
+        'width': width,
+        'height': height,
+        'sha256': digest.hexdigest(),
+    }
+
+
+# 保存上传的文件，相同内容的文件只保存一份；扩展名由文件头决定
+# 返回 (保存的文件名, 文件元数据)
+def store_upload(c, upload_folder, file, max_bytes=None):
+    temp_path = os.path.join(upload_folder, f".upload-{uuid.uuid4()}.tmp")
+    try:
+        info = _stream_to_temp(file.stream, temp_path, max_bytes)
+        # 已经有相同内容的文件时直接引用，不再保存新文件
+        c.execute("SELECT stored_name FROM blobs WHERE sha256 = ?", (info['sha256'],))
+        row = c.fetchone()
+        if row and os.path.exists(os.path.join(upload_folder, row[0])):
+            stored_name = row[0]
+            # 更新修改时间，避免被清理任务当作过期文件删除
+            os.utime(os.path.join(upload_folder, stored_name))
+            os.remove(temp_path)
+        else:
+            stored_name = f"{info['sha256']}.{IMAGE_EXTENSIONS[info['mime_type']]}"
+            # 在同一目录内重命名，其他请求看不到写了一半的文件
+            os.replace(temp_path, os.path.join(upload_folder, stored_name))
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    record_io(written=info['byte_size'])
+    return stored_name, info
+
+
+# 根据文件名获取文件内容的 sha256，用作 ETag
+def get_file_sha256(c, stored_name):
+    base = stored_name.split('.', 1)[0]
+    if SHA256_NAME_PATTERN.match(base):
+        return base
+    c.execute("SELECT sha256 FROM attachments WHERE stored_name = ? AND sha256 IS NOT NULL LIMIT 1", (stored_name,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+# 记录上传文件；提交只保留最新的一个附件
+def record_attachment(c, upload_folder, stored_name, submission_id=None, assignment_id=None, info=None):
+    if info is None:
+        info = describe_file(os.path.join(upload_folder, stored_name))
+    if submission_id is not None:
+        # 重新提交相同的图片时保留原记录，只更新提交内容
+        c.execute("SELECT id FROM attachments WHERE submission_id = ? AND stored_name = ? AND sha256 = ?",
+                  (submission_id, stored_name, info['sha256']))
+        row = c.fetchone()
+        if row:
+            return row[0]
+        c.execute("DELETE FROM attachments WHERE submission_id = ?", (submission_id,))
+    c.execute('''INSERT INTO attachments (submission_id, assignment_id, stored_name, mime_type, byte_size, width, height, sha256)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+              (submission_id, assignment_id, stored_name, info['mime_type'], info['byte_size'],
+               info['width'], info['height'], info['sha256']))
+    return c.lastrowid
+
+
+# 获取提交的附件文件名，没有附件时返回 None
+def get_submission_attachment(c, submission_id):
+    c.execute("SELECT stored_name FROM attachments WHERE submission_id = ? ORDER BY id DESC LIMIT 1", (submission_id,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+# 扫描一次上传目录，为还没有附件记录的提交和作业补充记录
+# 返回 (补充的记录数, 找不到文件的数量)
+def backfill_attachments(c, upload_folder):
+    # 基础文件名（不含扩展名）到实际文件名的映射
+    files_by_base = {}
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            base, _, extension = entry.name.rpartition('.')
+            if extension.lower() in ('png', 'jpg', 'jpeg', 'gif'):
+                files_by_base.setdefault(base, entry.name)
+    file_names = set(files_by_base.values())
+
+    added = 0
+    missing = 0
+    c.execute('''SELECT s.id, s.file_path FROM submissions s
+                 WHERE s.file_path IS NOT NULL
+                 AND NOT EXISTS (SELECT 1 FROM attachments t WHERE t.submission_id = s.id)''')
+    for submission_id, base_filename in c.fetchall():
+        stored_name = files_by_base.get(base_filename)
+        if stored_name is None:
+            missing += 1
+            continue
+        record_attachment(c, upload_folder, stored_name, submission_id=submission_id)
+        added += 1
+
+    c.execute('''SELECT a.id, a.file_path FROM assignments a
+                 WHERE a.file_path IS NOT NULL
+                 AND NOT EXISTS (SELECT 1 FROM attachments t WHERE t.assignment_id = a.id)''')
+    for assignment_id, file_path in c.fetchall():
+        # 旧数据可能保存了完整路径（包括 Windows 路径）
+        stored_name = file_path.replace('\\', '/').split('/')[-1]
+        if stored_name not in file_names:
+            missing += 1
+            continue
+        record_attachment(c, upload_folder, stored_name, assignment_id=assignment_id)
+        added += 1
+    return added, missing
@@ -0,0 +1,128 @@
+"""比较不同存储配置下的并发读写吞吐量
+
+用法：
+    python benchmarks/db_profiles.py --seconds 5 --writers 4 --readers 8
+
+每个存储配置（见 app.utils.db.STORAGE_PROFILES）使用一个新的临时数据库，
+写线程模拟学生提交和教师评分，读线程模拟教师后台的统计查询，
+最后输出每秒读写次数和 "database is locked" 错误次数。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import db
+
+
+def seed(database, profile, classes, students_per_class, assignments_per_class):
+    db.init_db(database, profile)
+    conn = db.connect(database, profile)
+    c = conn.cursor()
+    for class_no in range(classes):
+        class_id = f'class{class_no}'
+        c.executemany("INSERT INTO users (name, class_id, group_id, id_card_last8, role) VALUES (?, ?, ?, ?, 'student')",
+                      [(f's{class_no}_{i}', class_id, i % 6, f'{i:08d}') for i in range(students_per_class)])
+        c.executemany("INSERT INTO assignments (teacher_id, class_id, title, content, deadline) VALUES (1, ?, ?, '', '2099-01-01 00:00:00')",
+                      [(class_id, f'hw{i}') for i in range(assignments_per_class)])
+    conn.commit()
+    students = [row[0] for row in c.execute("SELECT id FROM users WHERE role = 'student'")]
+    assignments = [row for row in c.execute("SELECT id, class_id FROM assignments")]
+    conn.close()
+    return students, assignments
+
+
+def run_profile(profile, args):
+    workdir = tempfile.mkdtemp()
+    database = os.path.join(workdir, 'bench.db')
+    students, assignments = seed(database, profile, args.classes, args.students, args.assignments)
+    # 所有配置使用相同的锁等待时间，只比较日志模式等设置的差异
+    pragmas = {'busy_timeout': int(args.timeout * 1000)}
+    stop = threading.Event()
+    counters = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def count(key):
+        with lock:
+            counters[key] += 1
+
+    def writer():
+        conn = db.connect(database, profile, timeout=args.timeout, pragmas=pragmas)
+        rnd = random.Random()
+        while not stop.is_set():
+            assignment_id = rnd.choice(assignments)[0]
+            student_id = rnd.choice(students)
+            try:
+                if rnd.random() < 0.7:
+                    conn.execute("INSERT OR REPLACE INTO submissions (assignment_id, student_id, content, file_path) VALUES (?, ?, 'answer', NULL)",
+                                 (assignment_id, student_id))
+                else:
+                    conn.execute("UPDATE submissions SET score = '良好', scorer_id = 1 WHERE assignment_id = ?", (assignment_id,))
+                conn.commit()
+                count('writes')
+            except sqlite3.OperationalError:
+                conn.rollback()
+                count('locked')
+        conn.close()
+
+    def reader():
+        conn = db.connect(database, profile, timeout=args.timeout, pragmas=pragmas)
+        rnd = random.Random()
+        while not stop.is_set():
+            assignment_id, class_id = rnd.choice(assignments)
+            try:
+                conn.execute("SELECT COUNT(*) FROM users WHERE class_id = ? AND role = 'student'", (class_id,)).fetchone()
+                conn.execute("SELECT COUNT(*) FROM submissions WHERE assignment_id = ?", (assignment_id,)).fetchone()
+                conn.execute("SELECT score, COUNT(*) FROM submissions WHERE assignment_id = ? AND score IS NOT NULL GROUP BY score",
+                             (assignment_id,)).fetchall()
+                count('reads')
+            except sqlite3.OperationalError:
+                count('locked')
+        conn.close()
+
+    threads = [threading.Thread(target=writer) for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(workdir)
+    return {
+        'profile': profile,
+        'seconds': round(elapsed, 2),
+        'reads_per_sec': round(counters['reads'] / elapsed, 1),
+        'writes_per_sec': round(counters['writes'] / elapsed, 1),
+        'locked_errors': counters['locked'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较存储配置的并发读写吞吐量')
+    parser.add_argument('--profiles', nargs='+', default=list(db.STORAGE_PROFILES))
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--classes', type=int, default=10)
+    parser.add_argument('--students', type=int, default=45)
+    parser.add_argument('--assignments', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=0.1, help='单次获取锁的等待时间（秒）')
+    args = parser.parse_args()
+
+    results = [run_profile(profile, args) for profile in args.profiles]
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+"""模拟作业截止前一晚的访问，测量各页面的响应时间和吞吐量
+
+用法：
+    python benchmarks/deadline_night.py --seconds 20 --processes 2 --users 8
+    python benchmarks/deadline_night.py --mode http --processes 4 --users 16 --output after.json --baseline before.json
+
+先在临时目录中生成一个学校的数据（班级、学生、作业、已有的提交和图片），
+再由多个进程、每个进程多个线程模拟学生、教师和管理员：登录、打开后台首页、带图片提交作业、
+批量评分、查看作业分析和数据看板。
+
+--mode client  每个进程通过 Flask 测试客户端直接调用应用（不经过网络），各进程共用临时数据库
+--mode http    在本进程中启动 HTTP 服务（werkzeug，多线程），各进程通过 HTTP 访问；
+               也可以用 --url 指向已经启动的服务（服务需要使用 --seed-only 生成的数据库和上传目录）
+
+最后按页面输出请求数、错误数、每秒请求数和 p50/p95/p99 响应时间（毫秒）的 JSON，
+指定 --baseline 时同时输出与上次结果相比 p95 和吞吐量的变化，用于比较修改前后的性能。
+"""
+import argparse
+import http.client
+import io
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 各角色的虚拟用户所占比例：截止前一晚主要是学生提交作业
+ROLE_WEIGHTS = {'student': 0.8, 'teacher': 0.15, 'admin': 0.05}
+SCORES = ['优秀', '良好', '合格', '不合格']
+ADMIN_LOGIN = ('admin', '000', 'admin123')
+TEACHER_PASSWORD = 'bench'
+
+
+# 生成大约 size 字节的 PNG 图片（随机像素，几乎无法压缩）
+def make_png(size, rnd):
+    width = max(int((size / 3) ** 0.5), 1)
+    height = max(size // (width * 3), 1)
+    raw = b''.join(b'\x00' + rnd.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b'')
+
+
+# 生成学校数据，返回虚拟用户使用的登录信息和作业
+def seed(workdir, args):
+    from app.main.routes import hash_password
+    from app.utils import db
+    from app.utils.uploads import record_attachment, store_upload
+    from werkzeug.datastructures import FileStorage
+
+    database = os.path.join(workdir, 'bench.db')
+    upload_folder = os.path.join(workdir, 'uploads')
+    os.makedirs(upload_folder, exist_ok=True)
+    db.init_db(database, upload_folder=upload_folder)
+    conn = db.connect(database)
+    c = conn.cursor()
+    rnd = random.Random(args.seed)
+    plan = {'database': database, 'upload_folder': upload_folder, 'students': [], 'teachers': [], 'assignments': {}}
+
+    for class_no in range(args.classes):
+        class_id = f'class{class_no}'
+        c.execute("INSERT INTO users (name, class_id, password, role) VALUES (?, ?, ?, 'teacher')",
+                  (f't{class_no}', class_id, hash_password(TEACHER_PASSWORD)))
+        teacher_id = c.lastrowid
+        plan['teachers'].append((f't{class_no}', class_id, TEACHER_PASSWORD))
+        students = [(f's{class_no}_{i}', class_id, i % args.groups, f'{class_no:03d}{i:05d}', int(i < args.groups))
+                    for i in range(args.students)]
+        c.executemany("INSERT INTO users (name, class_id, group_id, id_card_last8, role, is_group_leader) VALUES (?, ?, ?, ?, 'student', ?)",
+                      students)
+        plan['students'] += [(name, class_id, id_card_last8) for name, class_id, _, id_card_last8, _ in students]
+        c.executemany("INSERT INTO assignments (teacher_id, class_id, title, content, deadline) VALUES (?, ?, ?, ?, '2099-01-01 00:00:00')",
+                      [(teacher_id, class_id, f'作业{i}', '完成练习') for i in range(args.assignments)])
+        c.execute("SELECT id FROM assignments WHERE class_id = ?", (class_id,))
+        plan['assignments'][class_id] = [row[0] for row in c.fetchall()]
+
+    # 已有的提交，其中一部分带图片
+    c.execute("SELECT id, class_id FROM users WHERE role = 'student'")
+    students = c.fetchall()
+    images = [make_png(args.image_kb * 1024, rnd) for _ in range(args.images)]
+    for student_id, class_id in students:
+        for assignment_id in plan['assignments'][class_id]:
+            if rnd.random() >= args.submitted:
+                continue
+            image_name = info = None
+            if rnd.random() < args.with_image:
+                # 与提交作业时相同的保存方式，相同的图片只保存一份
+                image_name, info = store_upload(c, upload_folder, FileStorage(io.BytesIO(rnd.choice(images)), 'answer.png'))
+            c.execute("INSERT INTO submissions (assignment_id, student_id, content, file_path, score) VALUES (?, ?, ?, ?, ?)",
+                      (assignment_id, student_id, '答案', image_name and image_name.split('.')[0],
+                       rnd.choice(SCORES) if rnd.random() < 0.5 else None))
+            if image_name:
+                record_attachment(c, upload_folder, image_name, submission_id=c.lastrowid, info=info)
+    conn.commit()
+    conn.close()
+    return plan
+
+
+# 通过 Flask 测试客户端发送请求
+class ClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None, files=None, json_body=None):
+        data = dict(form or {})
+        for name, (filename, content) in (files or {}).items():
+            data[name] = (io.BytesIO(content), filename)
+        response = self.client.open(path, method=method, data=data or None, json=json_body)
+        body = response.get_data()
+        response.close()
+        return response.status_code, body
+
+
+# 通过 HTTP 发送请求，只保存会话 cookie，不跟随跳转
+class HTTPSession:
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.cookies = SimpleCookie()
+
+    def request(self, method, path, form=None, files=None, json_body=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif files:
+            body, headers['Content-Type'] = encode_multipart(form or {}, files)
+        elif form:
+            body = urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{key}={morsel.value}' for key, morsel in self.cookies.items())
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            for header in response.headers.get_all('Set-Cookie') or []:
+                self.cookies.load(header)
+            return response.status, data
+        finally:
+            conn.close()
+
+
+def encode_multipart(form, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in form.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# 一个虚拟用户：登录后按角色循环执行操作，每个请求记录 (页面, 耗时, 是否成功)
+class VirtualUser:
+    def __init__(self, session, role, plan, rnd, images, record):
+        self.session = session
+        self.role = role
+        self.plan = plan
+        self.rnd = rnd
+        self.images = images
+        self.record = record
+
+    def call(self, route, method, path, expect=(200, 302), **kwargs):
+        start = time.perf_counter()
+        try:
+            status, body = self.session.request(method, path, **kwargs)
+            ok = status in expect
+        except Exception:
+            status, body, ok = None, b'', False
+        self.record(route, time.perf_counter() - start, ok)
+        return status, body
+
+    def login(self):
+        if self.role == 'student':
+            self.name, self.class_id, credential = self.rnd.choice(self.plan['students'])
+        elif self.role == 'teacher':
+            self.name, self.class_id, credential = self.rnd.choice(self.plan['teachers'])
+        else:
+            self.name, self.class_id, credential = ADMIN_LOGIN
+        self.call('main.login', 'POST', '/login', expect=(302,),
+                  form={'name': self.name, 'class_id': self.class_id, 'credential': credential})
+
+    def step(self):
+        # 偶尔重新登录（换设备、会话过期）
+        if self.rnd.random() < 0.05:
+            self.login()
+        getattr(self, f'{self.role}_step')()
+
+    def student_step(self):
+        self.call('student.dashboard', 'GET', '/student/dashboard')
+        assignment_id = self.rnd.choice(self.plan['assignments'][self.class_id])
+        self.call('student.submit_assignment', 'GET', f'/student/submit_assignment/{assignment_id}')
+        files = {'file': ('answer.png', self.rnd.choice(self.images))} if self.images else None
+        self.call('student.submit_assignment:post', 'POST', f'/student/submit_assignment/{assignment_id}',
+                  form={'content': '答案'}, files=files)
+        if self.rnd.random() < 0.3:
+            self.call('student.view_my_submissions', 'GET', '/student/view_my_submissions')
+
+    def teacher_step(self):
+        self.call('teacher.dashboard', 'GET', '/teacher/dashboard')
+        assignment_id = self.rnd.choice(self.plan['assignments'][self.class_id])
+        self.call('teacher.view_submissions', 'GET', f'/teacher/view_submissions/{assignment_id}')
+        status, body = self.call('api.submissions', 'GET', f'/api/v1/assignments/{assignment_id}/submissions?fields=id')
+        if status == 200:
+            ids = [item['id'] for item in json.loads(body)['items']]
+            if ids:
+                scores = [{'id': submission_id, 'score': self.rnd.choice(SCORES)} for submission_id in ids]
+                self.call('teacher.score_submissions', 'POST', '/teacher/score_submissions', json_body={'scores': scores})
+        self.call('teacher.analyze_assignment', 'GET', f'/teacher/analyze_assignment/{assignment_id}')
+
+    def admin_step(self):
+        self.call('admin.dashboard', 'GET', '/admin/dashboard')
+        self.call('admin.view_dashboard', 'GET', f'/admin/view_dashboard?page={self.rnd.randint(1, 3)}')
+        self.call('admin.view_students', 'GET', '/admin/view_students')
+
+
+def configure_app(plan, args):
+    from app import app
+    from app.utils import db
+    app.config['DATABASE'] = plan['database']
+    app.config['UPLOAD_FOLDER'] = plan['upload_folder']
+    if args.thumbnail_workers is not None:
+        app.config['THUMBNAIL_WORKERS'] = args.thumbnail_workers
+    db.init_app(app)
+    return app
+
+
+# 一个压测进程：启动 users 个虚拟用户线程，运行 seconds 秒，返回 {页面: [[耗时, 是否成功]]}
+def run_worker(worker_no, plan, args, base_url, start_at):
+    app = configure_app(plan, args) if base_url is None else None
+    rnd = random.Random(f'{args.seed}-{worker_no}')
+    images = [make_png(args.image_kb * 1024, rnd) for _ in range(args.images)] if args.with_image else []
+    samples = {}
+    lock = threading.Lock()
+    roles = list(ROLE_WEIGHTS)
+
+    def run_user(user_no):
+        user_rnd = random.Random(f'{args.seed}-{worker_no}-{user_no}')
+        measuring = threading.Event()
+
+        def record(route, seconds, ok):
+            if measuring.is_set():
+                with lock:
+                    samples.setdefault(route, []).append((seconds, ok))
+
+        session = ClientSession(app) if base_url is None else HTTPSession(base_url)
+        role = user_rnd.choices(roles, weights=[ROLE_WEIGHTS[role] for role in roles])[0]
+        user = VirtualUser(session, role, plan, user_rnd, images, record)
+        # 等待所有进程准备好后同时开始，预热期间的请求不计入结果
+        time.sleep(max(start_at - time.time(), 0))
+        user.login()
+        end_warmup = start_at + args.warmup
+        end = end_warmup + args.seconds
+        while time.time() < end:
+            if time.time() >= end_warmup:
+                measuring.set()
+            user.step()
+
+    threads = [threading.Thread(target=run_user, args=(user_no,)) for user_no in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if app is not None:
+        from app.utils.thumbnails import shutdown_thumbnails
+        shutdown_thumbnails()
+    return samples
+
+
+# 最近秩法计算百分位数，values 已排序
+def percentile(values, p):
+    index = max(math.ceil(p / 100 * len(values)) - 1, 0)
+    return values[index]
+
+
+def summarize(samples, seconds):
+    routes = {}
+    for route, values in sorted(samples.items()):
+        times = sorted(seconds * 1000 for seconds, _ in values)
+        routes[route] = {
+            'requests': len(values),
+            'errors': sum(1 for _, ok in values if not ok),
+            'rps': round(len(values) / seconds, 2),
+            'mean_ms': round(sum(times) / len(times), 2),
+            'p50_ms': round(percentile(times, 50), 2),
+            'p95_ms': round(percentile(times, 95), 2),
+            'p99_ms': round(percentile(times, 99), 2),
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'requests': total,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'rps': round(total / seconds, 2),
+        'routes': routes,
+    }
+
+
+# 与上次结果比较：p95 和吞吐量的变化比例，正数表示变慢/变少
+def compare(result, baseline):
+    changes = {}
+    for route, current in result['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if not before:
+            continue
+        changes[route] = {
+            'p95_change': round(current['p95_ms'] / before['p95_ms'] - 1, 3) if before['p95_ms'] else None,
+            'rps_change': round(current['rps'] / before['rps'] - 1, 3) if before['rps'] else None,
+        }
+    return changes
+
+
+def start_server(plan, args):
+    from werkzeug.serving import make_server
+    # 不输出每个请求的访问日志
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    app = configure_app(plan, args)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟作业截止前一晚的访问压力')
+    parser.add_argument('--mode', choices=['client', 'http'], default='client')
+    parser.add_argument('--url', help='压测已经启动的服务（--mode http）')
+    parser.add_argument('--processes', type=int, default=1, help='压测进程数')
+    parser.add_argument('--users', type=int, default=8, help='每个进程的虚拟用户（线程）数')
+    parser.add_argument('--seconds', type=float, default=10, help='计入结果的压测时间')
+    parser.add_argument('--warmup', type=float, default=2, help='预热时间，不计入结果')
+    parser.add_argument('--classes', type=int, default=4)
+    parser.add_argument('--students', type=int, default=45, help='每个班级的学生数')
+    parser.add_argument('--groups', type=int, default=6, help='每个班级的小组数')
+    parser.add_argument('--assignments', type=int, default=10, help='每个班级的作业数')
+    parser.add_argument('--submitted', type=float, default=0.5, help='已有提交的比例')
+    parser.add_argument('--with-image', type=float, default=0.5, help='带图片的提交比例')
+    parser.add_argument('--image-kb', type=int, default=200, help='图片大小（KB）')
+    parser.add_argument('--images', type=int, default=4, help='每个进程使用的不同图片数')
+    parser.add_argument('--thumbnail-workers', type=int, default=None, help='覆盖 THUMBNAIL_WORKERS')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', help='数据目录，默认使用临时目录并在结束后删除')
+    parser.add_argument('--seed-only', action='store_true', help='只生成数据（需要 --workdir），供 --url 指向的服务使用')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    parser.add_argument('--baseline', help='上次的结果文件，用于比较')
+    args = parser.parse_args()
+    if args.seed_only and not args.workdir:
+        parser.error('--seed-only 需要指定 --workdir')
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='deadline-night-')
+    os.makedirs(workdir, exist_ok=True)
+    server = None
+    try:
+        plan = seed(workdir, args)
+        if args.seed_only:
+            print(json.dumps({'database': plan['database'], 'upload_folder': plan['upload_folder']}, ensure_ascii=False))
+            return
+        base_url = None
+        if args.mode == 'http':
+            base_url = args.url
+            if base_url is None:
+                server, base_url = start_server(plan, args)
+
+        start_at = time.time() + 1
+        worker_args = [(worker_no, plan, args, base_url, start_at) for worker_no in range(args.processes)]
+        if args.processes == 1:
+            results = [run_worker(*worker_args[0])]
+        else:
+            # 各进程分别导入应用，与 gunicorn 的多个工作进程相同；
+            # ProcessPoolExecutor 的工作进程不是守护进程，应用可以再启动生成缩略图的进程
+            with ProcessPoolExecutor(args.processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+                # 留出启动进程的时间
+                start_at = time.time() + 5
+                futures = [executor.submit(run_worker, worker_no, plan, args, base_url, start_at)
+                           for worker_no in range(args.processes)]
+                results = [future.result() for future in futures]
+
+        samples = {}
+        for worker_samples in results:
+            for route, values in worker_samples.items():
+                samples.setdefault(route, []).extend(values)
+        result = {
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'workdir')},
+            **summarize(samples, args.seconds),
+        }
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                result['compared_to_baseline'] = compare(result, json.load(f))
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(output)
+        print(output)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,15 @@
 from app import app
-from app.utils.db import init_db
+from app.utils.db import init_db, DatabaseConnection
+from app.utils.jobs import fail_interrupted_jobs
+from app.utils.cleanup import start_scheduler
+from app.utils.snapshot import start_scheduler as start_snapshot_scheduler
 
 if __name__ == '__main__':
     init_db()
+    with DatabaseConnection() as c:
+        fail_interrupted_jobs(c)
+    if app.config['UPLOAD_GC_INTERVAL']:
+        start_scheduler(app, app.config['UPLOAD_GC_INTERVAL'], app.config['UPLOAD_GC_GRACE'])
+    if app.config['ANALYTICS_SNAPSHOT'] and app.config['ANALYTICS_SNAPSHOT_INTERVAL']:
+        start_snapshot_scheduler(app, app.config['ANALYTICS_SNAPSHOT_INTERVAL'])
     app.run(debug=True)
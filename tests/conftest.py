@@ -0,0 +1,97 @@
+import fnmatch
+import socketserver
+import threading
+import time
+import pytest
+
+
+# 测试用的 Redis 协议（RESP）服务，只实现 RedisCache 用到的 AUTH/SELECT/GET/SET/DEL/SCAN
+class FakeRedis(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(('127.0.0.1', 0), _FakeRedisHandler)
+        self.password = password
+        # 键 -> (值, 过期时间)，过期时间为 None 表示不过期
+        self.items = {}
+        self.lock = threading.Lock()
+        self.commands = []
+
+    def lookup(self, key):
+        item = self.items.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.time():
+            del self.items[key]
+            return None
+        return item
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        authorized = self.server.password is None
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            name = args[0].decode().upper()
+            self.server.commands.append(name)
+            if name == 'AUTH':
+                authorized = args[1].decode() == self.server.password
+                self._write(b'+OK\r\n' if authorized else b'-ERR invalid password\r\n')
+            elif not authorized:
+                self._write(b'-NOAUTH Authentication required.\r\n')
+            else:
+                with self.server.lock:
+                    self._write(getattr(self, f'_{name.lower()}')(args[1:]))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _write(self, data):
+        self.wfile.write(data)
+
+    @staticmethod
+    def _bulk(value):
+        return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def _select(self, args):
+        return b'+OK\r\n'
+
+    def _get(self, args):
+        item = self.server.lookup(args[0])
+        return self._bulk(item and item[0])
+
+    def _set(self, args):
+        expires = None
+        if len(args) == 4 and args[2].upper() == b'PX':
+            expires = time.time() + int(args[3]) / 1000
+        self.server.items[args[0]] = (args[1], expires)
+        return b'+OK\r\n'
+
+    def _del(self, args):
+        removed = sum(self.server.items.pop(key, None) is not None for key in args)
+        return b':%d\r\n' % removed
+
+    # 一次返回所有匹配的键，游标总是 0
+    def _scan(self, args):
+        pattern = args[args.index(b'MATCH') + 1].decode()
+        keys = [key for key in list(self.server.items)
+                if self.server.lookup(key) and fnmatch.fnmatchcase(key.decode(), pattern)]
+        return b'*2\r\n' + self._bulk(b'0') + b'*%d\r\n' % len(keys) + b''.join(self._bulk(key) for key in keys)
+
+
+@pytest.fixture
+def fake_redis():
+    server = FakeRedis(password='secret')
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
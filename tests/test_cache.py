@@ -0,0 +1,133 @@
+import socket
+import time
+import pytest
+from app.utils import cache
+from app.utils.cache import CacheNamespace, LRUCache, RedisCache, SQLiteCache
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def backend(request, tmp_path, monkeypatch):
+    if request.param == 'memory':
+        backend = LRUCache()
+    elif request.param == 'sqlite':
+        backend = SQLiteCache(str(tmp_path / 'cache.db'))
+    else:
+        server = request.getfixturevalue('fake_redis')
+        host, port = server.server_address
+        backend = RedisCache(f'redis://:secret@{host}:{port}/1')
+    monkeypatch.setattr(cache, '_backend', backend)
+    yield backend
+    if isinstance(backend, RedisCache):
+        backend.close()
+
+
+def test_get_set_delete(backend):
+    assert backend.get('k') is None
+    assert backend.get('k', 'default') == 'default'
+    backend.set('k', {'rows': [(1, '张三')]})
+    assert backend.get('k') == {'rows': [(1, '张三')]}
+    backend.set('k', 2)
+    assert backend.get('k') == 2
+    backend.delete('k')
+    assert backend.get('k', 'default') == 'default'
+
+
+def test_ttl_expiry(backend):
+    backend.set('short', 1, ttl=0.05)
+    backend.set('long', 2, ttl=60)
+    backend.set('forever', 3)
+    assert backend.get('short') == 1
+    time.sleep(0.1)
+    assert backend.get('short') is None
+    assert backend.get('long') == 2
+    assert backend.get('forever') == 3
+
+
+def test_clear_prefix(backend):
+    backend.set('a:1', 1)
+    backend.set('a:2', 2)
+    backend.set('ab:1', 3)
+    backend.clear('a:')
+    assert backend.get('a:1') is None
+    assert backend.get('a:2') is None
+    assert backend.get('ab:1') == 3
+    backend.clear()
+    assert backend.get('ab:1') is None
+
+
+# 命名空间的键互不影响，清空一个命名空间不影响其他命名空间
+def test_namespace_invalidation(backend):
+    users, classes = CacheNamespace('users'), CacheNamespace('classes')
+    users.set(1, 'u1')
+    classes.set(1, 'c1')
+    assert users.get(1) == 'u1'
+    assert classes.get(1) == 'c1'
+    users.clear()
+    assert users.get(1) is None
+    assert classes.get(1) == 'c1'
+    classes.delete(1)
+    assert classes.get(1) is None
+
+
+def test_namespace_default_ttl(backend):
+    namespace = CacheNamespace('short', ttl=0.05)
+    namespace.set('k', 1)
+    namespace.set('kept', 2, ttl=60)
+    time.sleep(0.1)
+    assert namespace.get('k') is None
+    assert namespace.get('kept') == 2
+
+
+def test_hit_miss_counters(backend):
+    namespace = CacheNamespace('counted')
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 'value'
+
+    assert namespace.get_or_set('k', compute) == 'value'
+    assert namespace.get_or_set('k', compute) == 'value'
+    assert namespace.get('other') is None
+    assert calls == [1]
+    assert namespace.stats() == {'hits': 1, 'misses': 2, 'errors': 0, 'hit_rate': 1 / 3}
+
+
+def test_lru_eviction():
+    backend = LRUCache(maxsize=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    backend.get('a')
+    backend.set('c', 3)
+    assert backend.get('b') is None
+    assert backend.get('a') == 1
+    assert len(backend) == 2
+
+
+def test_redis_auth_and_select(fake_redis):
+    host, port = fake_redis.server_address
+    backend = RedisCache(f'redis://:secret@{host}:{port}/2')
+    backend.set('k', 1)
+    assert fake_redis.commands[:3] == ['AUTH', 'SELECT', 'SET']
+    backend.close()
+
+
+# 连接断开后重新连接一次
+def test_redis_reconnects(fake_redis):
+    host, port = fake_redis.server_address
+    backend = RedisCache(f'redis://:secret@{host}:{port}')
+    backend.set('k', 1)
+    backend._local.sock.shutdown(socket.SHUT_RDWR)
+    assert backend.get('k') == 1
+    backend.close()
+
+
+# 后端不可用时按未命中处理，并计入错误次数
+def test_backend_errors_count_as_misses(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(cache, '_backend', RedisCache(f'redis://127.0.0.1:{port}', timeout=0.2))
+    namespace = CacheNamespace('down')
+    assert namespace.get_or_set('k', lambda: 'fresh') == 'fresh'
+    assert namespace.stats() == {'hits': 0, 'misses': 1, 'errors': 2, 'hit_rate': 0}
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+from app.utils.cleanup import collect_garbage
+from app.utils.db import init_db
+from app.utils.thumbnails import record_variants
+from app.utils.uploads import record_attachment
+
+
+def _variants(sha256):
+    return [{'variant': variant, 'stored_name': f'{sha256}_{variant}', 'width': 320, 'height': 160, 'byte_size': 4}
+            for variant in ('w320.jpg', 'w320.webp')]
+
+
+def _image(sha256):
+    return {'mime_type': 'image/png', 'byte_size': 4, 'width': 2000, 'height': 1000, 'sha256': sha256}
+
+
+def _touch(upload_folder, name, age=3600):
+    path = os.path.join(upload_folder, name)
+    with open(path, 'wb') as f:
+        f.write(b'data')
+    mtime = os.path.getmtime(path) - age
+    os.utime(path, (mtime, mtime))
+
+
+# 重新提交后，旧图片和它的缩略图都应被清理，新图片和它的缩略图保留
+def test_resubmit_removes_old_variants(tmp_path):
+    upload_folder = str(tmp_path / 'uploads')
+    os.makedirs(upload_folder)
+    database = str(tmp_path / 'todo.db')
+    init_db(database, 'default', upload_folder)
+
+    conn = sqlite3.connect(database)
+    c = conn.cursor()
+    c.execute("INSERT INTO users (name, class_id, role) VALUES ('s1', 'c1', 'student')")
+    student_id = c.lastrowid
+    c.execute("INSERT INTO assignments (title, content, class_id, teacher_id, deadline) VALUES ('a', 'b', 'c1', 1, '2030-01-01')")
+    c.execute("INSERT INTO submissions (assignment_id, student_id, file_path) VALUES (?, ?, ?)",
+              (c.lastrowid, student_id, 'old' * 16))
+    submission_id = c.lastrowid
+
+    old, new = 'a' * 64, 'b' * 64
+    for sha256 in (old, new):
+        _touch(upload_folder, f'{sha256}.png')
+        for variant in ('w320.jpg', 'w320.webp'):
+            _touch(upload_folder, f'{sha256}_{variant}')
+    record_attachment(c, upload_folder, f'{old}.png', submission_id=submission_id, info=_image(old))
+    for sha256 in (old, new):
+        c.executemany("INSERT INTO image_variants (sha256, variant, stored_name, width, height, byte_size) VALUES (?, ?, ?, 320, 160, 4)",
+                      [(sha256, variant, f'{sha256}_{variant}') for variant in ('w320.jpg', 'w320.webp')])
+
+    # 重新提交另一张图片
+    c.execute("UPDATE submissions SET file_path = ? WHERE id = ?", (new, submission_id))
+    record_attachment(c, upload_folder, f'{new}.png', submission_id=submission_id, info=_image(new))
+    conn.commit()
+
+    report = collect_garbage(c, upload_folder, grace_seconds=60)
+    remaining = set(os.listdir(upload_folder))
+    assert remaining == {f'{new}.png', f'{new}_w320.jpg', f'{new}_w320.webp'}
+    assert report['deleted'] == 3
+    c.execute("SELECT DISTINCT sha256 FROM image_variants")
+    assert c.fetchall() == [(new,)]
+    conn.close()
+
+
+# 缩略图在图片被删除之后才生成完成：不记录缩略图，生成的文件由清理任务删除
+def test_late_variants_for_deleted_blob(tmp_path):
+    upload_folder = str(tmp_path / 'uploads')
+    os.makedirs(upload_folder)
+    database = str(tmp_path / 'todo.db')
+    init_db(database, 'default', upload_folder)
+
+    conn = sqlite3.connect(database)
+    c = conn.cursor()
+    c.execute("INSERT INTO users (name, class_id, role) VALUES ('s1', 'c1', 'student')")
+    student_id = c.lastrowid
+    c.execute("INSERT INTO assignments (title, content, class_id, teacher_id, deadline) VALUES ('a', 'b', 'c1', 1, '2030-01-01')")
+    c.execute("INSERT INTO submissions (assignment_id, student_id, file_path) VALUES (?, ?, ?)",
+              (c.lastrowid, student_id, 'old' * 16))
+    submission_id = c.lastrowid
+
+    old, new = 'a' * 64, 'b' * 64
+    _touch(upload_folder, f'{old}.png')
+    _touch(upload_folder, f'{new}.png')
+    record_attachment(c, upload_folder, f'{old}.png', submission_id=submission_id, info=_image(old))
+    # 旧图片的缩略图还在生成时，学生重新提交了另一张图片，旧图片的 blobs 记录被删除
+    c.execute("UPDATE submissions SET file_path = ? WHERE id = ?", (new, submission_id))
+    record_attachment(c, upload_folder, f'{new}.png', submission_id=submission_id, info=_image(new))
+    c.execute("SELECT COUNT(*) FROM blobs WHERE sha256 = ?", (old,))
+    assert c.fetchone() == (0,)
+
+    for variant in _variants(old):
+        _touch(upload_folder, variant['stored_name'])
+    record_variants(c, old, _variants(old))
+    record_variants(c, new, _variants(new))
+    conn.commit()
+    c.execute("SELECT DISTINCT sha256 FROM image_variants")
+    assert c.fetchall() == [(new,)]
+
+    collect_garbage(c, upload_folder, grace_seconds=60)
+    assert set(os.listdir(upload_folder)) == {f'{new}.png'}
+    conn.close()
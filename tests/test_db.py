@@ -0,0 +1,31 @@
+import os
+import sqlite3
+from app.utils import db
+from app.utils.migrations import MIGRATIONS
+
+
+# 重置在原文件中进行：其他进程已打开的连接看到的是重建后的空数据库，而不是已删除的旧文件
+def test_reset_db_keeps_file_for_open_connections(tmp_path, monkeypatch):
+    upload_folder = str(tmp_path / 'uploads')
+    os.makedirs(upload_folder)
+    database = str(tmp_path / 'todo.db')
+    monkeypatch.setattr(db, '_pool', db.ConnectionPool(database=database))
+    monkeypatch.setattr(db, '_upload_folder', upload_folder)
+    db.init_db()
+
+    other = sqlite3.connect(database)
+    other.execute("INSERT INTO users (name, class_id, role) VALUES ('s1', 'c1', 'student')")
+    other.commit()
+    inode = os.stat(database).st_ino
+
+    db.reset_db()
+
+    assert os.stat(database).st_ino == inode
+    assert other.execute("SELECT COUNT(*) FROM users").fetchone() == (0,)
+    assert other.execute("PRAGMA user_version").fetchone() == (MIGRATIONS[-1][0],)
+    # 迁移重新建立的索引和触发器都在
+    names = {name for name, in other.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    assert 'idx_submissions_assignment_student' in names
+    other.execute("INSERT INTO users (name, class_id, role) VALUES ('s2', 'c1', 'student')")
+    other.commit()
+    other.close()
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import pytest
+from app.utils import db
+from app.utils.db import init_db
+from app.utils.grading import GradingError, apply_scores, scores_from_form, scores_from_json
+from app.utils.identity import invalidate_identity
+
+
+# 两个班级：c1 有组长 leader（第 1 组）、第 1 组的 s1 和第 2 组的 s2；c2 有 s3；
+# 每个学生交了本班作业，另有一名没有小组的组长 nogroup
+@pytest.fixture
+def school(tmp_path):
+    upload_folder = str(tmp_path / 'uploads')
+    os.makedirs(upload_folder)
+    database = str(tmp_path / 'todo.db')
+    init_db(database, 'default', upload_folder)
+
+    conn = sqlite3.connect(database)
+    c = conn.cursor()
+    users = {}
+    for name, class_id, group_id, leader in [('leader', 'c1', 1, 1), ('s1', 'c1', 1, 0), ('s2', 'c1', 2, 0),
+                                             ('s3', 'c2', 1, 0), ('nogroup', 'c1', None, 1)]:
+        c.execute("INSERT INTO users (name, class_id, group_id, id_card_last8, role, is_group_leader) VALUES (?, ?, ?, '12345678', 'student', ?)",
+                  (name, class_id, group_id, leader))
+        users[name] = c.lastrowid
+    assignments = {}
+    for class_id in ('c1', 'c2'):
+        c.execute("INSERT INTO assignments (teacher_id, class_id, title, deadline) VALUES (1, ?, 'a', '2030-01-01 00:00:00')", (class_id,))
+        assignments[class_id] = c.lastrowid
+    submissions = {}
+    for name, class_id in [('s1', 'c1'), ('s2', 'c1'), ('s3', 'c2')]:
+        c.execute("INSERT INTO submissions (assignment_id, student_id, content) VALUES (?, ?, 'x')", (assignments[class_id], users[name]))
+        submissions[name] = c.lastrowid
+    conn.commit()
+    yield {'database': database, 'upload_folder': upload_folder, 'conn': conn, 'users': users, 'submissions': submissions}
+    conn.close()
+
+
+def _scores(c):
+    c.execute("SELECT id, score FROM submissions")
+    return dict(c.fetchall())
+
+
+def test_teacher_scores_own_class(school):
+    c, submissions = school['conn'].cursor(), school['submissions']
+    report = apply_scores(c, [(submissions['s1'], '优秀'), (submissions['s2'], '良好')], 99, 'c1')
+    assert report == {'updated': [(submissions['s1'], '优秀'), (submissions['s2'], '良好')], 'unchanged': 0, 'rejected': []}
+    assert _scores(c)[submissions['s1']] == '优秀'
+
+
+def test_class_mismatch_rejected(school):
+    c, submissions = school['conn'].cursor(), school['submissions']
+    report = apply_scores(c, [(submissions['s3'], '优秀')], 99, 'c1')
+    assert report['rejected'] == [(submissions['s3'], '没有评分权限')]
+    assert report['updated'] == []
+    assert _scores(c)[submissions['s3']] is None
+
+
+def test_leader_only_scores_own_group(school):
+    c, submissions, users = school['conn'].cursor(), school['submissions'], school['users']
+    report = apply_scores(c, [(submissions['s1'], '合格'), (submissions['s2'], '合格'), (submissions['s3'], '合格')],
+                          users['leader'], 'c1', group_id=1)
+    assert report['updated'] == [(submissions['s1'], '合格')]
+    assert report['rejected'] == [(submissions['s2'], '没有评分权限'), (submissions['s3'], '没有评分权限')]
+    assert _scores(c)[submissions['s2']] is None
+
+
+def test_unchanged_and_invalid_scores_reported(school):
+    c, submissions = school['conn'].cursor(), school['submissions']
+    apply_scores(c, [(submissions['s1'], '良好')], 99, 'c1')
+    report = apply_scores(c, [(submissions['s1'], '良好'), (submissions['s2'], '满分'), (12345, '优秀')], 99, 'c1')
+    assert report['updated'] == []
+    assert report['unchanged'] == 1
+    assert report['rejected'] == [(submissions['s2'], '评分不正确: 满分'), (12345, '提交不存在')]
+
+
+# 同一提交出现多次时以最后一次为准，最后一次不正确时不更新
+def test_last_score_wins(school):
+    c, submissions = school['conn'].cursor(), school['submissions']
+    report = apply_scores(c, [(submissions['s1'], '优秀'), (submissions['s1'], '合格'),
+                              (submissions['s2'], '优秀'), (submissions['s2'], '')], 99, 'c1')
+    assert report['updated'] == [(submissions['s1'], '合格')]
+    assert _scores(c) == {submissions['s1']: '合格', submissions['s2']: None, submissions['s3']: None}
+
+
+@pytest.mark.parametrize('item', [{'id': True, 'score': '优秀'}, {'id': '1', 'score': '优秀'},
+                                  {'id': 1.0, 'score': '优秀'}, {'score': '优秀'}, [1, '优秀']])
+def test_json_rejects_non_int_ids(item):
+    with pytest.raises(GradingError):
+        scores_from_json({'scores': [item]})
+
+
+def test_json_and_form_formats():
+    assert scores_from_json({'scores': [{'id': 3, 'score': '优秀'}]}) == [(3, '优秀')]
+    with pytest.raises(GradingError):
+        scores_from_json([{'id': 3, 'score': '优秀'}])
+    assert scores_from_form({'score-3': '优秀', 'score-4': '', 'other': 'x'}) == [(3, '优秀')]
+    with pytest.raises(GradingError):
+        scores_from_form({'score-x': '优秀'})
+
+
+# 没有分配小组的组长不能评分，否则评分范围会变成整个班级
+def test_leader_without_group_denied(school, monkeypatch):
+    from app import app
+    monkeypatch.setattr(db, '_pool', db.ConnectionPool(database=school['database']))
+    monkeypatch.setitem(app.config, 'TESTING', True)
+    invalidate_identity()
+
+    client = app.test_client()
+    response = client.post('/login', data={'name': 'nogroup', 'class_id': 'c1', 'credential': '12345678'})
+    assert response.headers['Location'].endswith('/student/dashboard')
+    submissions = school['submissions']
+    response = client.post('/student/score_group_submissions', json={'scores': [{'id': submissions['s1'], 'score': '优秀'}]})
+    assert response.status_code == 302
+    response = client.post(f"/student/score_group_submission/{submissions['s2']}", data={'score': '优秀'})
+    assert response.status_code == 302
+    assert set(_scores(school['conn'].cursor()).values()) == {None}
+
+    # 有小组的组长可以评同组同学
+    leader = app.test_client()
+    leader.post('/login', data={'name': 'leader', 'class_id': 'c1', 'credential': '12345678'})
+    response = leader.post('/student/score_group_submissions', json={'scores': [{'id': submissions['s1'], 'score': '优秀'}]})
+    assert response.get_json()['updated'] == [{'id': submissions['s1'], 'score': '优秀'}]
+    invalidate_identity()
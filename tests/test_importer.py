@@ -0,0 +1,113 @@
+import codecs
+import io
+import os
+import sqlite3
+import pytest
+from app.utils.db import init_db
+from app.utils.importer import CSVImportError, detect_encoding, import_students, iter_text_lines
+
+
+@pytest.fixture
+def conn(tmp_path):
+    upload_folder = str(tmp_path / 'uploads')
+    os.makedirs(upload_folder)
+    database = str(tmp_path / 'todo.db')
+    init_db(database, 'default', upload_folder)
+    conn = sqlite3.connect(database)
+    yield conn
+    conn.close()
+
+
+def _students(c):
+    c.execute("SELECT name, class_id, group_id, id_card_last8 FROM users WHERE role = 'student' ORDER BY id")
+    return c.fetchall()
+
+
+@pytest.mark.parametrize('head, encoding', [
+    ('张伟,111'.encode('utf-8'), 'utf-8'),
+    (codecs.BOM_UTF8 + '张伟'.encode('utf-8'), 'utf-8-sig'),
+    ('姓名'.encode('utf-16'), 'utf-16'),
+    ('张伟,111'.encode('gbk'), 'gb18030'),
+    (b'name,class', 'utf-8'),
+    # 块的末尾截断了一个 UTF-8 字符
+    ('张伟'.encode('utf-8')[:-1], 'utf-8'),
+])
+def test_detect_encoding(head, encoding):
+    assert detect_encoding(head) == encoding
+
+
+# 小块读取时，跨块的多字节字符和换行都能正确拼接
+@pytest.mark.parametrize('encoding', ['utf-8', 'gbk', 'utf-8-sig'])
+def test_iter_text_lines_small_chunks(encoding):
+    text = '姓名,班级\n张伟,111\n李娜,111'
+    lines = list(iter_text_lines(io.BytesIO(text.encode(encoding)), chunk_size=3))
+    assert lines == ['姓名,班级\n', '张伟,111\n', '李娜,111']
+
+
+def test_undecodable_file():
+    # 开头是 UTF-8，后面的块出现 GBK 字符
+    data = 'a,b\n'.encode('utf-8') * 10 + '张伟'.encode('gbk')
+    with pytest.raises(CSVImportError):
+        list(iter_text_lines(io.BytesIO(data), chunk_size=8))
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-8-sig', 'gbk'])
+def test_import_with_header(conn, encoding):
+    data = '姓名,班级,小组,身份证后8位\n张伟,111,1,11111111\n李娜,111,,22222222\n'.encode(encoding)
+    report = import_students(conn.cursor(), io.BytesIO(data))
+    assert report == {'inserted': 2, 'updated': 0, 'unchanged': 0, 'rejected': []}
+    assert _students(conn.cursor()) == [('张伟', '111', 1, '11111111'), ('李娜', '111', None, '22222222')]
+
+
+# 只跳过第一行的表头
+def test_header_only_on_first_line(conn):
+    data = 'name,class,group,id\n张伟,111,1,11111111\nname,111,1,33333333\n'.encode()
+    report = import_students(conn.cursor(), io.BytesIO(data))
+    assert report['inserted'] == 2
+    assert [row[0] for row in _students(conn.cursor())] == ['张伟', 'name']
+
+
+def test_rejected_lines_reported(conn):
+    data = '\n'.join([
+        '张伟,111,1,11111111',
+        '李娜,111,1',
+        ',111,1,22222222',
+        '王芳,,1,33333333',
+        '刘洋,111,一,44444444',
+        '陈静,111,1,123',
+        '',
+        '"杨\n帆",111,2,55555555',
+        '赵磊,111,2,66666666',
+    ]).encode()
+    report = import_students(conn.cursor(), io.BytesIO(data))
+    assert report['inserted'] == 3
+    assert [line for line, _ in report['rejected']] == [2, 3, 4, 5, 6]
+    assert report['rejected'][0][1] == '列数不足，应为：姓名,班级,小组,身份证后8位'
+    assert report['rejected'][3][1] == '小组必须是数字：一'
+    assert [row[0] for row in _students(conn.cursor())] == ['张伟', '杨\n帆', '赵磊']
+
+
+# 同一班级中姓名和身份证后8位相同的学生更新小组，不重复新增
+def test_upsert_by_name_and_id_card(conn):
+    c = conn.cursor()
+    import_students(c, io.BytesIO('张伟,111,1,11111111\n李娜,111,1,22222222\n张伟,222,1,11111111\n'.encode()))
+    data = '张伟,111,2,11111111\n李娜,111,1,22222222\n王芳,111,3,33333333\n王芳,111,4,33333333\n'.encode()
+    report = import_students(c, io.BytesIO(data), batch_size=1)
+    assert report == {'inserted': 1, 'updated': 2, 'unchanged': 1, 'rejected': []}
+    assert _students(c) == [('张伟', '111', 2, '11111111'), ('李娜', '111', 1, '22222222'),
+                            ('张伟', '222', 1, '11111111'), ('王芳', '111', 4, '33333333')]
+
+
+# 教师导入时所有学生都导入本班，忽略文件中的班级列
+def test_import_into_class(conn):
+    c = conn.cursor()
+    report = import_students(c, io.BytesIO('张伟,999,1,11111111\n李娜,,1,22222222\n'.encode()), class_id='111')
+    assert report['inserted'] == 2
+    assert {row[1] for row in _students(c)} == {'111'}
+
+
+def test_progress_reported_per_batch(conn):
+    lines = ''.join(f'学生{i},111,1,{i:08d}\n' for i in range(5)).encode()
+    calls = []
+    import_students(conn.cursor(), io.BytesIO(lines), batch_size=2, progress=calls.append)
+    assert calls == [2, 4, 5]